@@ -0,0 +1,139 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from document_ai_agents.embedding_registry import get_embedding_registry
+
+
+class AnswerCacheOptions(BaseModel):
+    similarity_threshold: float = Field(
+        0.95,
+        ge=-1,
+        le=1,
+        description="Minimum cosine similarity between two questions for one to "
+        "reuse the answer of the other.",
+    )
+    ttl_seconds: Optional[float] = Field(
+        24 * 3600, description="Age after which answers expire, never if not set."
+    )
+    max_entries: int = Field(10_000, gt=0)
+
+
+def make_context_key(*parts) -> str:
+    """
+    Identifies what an answer depends on besides the question: the model, the
+    prompt and a fingerprint of the document content.
+    """
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+class CachedAnswer(BaseModel):
+    question: str
+    value: Any
+    created_at: float
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by context and matched by question embedding similarity, so a
+    repeated or paraphrased question about the same content is answered without a
+    model call. Entries expire after `ttl_seconds` and the least recently used ones
+    are evicted beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        options: Optional[AnswerCacheOptions] = None,
+        embedding_function: Optional[Callable[[list[str]], list]] = None,
+    ):
+        self.options = options or AnswerCacheOptions()
+        self.embedding_function = embedding_function or get_embedding_registry().get()
+        self._lock = threading.Lock()
+        # (context key, entry number) -> entry, least recently used first
+        self._entries: OrderedDict[tuple[str, int], CachedAnswer] = OrderedDict()
+        self._vectors: dict[tuple[str, int], np.ndarray] = {}
+        self._keys_by_context: dict[str, list[tuple[str, int]]] = {}
+        self._question_vectors: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._next_entry = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def embed(self, question: str) -> np.ndarray:
+        # The question of a miss is embedded once for the lookup and the store
+        with self._lock:
+            vector = self._question_vectors.get(question)
+        if vector is None:
+            vector = np.asarray(self.embedding_function([question])[0], np.float32)
+            vector /= max(np.linalg.norm(vector), 1e-12)
+            with self._lock:
+                self._question_vectors[question] = vector
+                while len(self._question_vectors) > 1_024:
+                    self._question_vectors.popitem(last=False)
+        return vector
+
+    def _remove(self, key: tuple[str, int]):
+        del self._entries[key]
+        del self._vectors[key]
+        context_keys = self._keys_by_context[key[0]]
+        context_keys.remove(key)
+        if not context_keys:
+            del self._keys_by_context[key[0]]
+
+    def lookup(self, context_key: str, question: str) -> Optional[Any]:
+        vector = self.embed(question)
+        now = time.time()
+        with self._lock:
+            keys = list(self._keys_by_context.get(context_key, []))
+            if self.options.ttl_seconds is not None:
+                for key in keys:
+                    if now - self._entries[key].created_at > self.options.ttl_seconds:
+                        self._remove(key)
+                        self.stats["expirations"] += 1
+                keys = self._keys_by_context.get(context_key, [])
+
+            best_key = None
+            if keys:
+                similarities = np.stack([self._vectors[key] for key in keys]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.options.similarity_threshold:
+                    best_key = keys[best]
+
+            if best_key is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key].value
+
+    def store(self, context_key: str, question: str, value: Any):
+        vector = self.embed(question)
+        with self._lock:
+            key = (context_key, self._next_entry)
+            self._next_entry += 1
+            self._entries[key] = CachedAnswer(
+                question=question, value=value, created_at=time.time()
+            )
+            self._vectors[key] = vector
+            self._keys_by_context.setdefault(context_key, []).append(key)
+            while len(self._entries) > self.options.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+            self._keys_by_context.clear()
@@ -0,0 +1,82 @@
+from typing import Callable, Optional
+
+from langchain_core.documents import Document
+from pydantic import BaseModel, Field
+
+from document_ai_agents.logger import logger
+from document_ai_agents.rate_limiter import IMAGE_TOKENS, estimate_request_tokens
+
+
+class ContextBudgetOptions(BaseModel):
+    max_tokens: int = Field(
+        4_000, gt=0, description="Estimated input tokens of the whole request."
+    )
+    max_image_bytes: Optional[int] = Field(
+        None,
+        description="Total size of the attached page images, unbounded if not set.",
+    )
+    image_element_types: list[str] = Field(
+        default_factory=lambda: ["Table", "Figure", "Image"],
+        description="Elements whose page image is attached. The text summary of "
+        "other elements is sent alone.",
+    )
+
+
+class PackedContext(BaseModel):
+    documents: list[Document] = Field(default_factory=list)
+    page_keys: list[str] = Field(default_factory=list)
+    estimated_tokens: int = 0
+    image_bytes: int = 0
+    dropped_documents: list[Document] = Field(default_factory=list)
+    dropped_page_keys: list[str] = Field(default_factory=list)
+
+
+def pack_context(
+    documents: list[Document],
+    page_key_of: Callable[[Document], Optional[str]],
+    page_size: Callable[[str], int],
+    options: ContextBudgetOptions,
+    reserved_tokens: int = 0,
+) -> PackedContext:
+    """
+    Fills the token budget with the documents in the given order, most relevant
+    first. Each document adds its text, and tables and figures also add their page
+    image, each page once. Whatever does not fit what is left of the budget is
+    skipped, so a large item does not block smaller, less relevant ones.
+    """
+    packed = PackedContext(estimated_tokens=reserved_tokens)
+    for document in documents:
+        text_tokens = estimate_request_tokens(text_chars=len(document.page_content))
+        if packed.estimated_tokens + text_tokens <= options.max_tokens:
+            packed.documents.append(document)
+            packed.estimated_tokens += text_tokens
+        else:
+            packed.dropped_documents.append(document)
+
+        page_key = page_key_of(document)
+        if (
+            page_key is None
+            or document.metadata.get("element_type") not in options.image_element_types
+            or page_key in packed.page_keys
+            or page_key in packed.dropped_page_keys
+        ):
+            continue
+        size = page_size(page_key)
+        if packed.estimated_tokens + IMAGE_TOKENS <= options.max_tokens and (
+            options.max_image_bytes is None
+            or packed.image_bytes + size <= options.max_image_bytes
+        ):
+            packed.page_keys.append(page_key)
+            packed.estimated_tokens += IMAGE_TOKENS
+            packed.image_bytes += size
+        else:
+            packed.dropped_page_keys.append(page_key)
+
+    if packed.dropped_documents or packed.dropped_page_keys:
+        logger.info(
+            f"Context budget of {options.max_tokens} tokens: dropped "
+            f"{len(packed.dropped_documents)} text elements "
+            f"{[doc.metadata.get('page_number') for doc in packed.dropped_documents]}"
+            f" and {len(packed.dropped_page_keys)} page images"
+        )
+    return packed
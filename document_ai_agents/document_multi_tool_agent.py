@@ -1,9 +1,11 @@
+import asyncio
 from operator import add
 from typing import Annotated, Callable
 
 import google.generativeai as genai
 from google.api_core import retry
 from google.generativeai.types import RequestOptions
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, START, StateGraph
 from pydantic import BaseModel, Field
 
@@ -38,6 +40,12 @@ class ToolCallAgent:
         self.graph = None
         self.build_agent()
 
+    @staticmethod
+    def response_message(response) -> dict:
+        return type(response.candidates[0].content).to_dict(
+            response.candidates[0].content
+        )
+
     def call_llm(self, state: AgentState):
         response = self.model.generate_content(
             state.messages,
@@ -46,35 +54,56 @@ class ToolCallAgent:
             ),
         )
 
-        return {
-            "messages": [
-                type(response.candidates[0].content).to_dict(
-                    response.candidates[0].content
+        return {"messages": [self.response_message(response)]}
+
+    async def acall_llm(self, state: AgentState):
+        response = await self.model.generate_content_async(
+            state.messages,
+            request_options=RequestOptions(
+                retry=retry.AsyncRetry(
+                    initial=10, multiplier=2, maximum=60, timeout=300
                 )
-            ]
+            ),
+        )
+
+        return {"messages": [self.response_message(response)]}
+
+    def call_tool(self, function_call: dict) -> dict:
+        name = function_call["name"]
+        func = self.tool_mapping[name]
+        result = func(**function_call["args"])
+        return {
+            "function_response": {
+                "name": name,
+                "response": result.model_dump(mode="json"),
+            }
         }
 
     def use_tool(self, state: AgentState):
         assert any("function_call" in part for part in state.messages[-1]["parts"])
 
-        tool_result_parts = []
-
-        for part in state.messages[-1]["parts"]:
-            if "function_call" in part:
-                name = part["function_call"]["name"]
-                func = self.tool_mapping[name]
-                result = func(**part["function_call"]["args"])
-                tool_result_parts.append(
-                    {
-                        "function_response": {
-                            "name": name,
-                            "response": result.model_dump(mode="json"),
-                        }
-                    }
-                )
+        tool_result_parts = [
+            self.call_tool(part["function_call"])
+            for part in state.messages[-1]["parts"]
+            if "function_call" in part
+        ]
 
         return {"messages": [{"role": "tool", "parts": tool_result_parts}]}
 
+    async def ause_tool(self, state: AgentState):
+        assert any("function_call" in part for part in state.messages[-1]["parts"])
+
+        # Tools are blocking HTTP calls, they run concurrently in worker threads
+        tool_result_parts = await asyncio.gather(
+            *[
+                asyncio.to_thread(self.call_tool, part["function_call"])
+                for part in state.messages[-1]["parts"]
+                if "function_call" in part
+            ]
+        )
+
+        return {"messages": [{"role": "tool", "parts": list(tool_result_parts)}]}
+
     @staticmethod
     def should_we_stop(state: AgentState) -> str:
         logger.debug(
@@ -89,8 +118,12 @@ class ToolCallAgent:
 
     def build_agent(self):
         builder = StateGraph(AgentState)
-        builder.add_node("call_llm", self.call_llm)
-        builder.add_node("use_tool", self.use_tool)
+        builder.add_node(
+            "call_llm", RunnableLambda(self.call_llm, afunc=self.acall_llm)
+        )
+        builder.add_node(
+            "use_tool", RunnableLambda(self.use_tool, afunc=self.ause_tool)
+        )
 
         builder.add_edge(START, "call_llm")
         builder.add_conditional_edges("call_llm", self.should_we_stop)
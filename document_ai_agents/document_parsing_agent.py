@@ -1,17 +1,53 @@
+import asyncio
 import json
 import operator
+from collections import defaultdict
 from pathlib import Path
-from typing import Annotated, Literal
+from typing import Annotated, AsyncIterator, Iterator, Literal, Optional, Union
 
 import google.generativeai as genai
+import numpy as np
 from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, START, StateGraph
 from langgraph.types import Send
 from pydantic import BaseModel, Field
 
-from document_ai_agents.document_utils import extract_images_from_pdf
-from document_ai_agents.image_utils import pil_image_to_base64_jpeg
+from document_ai_agents.document_utils import (
+    PageTextLayer,
+    RenderOptions,
+    analyze_pdf_text_layers,
+    fingerprint_pdf_pages,
+    resolve_page_numbers,
+    split_text_into_blocks,
+)
+from document_ai_agents.image_utils import (
+    JpegEncodingOptions,
+    normalize_bounding_box,
+    summarize_encoded_sizes,
+)
+from document_ai_agents.layout_cache import LayoutResultCache
 from document_ai_agents.logger import logger
+from document_ai_agents.page_cache import PageImageCache, iter_pdf_pages_as_jpeg
+from document_ai_agents.page_filters import (
+    PageFilterOptions,
+    find_blank_pages,
+    find_duplicate_pages,
+    jpeg_to_thumbnail,
+)
+from document_ai_agents.page_manifest import (
+    DocumentManifest,
+    ManifestStore,
+    PageRecord,
+    diff_pages,
+    manifest_deltas,
+)
+from document_ai_agents.page_store import PageStore, get_default_page_store
+from document_ai_agents.rate_limiter import (
+    RATE_LIMIT_ERRORS,
+    RequestScheduler,
+    estimate_request_tokens,
+)
 from document_ai_agents.schema_utils import prepare_schema_for_gemini
 
 
@@ -22,26 +58,183 @@ class DetectedLayoutItem(BaseModel):
         "be as exhaustive as possible. Return 10 Items at most.",
     )
     summary: str = Field(..., description="A detailed description of the layout Item.")
+    bounding_box: list[float] = Field(
+        default_factory=list,
+        description="[ymin, xmin, ymax, xmax] of the layout Item, as fractions of the "
+        "page height and width between 0 and 1.",
+    )
 
 
 class LayoutElements(BaseModel):
     layout_items: list[DetectedLayoutItem] = Field(default_factory=list)
 
 
+class PageLayoutElements(BaseModel):
+    page_index: int = Field(
+        ..., description="Index of the page in the request, starting at 0."
+    )
+    layout_items: list[DetectedLayoutItem] = Field(default_factory=list)
+
+
+class BatchLayoutElements(BaseModel):
+    pages: list[PageLayoutElements] = Field(default_factory=list)
+
+
+LAYOUT_PROMPT = (
+    f"Find and summarize all the relevant layout elements in this pdf page in the following format: "
+    f"{LayoutElements.model_json_schema()}. "
+    f"Tables should have at least two columns and at least two rows. "
+    f"The coordinates should overlap with each layout item."
+)
+BATCH_LAYOUT_PROMPT = (
+    f"For each page, find and summarize all the relevant layout elements. "
+    f"Return one entry per page index in the following format: "
+    f"{BatchLayoutElements.model_json_schema()}. "
+    f"Tables should have at least two columns and at least two rows. "
+    f"The coordinates should overlap with each layout item."
+)
+
+LAYOUT_REQUEST_TOKENS = estimate_request_tokens(
+    text_chars=len(LAYOUT_PROMPT), n_images=1, max_output_tokens=1024
+)
+LAYOUT_RETRY_ERRORS = RATE_LIMIT_ERRORS + (json.JSONDecodeError, KeyError)
+
+
+class TextLayerOptions(BaseModel):
+    min_usable_chars: int = Field(
+        400, description="Pages with less text are treated as scanned."
+    )
+    min_usable_ratio: float = Field(
+        0.95, description="Pages with more garbled text are treated as scanned."
+    )
+    max_numeric_rows: int = Field(
+        2, description="Pages with more number-heavy lines likely contain a table."
+    )
+    max_block_chars: int = 1500
+
+
 class DocumentLayoutParsingState(BaseModel):
     document_path: str
-    pages_as_base64_jpeg_images: list[str] = Field(default_factory=list)
+    render_options: Optional[RenderOptions] = None
+    page_fingerprints: dict[int, str] = Field(default_factory=dict)
+    reused_page_numbers: list[int] = Field(
+        default_factory=list,
+        description="Pages whose content was parsed in a previous version.",
+    )
+    vision_page_numbers: Optional[list[int]] = Field(
+        None,
+        description="Pages that need a vision call, all rendered pages when not set.",
+    )
+    text_layer_page_numbers: list[int] = Field(default_factory=list)
+    page_keys: list[str] = Field(
+        default_factory=list, description="Page store keys of the rendered pages."
+    )
+    page_numbers: list[int] = Field(default_factory=list)
+    page_image_bytes: list[int] = Field(
+        default_factory=list, description="Encoded JPEG size of each rendered page."
+    )
+    blank_page_numbers: list[int] = Field(
+        default_factory=list, description="Pages skipped because they are blank."
+    )
+    duplicate_page_numbers: dict[int, int] = Field(
+        default_factory=dict,
+        description="Pages that reuse the layout items of an earlier identical page.",
+    )
     documents: Annotated[list[Document], operator.add] = Field(default_factory=list)
+    failed_page_numbers: Annotated[list[int], operator.add] = Field(
+        default_factory=list,
+        description="Pages whose layout could not be parsed after all retries.",
+    )
+    added_documents: Optional[list[Document]] = Field(
+        None,
+        description="Documents new to this version of the file, only set in "
+        "incremental mode.",
+    )
+    removed_documents: list[Document] = Field(
+        default_factory=list,
+        description="Documents of the previous version that are no longer valid.",
+    )
+    manifest: Optional[DocumentManifest] = Field(
+        None,
+        description="Manifest of this version, saved by `commit_manifest` once its "
+        "deltas are indexed. Only set in incremental mode.",
+    )
 
 
 class FindLayoutItemsInput(BaseModel):
     document_path: str
-    base64_jpeg: str
+    page_key: str
     page_number: int
 
 
+class FindBatchLayoutItemsInput(BaseModel):
+    document_path: str
+    page_keys: list[str]
+    page_numbers: list[int]
+
+
+class BatchRequest(BaseModel):
+    cache_keys: list[Optional[str]]
+    uncached_indices: list[int]
+    messages: list
+    estimated_tokens: int
+    layout_items_by_index: dict[int, list[dict]] = Field(
+        default_factory=dict,
+        description="Layout items of each page of the batch, by position in the batch.",
+    )
+    n_cached: int = 0
+
+
+class DocumentStream:
+    """
+    Iterates over the documents of a parsing run as the graph nodes producing them
+    complete, so each page's documents arrive as soon as its model call returns.
+    Supports both `for` and `async for` depending on the graph stream it wraps.
+    `state` holds the latest graph values, the final ones once exhausted.
+    """
+
+    def __init__(self, chunks: Union[Iterator, AsyncIterator]):
+        self._chunks = chunks
+        self.state: dict = {}
+
+    def _read(self, mode: str, chunk: dict) -> list[Document]:
+        if mode == "values":
+            self.state = chunk
+            return []
+        return [
+            document
+            for update in chunk.values()
+            if update
+            for document in update.get("documents", [])
+        ]
+
+    def __iter__(self) -> Iterator[list[Document]]:
+        for mode, chunk in self._chunks:
+            if documents := self._read(mode, chunk):
+                yield documents
+
+    async def __aiter__(self) -> AsyncIterator[list[Document]]:
+        async for mode, chunk in self._chunks:
+            if documents := self._read(mode, chunk):
+                yield documents
+
+
 class DocumentParsingAgent:
-    def __init__(self, model_name="gemini-1.5-flash-002"):
+    def __init__(
+        self,
+        model_name="gemini-1.5-flash-002",
+        render_options: Optional[RenderOptions] = None,
+        page_cache: Optional[PageImageCache] = None,
+        encoding_options: Optional[JpegEncodingOptions] = None,
+        text_layer_options: Optional[TextLayerOptions] = None,
+        page_store: Optional[PageStore] = None,
+        page_filter_options: Optional[PageFilterOptions] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        pages_per_request: int = 1,
+        layout_cache: Optional[LayoutResultCache] = None,
+        manifest_store: Optional[ManifestStore] = None,
+    ):
+        assert pages_per_request > 0, "pages_per_request should be positive"
         layout_elements_schema = prepare_schema_for_gemini(LayoutElements)
 
         logger.info(f"Using Gemini model with schema: {layout_elements_schema}")
@@ -53,73 +246,672 @@ class DocumentParsingAgent:
                 "response_schema": layout_elements_schema,
             },
         )
+        self.pages_per_request = pages_per_request
+        self.batch_model = genai.GenerativeModel(
+            self.model_name,
+            generation_config={
+                "response_mime_type": "application/json",
+                "response_schema": prepare_schema_for_gemini(BatchLayoutElements),
+            },
+        )
+        self.render_options = render_options or RenderOptions()
+        self.page_cache = page_cache
+        self.encoding_options = encoding_options or JpegEncodingOptions()
+        # Text-layer routing is disabled when no options are given
+        self.text_layer_options = text_layer_options
+        self.page_store = (
+            page_store if page_store is not None else get_default_page_store()
+        )
+        # Blank and duplicate page filtering is disabled when no options are given
+        self.page_filter_options = page_filter_options
+        self.scheduler = scheduler or RequestScheduler()
+        self.layout_cache = layout_cache
+        # Incremental parsing is disabled when no manifest store is given
+        self.manifest_store = manifest_store
         self.graph = None
         self.build_agent()
 
-    @classmethod
-    def get_images(cls, state: DocumentLayoutParsingState):
+    def is_text_rich(self, page: PageTextLayer) -> bool:
+        return (
+            page.n_usable_chars >= self.text_layer_options.min_usable_chars
+            and page.usable_ratio >= self.text_layer_options.min_usable_ratio
+            and page.n_images == 0
+            and page.n_numeric_rows <= self.text_layer_options.max_numeric_rows
+            and not page.has_table_or_figure_caption
+        )
+
+    def find_changed_pages(self, state: DocumentLayoutParsingState):
+        assert Path(state.document_path).is_file(), "File does not exist"
+
+        if self.manifest_store is None:
+            return
+
+        render_options = state.render_options or self.render_options
+        page_numbers = resolve_page_numbers(
+            state.document_path, render_options.page_numbers
+        )
+        fingerprints = fingerprint_pdf_pages(state.document_path, page_numbers)
+        diff = diff_pages(fingerprints, self.manifest_store.load(state.document_path))
+
+        logger.info(
+            f"{len(diff.changed_page_numbers)}/{len(page_numbers)} pages are new or "
+            f"changed since the previous version."
+        )
+
+        update = {
+            "page_fingerprints": fingerprints,
+            "reused_page_numbers": sorted(diff.reused_pages),
+            "render_options": render_options.model_copy(
+                update={"page_numbers": diff.changed_page_numbers}
+            ),
+        }
+        if not diff.changed_page_numbers:
+            update["vision_page_numbers"] = []
+        return update
+
+    def route_pages(self, state: DocumentLayoutParsingState):
         assert Path(state.document_path).is_file(), "File does not exist"
 
-        images = extract_images_from_pdf(state.document_path)
+        if self.text_layer_options is None:
+            return
 
-        assert images, "No images extracted"
+        render_options = state.render_options or self.render_options
+        page_numbers = resolve_page_numbers(
+            state.document_path, render_options.page_numbers
+        )
+        text_layers = analyze_pdf_text_layers(state.document_path, page_numbers)
+        text_rich_pages = [page for page in text_layers if self.is_text_rich(page)]
 
-        pages_as_base64_jpeg_images = [pil_image_to_base64_jpeg(x) for x in images]
+        documents = [
+            Document(
+                page_content=block,
+                metadata={
+                    "page_number": page.page_number,
+                    "element_type": "Text-block",
+                    "document_path": state.document_path,
+                    "extraction_method": "text_layer",
+                },
+            )
+            for page in text_rich_pages
+            for block in split_text_into_blocks(
+                page.text, max_chars=self.text_layer_options.max_block_chars
+            )
+        ]
+        text_layer_page_numbers = [page.page_number for page in text_rich_pages]
+        vision_page_numbers = sorted(set(page_numbers) - set(text_layer_page_numbers))
 
-        return {"pages_as_base64_jpeg_images": pages_as_base64_jpeg_images}
+        logger.info(
+            f"Using the text layer for {len(text_layer_page_numbers)}/"
+            f"{len(page_numbers)} pages, the others need a vision call."
+        )
+
+        return {
+            "documents": documents,
+            "text_layer_page_numbers": text_layer_page_numbers,
+            "vision_page_numbers": vision_page_numbers,
+        }
+
+    def get_images(self, state: DocumentLayoutParsingState):
+        assert Path(state.document_path).is_file(), "File does not exist"
+
+        render_options = state.render_options or self.render_options
+        if state.vision_page_numbers is not None:
+            if not state.vision_page_numbers:
+                logger.info("All pages were parsed from the text layer.")
+                return {
+                    "page_keys": [],
+                    "page_numbers": [],
+                    "page_image_bytes": [],
+                }
+            render_options = render_options.model_copy(
+                update={"page_numbers": state.vision_page_numbers}
+            )
+
+        # Pages are encoded as soon as they are rendered, so the full resolution
+        # bitmaps of the whole document are never held in memory at the same time.
+        page_numbers = []
+        page_keys = []
+        page_image_bytes = []
+        for page_number, jpeg_bytes in iter_pdf_pages_as_jpeg(
+            state.document_path,
+            render_options,
+            cache=self.page_cache,
+            encoding_options=self.encoding_options,
+        ):
+            page_numbers.append(page_number)
+            page_keys.append(self.page_store.put(jpeg_bytes))
+            page_image_bytes.append(len(jpeg_bytes))
+
+        assert page_keys, "No images extracted"
+
+        logger.info(f"Page image sizes: {summarize_encoded_sizes(page_image_bytes)}")
+
+        return {
+            "page_keys": page_keys,
+            "page_numbers": page_numbers,
+            "page_image_bytes": page_image_bytes,
+        }
+
+    def filter_pages(self, state: DocumentLayoutParsingState):
+        if self.page_filter_options is None or not state.page_keys:
+            return
+
+        options = self.page_filter_options
+        page_numbers = state.page_numbers or list(range(len(state.page_keys)))
+        # Pages missing from the store are left to fail in find_layout_items
+        stored = [i for i, key in enumerate(state.page_keys) if key in self.page_store]
+        if not stored:
+            return
+        page_numbers = [page_numbers[i] for i in stored]
+        thumbnails = np.stack(
+            [jpeg_to_thumbnail(self.page_store.get(state.page_keys[i])) for i in stored]
+        )
+
+        is_blank = find_blank_pages(
+            thumbnails,
+            ink_threshold=options.ink_threshold,
+            max_ink_ratio=options.max_ink_ratio,
+        )
+        non_blank = np.flatnonzero(~is_blank)
+        duplicates = find_duplicate_pages(
+            thumbnails[non_blank],
+            hash_size=options.hash_size,
+            max_hash_distance=options.max_hash_distance,
+            max_mean_abs_diff=options.max_mean_abs_diff,
+        )
+
+        blank_page_numbers = [page_numbers[i] for i in np.flatnonzero(is_blank)]
+        duplicate_page_numbers = {
+            page_numbers[non_blank[i]]: page_numbers[non_blank[j]]
+            for i, j in duplicates.items()
+        }
+
+        logger.info(
+            f"Skipping {len(blank_page_numbers)} blank pages and reusing layouts for "
+            f"{len(duplicate_page_numbers)} duplicate pages out of {len(page_numbers)}."
+        )
+
+        return {
+            "blank_page_numbers": blank_page_numbers,
+            "duplicate_page_numbers": duplicate_page_numbers,
+        }
+
+    def continue_to_find_layout_items(self, state: DocumentLayoutParsingState):
+        skipped_page_numbers = set(state.blank_page_numbers) | set(
+            state.duplicate_page_numbers
+        )
+        pages = [
+            (page_number, page_key)
+            for page_number, page_key in zip(
+                state.page_numbers or range(len(state.page_keys)),
+                state.page_keys,
+            )
+            if page_number not in skipped_page_numbers
+        ]
+
+        if not pages:
+            return "reuse_duplicate_layouts"
+
+        if self.pages_per_request > 1:
+            batches = [
+                pages[start : start + self.pages_per_request]
+                for start in range(0, len(pages), self.pages_per_request)
+            ]
+            return [
+                Send(
+                    "find_batch_layout_items",
+                    FindBatchLayoutItemsInput(
+                        page_keys=[page_key for _, page_key in batch],
+                        page_numbers=[page_number for page_number, _ in batch],
+                        document_path=state.document_path,
+                    ),
+                )
+                for batch in batches
+            ]
 
-    @classmethod
-    def continue_to_find_layout_items(cls, state: DocumentLayoutParsingState):
         return [
             Send(
                 "find_layout_items",
                 FindLayoutItemsInput(
-                    base64_jpeg=base64_jpeg,
-                    page_number=i,
+                    page_key=page_key,
+                    page_number=page_number,
                     document_path=state.document_path,
                 ),
             )
-            for i, base64_jpeg in enumerate(state.pages_as_base64_jpeg_images)
+            for page_number, page_key in pages
         ]
 
-    def find_layout_items(self, state: FindLayoutItemsInput):
+    def layout_cache_key(
+        self, page_key: str, prompt: str, schema: type[BaseModel]
+    ) -> Optional[str]:
+        if self.layout_cache is None:
+            return None
+        return self.layout_cache.make_key(
+            page_key, self.model_name, prompt, schema.model_json_schema()
+        )
+
+    @staticmethod
+    def layout_items_to_documents(
+        layout_items: list[dict], page_number: int, document_path: str
+    ) -> list[Document]:
+        documents = []
+        for x in layout_items:
+            metadata = {
+                "page_number": page_number,
+                "element_type": x["element_type"],
+                "document_path": document_path,
+                "extraction_method": "vision",
+            }
+            # Vector store metadata values are scalars, the box is stored as JSON
+            bounding_box = normalize_bounding_box(x.get("bounding_box"))
+            if bounding_box is not None:
+                metadata["bounding_box"] = json.dumps(bounding_box)
+            documents.append(Document(page_content=x["summary"], metadata=metadata))
+        return documents
+
+    def lookup_layout_items(self, state: FindLayoutItemsInput):
         logger.info(f"Processing page {state.page_number + 1}")
-        messages = [
-            f"Find and summarize all the relevant layout elements in this pdf page in the following format: "
-            f"{LayoutElements.model_json_schema()}. "
-            f"Tables should have at least two columns and at least two rows. "
-            f"The coordinates should overlap with each layout item.",
-            {"mime_type": "image/jpeg", "data": state.base64_jpeg},
+        cache_key = self.layout_cache_key(state.page_key, LAYOUT_PROMPT, LayoutElements)
+        if cache_key is None:
+            return cache_key, None
+        layout_items = self.layout_cache.get(cache_key)
+        if layout_items is None:
+            return cache_key, None
+
+        logger.info(f"Reusing cached layout of page {state.page_number + 1}")
+        return cache_key, {
+            "documents": self.layout_items_to_documents(
+                layout_items, state.page_number, state.document_path
+            )
+        }
+
+    def layout_items_result(
+        self,
+        state: FindLayoutItemsInput,
+        cache_key: Optional[str],
+        layout_items: list[dict],
+    ):
+        if cache_key is not None:
+            self.layout_cache.put(cache_key, layout_items, model_name=self.model_name)
+
+        documents = self.layout_items_to_documents(
+            layout_items, state.page_number, state.document_path
+        )
+
+        logger.info(
+            f"Extracted {len(layout_items)} layout elements from page {state.page_number + 1}."
+        )
+
+        return {"documents": documents}
+
+    def find_layout_items(self, state: FindLayoutItemsInput):
+        cache_key, cached_result = self.lookup_layout_items(state)
+        if cached_result is not None:
+            return cached_result
+
+        def parse_page():
+            result = self.model.generate_content(messages)
+            return json.loads(result.text)["layout_items"]
+
+        # Malformed outputs are retried like rate limits, a single failed page
+        # (including one missing from the page store) is recorded in the state
+        # instead of failing the whole document.
+        try:
+            messages = [LAYOUT_PROMPT, self.page_store.as_part(state.page_key)]
+            layout_items = self.scheduler.run(
+                parse_page,
+                estimated_tokens=LAYOUT_REQUEST_TOKENS,
+                retry_on=LAYOUT_RETRY_ERRORS,
+            )
+        except Exception as e:
+            logger.error(f"Failed to parse page {state.page_number + 1}: {e}")
+            return {"failed_page_numbers": [state.page_number]}
+
+        return self.layout_items_result(state, cache_key, layout_items)
+
+    async def afind_layout_items(self, state: FindLayoutItemsInput):
+        cache_key, cached_result = self.lookup_layout_items(state)
+        if cached_result is not None:
+            return cached_result
+
+        async def parse_page():
+            result = await self.model.generate_content_async(messages)
+            return json.loads(result.text)["layout_items"]
+
+        try:
+            messages = [LAYOUT_PROMPT, self.page_store.as_part(state.page_key)]
+            layout_items = await self.scheduler.arun(
+                parse_page,
+                estimated_tokens=LAYOUT_REQUEST_TOKENS,
+                retry_on=LAYOUT_RETRY_ERRORS,
+            )
+        except Exception as e:
+            logger.error(f"Failed to parse page {state.page_number + 1}: {e}")
+            return {"failed_page_numbers": [state.page_number]}
+
+        return self.layout_items_result(state, cache_key, layout_items)
+
+    def prepare_batch_request(self, state: FindBatchLayoutItemsInput) -> BatchRequest:
+        logger.info(
+            f"Processing pages {[page_number + 1 for page_number in state.page_numbers]}"
+        )
+        cache_keys = [
+            self.layout_cache_key(page_key, BATCH_LAYOUT_PROMPT, BatchLayoutElements)
+            for page_key in state.page_keys
+        ]
+        layout_items_by_index = {}
+        if self.layout_cache is not None:
+            for page_index, cache_key in enumerate(cache_keys):
+                layout_items = self.layout_cache.get(cache_key)
+                if layout_items is not None:
+                    layout_items_by_index[page_index] = layout_items
+        # Indices in the request are positions among the pages that are not cached.
+        # Pages missing from the store are left to the one-page fallback, which
+        # records them as failed.
+        uncached_indices = [
+            page_index
+            for page_index, page_key in enumerate(state.page_keys)
+            if page_index not in layout_items_by_index and page_key in self.page_store
         ]
 
-        result = self.model.generate_content(messages)
-        data = json.loads(result.text)
+        prompt = (
+            f"Each of the following {len(uncached_indices)} pdf pages is preceded by its page index. "
+            f"{BATCH_LAYOUT_PROMPT}"
+        )
+        messages = [prompt]
+        for request_index, page_index in enumerate(uncached_indices):
+            messages += [
+                f"Page index {request_index}:",
+                self.page_store.as_part(state.page_keys[page_index]),
+            ]
+
+        return BatchRequest(
+            cache_keys=cache_keys,
+            uncached_indices=uncached_indices,
+            messages=messages if uncached_indices else [],
+            estimated_tokens=estimate_request_tokens(
+                text_chars=len(prompt),
+                n_images=len(uncached_indices),
+                max_output_tokens=1024 * len(uncached_indices),
+            ),
+            layout_items_by_index=layout_items_by_index,
+            n_cached=len(layout_items_by_index),
+        )
+
+    def read_batch_response(self, request: BatchRequest, text: str):
+        for page in BatchLayoutElements.model_validate_json(text).pages:
+            if not 0 <= page.page_index < len(request.uncached_indices):
+                continue
+            page_index = request.uncached_indices[page.page_index]
+            if page_index in request.layout_items_by_index:
+                continue
+            layout_items = [item.model_dump() for item in page.layout_items]
+            request.layout_items_by_index[page_index] = layout_items
+            if self.layout_cache is not None:
+                self.layout_cache.put(
+                    request.cache_keys[page_index],
+                    layout_items,
+                    model_name=self.model_name,
+                )
+
+    @staticmethod
+    def batch_fallback_inputs(
+        state: FindBatchLayoutItemsInput, request: BatchRequest
+    ) -> list[FindLayoutItemsInput]:
+        return [
+            FindLayoutItemsInput(
+                document_path=state.document_path,
+                page_key=page_key,
+                page_number=page_number,
+            )
+            for page_index, (page_number, page_key) in enumerate(
+                zip(state.page_numbers, state.page_keys)
+            )
+            if page_index not in request.layout_items_by_index
+        ]
+
+    def batch_result(
+        self,
+        state: FindBatchLayoutItemsInput,
+        request: BatchRequest,
+        fallback_results: list[dict],
+    ):
+        fallback_results_by_page = dict(
+            zip(
+                [x.page_number for x in self.batch_fallback_inputs(state, request)],
+                fallback_results,
+            )
+        )
+
+        documents = []
+        failed_page_numbers = []
+        for page_index, page_number in enumerate(state.page_numbers):
+            if page_index in request.layout_items_by_index:
+                documents += self.layout_items_to_documents(
+                    request.layout_items_by_index[page_index],
+                    page_number,
+                    state.document_path,
+                )
+            else:
+                result = fallback_results_by_page[page_number]
+                documents += result.get("documents", [])
+                failed_page_numbers += result.get("failed_page_numbers", [])
+
+        logger.info(
+            f"Extracted {len(documents)} layout elements from {len(state.page_keys)} pages, "
+            f"{request.n_cached} from the cache and "
+            f"{len(fallback_results)} parsed one at a time."
+        )
+
+        return {"documents": documents, "failed_page_numbers": failed_page_numbers}
+
+    def find_batch_layout_items(self, state: FindBatchLayoutItemsInput):
+        """
+        Parses several pages with a single request, sharing the instructions and
+        schema between them. Pages missing from a malformed or incomplete response
+        are parsed again one at a time.
+        """
+        request = self.prepare_batch_request(state)
+        if request.messages:
+            try:
+                result = self.scheduler.run(
+                    lambda: self.batch_model.generate_content(request.messages),
+                    estimated_tokens=request.estimated_tokens,
+                )
+                self.read_batch_response(request, result.text)
+            except Exception as e:
+                logger.warning(
+                    f"Batch request failed, falling back to single pages: {e}"
+                )
+
+        fallback_results = [
+            self.find_layout_items(x)
+            for x in self.batch_fallback_inputs(state, request)
+        ]
+        return self.batch_result(state, request, fallback_results)
+
+    async def afind_batch_layout_items(self, state: FindBatchLayoutItemsInput):
+        request = self.prepare_batch_request(state)
+        if request.messages:
+            try:
+                result = await self.scheduler.arun(
+                    lambda: self.batch_model.generate_content_async(request.messages),
+                    estimated_tokens=request.estimated_tokens,
+                )
+                self.read_batch_response(request, result.text)
+            except Exception as e:
+                logger.warning(
+                    f"Batch request failed, falling back to single pages: {e}"
+                )
+
+        fallback_results = await asyncio.gather(
+            *[
+                self.afind_layout_items(x)
+                for x in self.batch_fallback_inputs(state, request)
+            ]
+        )
+        return self.batch_result(state, request, list(fallback_results))
+
+    @staticmethod
+    def reuse_duplicate_layouts(state: DocumentLayoutParsingState):
+        if not state.duplicate_page_numbers:
+            return
+
+        documents_by_page = defaultdict(list)
+        for document in state.documents:
+            documents_by_page[document.metadata["page_number"]].append(document)
+
         documents = [
             Document(
-                page_content=x["summary"],
+                page_content=document.page_content,
                 metadata={
-                    "page_number": state.page_number,
-                    "element_type": x["element_type"],
-                    "document_path": state.document_path,
+                    **document.metadata,
+                    "page_number": page_number,
+                    "duplicate_of": original_page_number,
                 },
             )
-            for x in data["layout_items"]
+            for page_number, original_page_number in sorted(
+                state.duplicate_page_numbers.items()
+            )
+            for document in documents_by_page[original_page_number]
         ]
+        failed_page_numbers = [
+            page_number
+            for page_number, original_page_number in sorted(
+                state.duplicate_page_numbers.items()
+            )
+            if original_page_number in state.failed_page_numbers
+        ]
+
+        return {"documents": documents, "failed_page_numbers": failed_page_numbers}
+
+    def update_manifest(self, state: DocumentLayoutParsingState):
+        """
+        Builds the manifest of this version and computes the document deltas
+        against the previous one. Reused pages get their previous documents back,
+        relabeled with their current page number. Failed pages are left out of the
+        manifest so the next run retries them.
+
+        The manifest is not saved here: a crash before the deltas are indexed would
+        otherwise make the next run reuse pages that were never indexed.
+        """
+        if self.manifest_store is None:
+            return
+
+        previous = self.manifest_store.load(state.document_path)
+        diff = diff_pages(state.page_fingerprints, previous)
+
+        documents_by_page = defaultdict(list)
+        for document in state.documents:
+            documents_by_page[document.metadata["page_number"]].append(document)
+        page_keys = dict(
+            zip(state.page_numbers or range(len(state.page_keys)), state.page_keys)
+        )
+
+        pages = []
+        reused_documents = []
+        for page_number, fingerprint in sorted(state.page_fingerprints.items()):
+            if page_number in state.failed_page_numbers:
+                continue
+            if page_number in diff.reused_pages:
+                reused_page = diff.reused_pages[page_number]
+                documents = [
+                    Document(
+                        page_content=document.page_content,
+                        metadata={**document.metadata, "page_number": page_number},
+                    )
+                    for document in reused_page.documents
+                ]
+                reused_documents += documents
+                page_key = reused_page.page_key
+            else:
+                documents = documents_by_page[page_number]
+                page_key = page_keys.get(page_number)
+            pages.append(
+                PageRecord(
+                    page_number=page_number,
+                    fingerprint=fingerprint,
+                    page_key=page_key,
+                    documents=documents,
+                )
+            )
+
+        current = DocumentManifest(document_path=state.document_path, pages=pages)
+        added_documents, removed_documents = manifest_deltas(previous, current)
 
         logger.info(
-            f"Extracted {len(data['layout_items'])} layout elements from page {state.page_number + 1}."
+            f"Reused {len(reused_documents)} documents, {len(added_documents)} to add "
+            f"and {len(removed_documents)} to remove."
         )
 
-        return {"documents": documents}
+        # Pages rendered by earlier runs are only available from a persistent store
+        available_pages = [
+            page
+            for page in pages
+            if page.page_key is not None and page.page_key in self.page_store
+        ]
+        return {
+            "documents": reused_documents,
+            "added_documents": added_documents,
+            "removed_documents": removed_documents,
+            "manifest": current,
+            "page_keys": [page.page_key for page in available_pages],
+            "page_numbers": [page.page_number for page in available_pages],
+            "page_image_bytes": [
+                self.page_store.size(page.page_key) for page in available_pages
+            ],
+        }
+
+    def commit_manifest(self, manifest: Optional[DocumentManifest]):
+        """
+        Saves the manifest returned by the graph. Call it once `added_documents`
+        and `removed_documents` are indexed.
+        """
+        if self.manifest_store is not None and manifest is not None:
+            self.manifest_store.save(manifest)
+
+    def stream_documents(self, state: DocumentLayoutParsingState) -> DocumentStream:
+        return DocumentStream(
+            self.graph.stream(state, stream_mode=["updates", "values"])
+        )
+
+    def astream_documents(self, state: DocumentLayoutParsingState) -> DocumentStream:
+        return DocumentStream(
+            self.graph.astream(state, stream_mode=["updates", "values"])
+        )
 
     def build_agent(self):
         builder = StateGraph(DocumentLayoutParsingState)
+        builder.add_node("find_changed_pages", self.find_changed_pages)
+        builder.add_node("route_pages", self.route_pages)
         builder.add_node("get_images", self.get_images)
-        builder.add_node("find_layout_items", self.find_layout_items)
+        builder.add_node("filter_pages", self.filter_pages)
+        # Model calls have native async variants used by `graph.ainvoke`/`astream`,
+        # the other nodes run in a thread pool when the graph is awaited.
+        builder.add_node(
+            "find_layout_items",
+            RunnableLambda(self.find_layout_items, afunc=self.afind_layout_items),
+        )
+        builder.add_node(
+            "find_batch_layout_items",
+            RunnableLambda(
+                self.find_batch_layout_items, afunc=self.afind_batch_layout_items
+            ),
+        )
+        builder.add_node("reuse_duplicate_layouts", self.reuse_duplicate_layouts)
+        builder.add_node("update_manifest", self.update_manifest)
 
-        builder.add_edge(START, "get_images")
-        builder.add_conditional_edges("get_images", self.continue_to_find_layout_items)
-        builder.add_edge("find_layout_items", END)
+        builder.add_edge(START, "find_changed_pages")
+        builder.add_edge("find_changed_pages", "route_pages")
+        builder.add_edge("route_pages", "get_images")
+        builder.add_edge("get_images", "filter_pages")
+        builder.add_conditional_edges(
+            "filter_pages", self.continue_to_find_layout_items
+        )
+        builder.add_edge("find_layout_items", "reuse_duplicate_layouts")
+        builder.add_edge("find_batch_layout_items", "reuse_duplicate_layouts")
+        builder.add_edge("reuse_duplicate_layouts", "update_manifest")
+        builder.add_edge("update_manifest", END)
         self.graph = builder.compile()
 
 
@@ -131,10 +923,10 @@ if __name__ == "__main__":
     agent = DocumentParsingAgent()
 
     result_node1 = agent.get_images(_state)
-    _state.pages_as_base64_jpeg_images = result_node1["pages_as_base64_jpeg_images"]
+    _state.page_keys = result_node1["page_keys"]
     result_node2 = agent.find_layout_items(
         FindLayoutItemsInput(
-            base64_jpeg=result_node1["pages_as_base64_jpeg_images"][0],
+            page_key=result_node1["page_keys"][0],
             page_number=0,
             document_path=str(_state.document_path),
         )
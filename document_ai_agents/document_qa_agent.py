@@ -1,11 +1,17 @@
+import asyncio
 import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Literal, Optional
 
 import google.generativeai as genai
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, START, StateGraph
 from pydantic import BaseModel, Field
 
+from document_ai_agents.answer_cache import SemanticAnswerCache, make_context_key
 from document_ai_agents.logger import logger
+from document_ai_agents.page_store import PageStore, get_default_page_store
 from document_ai_agents.schema_utils import prepare_schema_for_gemini
 
 
@@ -40,71 +46,205 @@ class VerificationChainOfThoughts(BaseModel):
     )
 
 
+class FusedAnswerVerification(AnswerChainOfThoughts):
+    declarative_answer: str = Field(
+        ...,
+        description="The question and your answer reformulated as a single "
+        "assertion. 'N/A' if answer is not found",
+    )
+    entailment: Literal["Yes", "No"] = Field(
+        ...,
+        description="Answer 'Yes' if the relevant context entails the assertion "
+        "and 'No' otherwise",
+    )
+
+
+class VerificationOptions(BaseModel):
+    mode: Literal["sequential", "fused", "early_exit", "background"] = Field(
+        "sequential",
+        description="'sequential' reformulates and verifies the answer with two "
+        "more calls. 'fused' gets the answer, the assertion and the entailment from "
+        "a single call. 'early_exit' is sequential but does not verify 'N/A' "
+        "answers and short contexts. 'background' ends the graph with the answer, "
+        "`invoke_with_verification` then verifies it in a worker thread.",
+    )
+    min_context_chars: int = Field(
+        500,
+        ge=0,
+        description="In 'early_exit' mode, text-only contexts shorter than this "
+        "are not verified.",
+    )
+    max_workers: int = Field(
+        4, gt=0, description="Threads verifying answers in 'background' mode."
+    )
+
+
 class DocumentQAState(BaseModel):
     question: str
-    pages_as_base64_jpeg_images: list[str] = Field(..., default_factory=list)
+    page_keys: list[str] = Field(..., default_factory=list)
     pages_as_text: list[str] = Field(..., default_factory=list)
     answer_cot: Optional[AnswerChainOfThoughts] = None
     answer_reformulation: Optional[AnswerReformulation] = None
     verification_cot: Optional[VerificationChainOfThoughts] = None
+    answer_cached: bool = Field(
+        False, description="The answer comes from the answer cache."
+    )
+    stage_latencies: dict[str, float] = Field(
+        default_factory=dict, description="Seconds spent in each stage."
+    )
 
 
 class DocumentQAAgent:
-    def __init__(self, model_name="gemini-1.5-flash-8b"):
+    def __init__(
+        self,
+        model_name="gemini-1.5-flash-8b",
+        page_store: Optional[PageStore] = None,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        verification_options: Optional[VerificationOptions] = None,
+    ):
         self.answer_cot_schema = prepare_schema_for_gemini(AnswerChainOfThoughts)
         self.declarative_answer_schema = prepare_schema_for_gemini(AnswerReformulation)
         self.verification_cot_schema = prepare_schema_for_gemini(
             VerificationChainOfThoughts
         )
+        self.fused_answer_schema = prepare_schema_for_gemini(FusedAnswerVerification)
         self.model_name = model_name
         self.model = genai.GenerativeModel(
             self.model_name,
         )
+        self.page_store = (
+            page_store if page_store is not None else get_default_page_store()
+        )
+        self.answer_cache = answer_cache
+        self.verification_options = verification_options or VerificationOptions()
+        self._verification_executor: Optional[ThreadPoolExecutor] = None
 
         self.graph = None
         self.build_agent()
 
-    def answer_question(self, state: DocumentQAState):
+    @staticmethod
+    def generation_config(schema: dict) -> dict:
+        return {
+            "response_mime_type": "application/json",
+            "response_schema": schema,
+            "temperature": 0.0,
+        }
+
+    @staticmethod
+    def timed(
+        state: DocumentQAState, stage: str, start: float, update: Optional[dict] = None
+    ) -> dict:
+        latency = time.perf_counter() - start
+        logger.info(f"Stage {stage} took {latency:.2f}s")
+        return {
+            **(update or {}),
+            "stage_latencies": {**state.stage_latencies, stage: latency},
+        }
+
+    @property
+    def answer_schema(self) -> dict:
+        if self.verification_options.mode == "fused":
+            return self.fused_answer_schema
+        return self.answer_cot_schema
+
+    def parse_answer(self, text: str) -> dict:
+        if self.verification_options.mode != "fused":
+            return {"answer_cot": AnswerChainOfThoughts(**json.loads(text))}
+
+        fused = FusedAnswerVerification(**json.loads(text))
+        update = {
+            "answer_cot": AnswerChainOfThoughts(
+                rationale=fused.rationale,
+                relevant_context=fused.relevant_context,
+                answer=fused.answer,
+            )
+        }
+        if fused.answer != "N/A":
+            update["answer_reformulation"] = AnswerReformulation(
+                declarative_answer=fused.declarative_answer
+            )
+            update["verification_cot"] = VerificationChainOfThoughts(
+                rationale=fused.rationale, entailment=fused.entailment
+            )
+        return update
+
+    def answer_question_messages(self, state: DocumentQAState) -> list:
         logger.info(f"Responding to question '{state.question}'")
-        assert (
-            state.pages_as_base64_jpeg_images or state.pages_as_text
-        ), "Input text or images"
-        messages = [
+        assert state.page_keys or state.pages_as_text, "Input text or images"
+        page_keys = [key for key in state.page_keys if key in self.page_store]
+        if len(page_keys) < len(state.page_keys):
+            logger.warning(
+                f"Skipping {len(state.page_keys) - len(page_keys)} page images "
+                f"missing from the page store"
+            )
+        logger.info(
+            f"Sending {len(page_keys)} page images "
+            f"({sum(map(self.page_store.size, page_keys))} bytes)"
+        )
+        return [
             {
                 "role": "user",
-                "parts": [
-                    {"mime_type": "image/jpeg", "data": base64_jpeg}
-                    for base64_jpeg in state.pages_as_base64_jpeg_images
-                ]
+                "parts": [self.page_store.as_part(page_key) for page_key in page_keys]
                 + state.pages_as_text
                 + [{"text": state.question}]
-                + [
-                    {
-                        "text": f"Use this schema for your answer: {self.answer_cot_schema}"
-                    }
-                ],
+                + [{"text": f"Use this schema for your answer: {self.answer_schema}"}],
             }
         ]
 
+    def answer_context_key(self, state: DocumentQAState) -> str:
+        # Page keys are hashes of the page images
+        return make_context_key(
+            "qa",
+            self.model_name,
+            self.verification_options.mode,
+            state.page_keys,
+            state.pages_as_text,
+        )
+
+    def cached_answer(self, state: DocumentQAState) -> Optional[dict]:
+        if self.answer_cache is None:
+            return None
+        cached = self.answer_cache.lookup(
+            self.answer_context_key(state), state.question
+        )
+        if cached is None:
+            return None
+        logger.info(f"Answering '{state.question}' from the answer cache")
+        return {**cached, "answer_cached": True}
+
+    def answer_question(self, state: DocumentQAState):
+        start = time.perf_counter()
+        cached = self.cached_answer(state)
+        if cached is not None:
+            return self.timed(state, "answer_question", start, cached)
+
         response = self.model.generate_content(
-            messages,
-            generation_config={
-                "response_mime_type": "application/json",
-                "response_schema": self.answer_cot_schema,
-                "temperature": 0.0,
-            },
+            self.answer_question_messages(state),
+            generation_config=self.generation_config(self.answer_schema),
         )
 
-        answer_cot = AnswerChainOfThoughts(**json.loads(response.text))
+        return self.timed(
+            state, "answer_question", start, self.parse_answer(response.text)
+        )
 
-        return {"answer_cot": answer_cot}
+    async def aanswer_question(self, state: DocumentQAState):
+        start = time.perf_counter()
+        cached = await asyncio.to_thread(self.cached_answer, state)
+        if cached is not None:
+            return self.timed(state, "answer_question", start, cached)
 
-    def reformulate_answer(self, state: DocumentQAState):
-        logger.info("Reformulating answer")
-        if state.answer_cot.answer == "N/A":
-            return
+        response = await self.model.generate_content_async(
+            self.answer_question_messages(state),
+            generation_config=self.generation_config(self.answer_schema),
+        )
 
-        messages = [
+        return self.timed(
+            state, "answer_question", start, self.parse_answer(response.text)
+        )
+
+    def reformulate_answer_messages(self, state: DocumentQAState) -> list:
+        logger.info("Reformulating answer")
+        return [
             {
                 "role": "user",
                 "parts": [
@@ -122,24 +262,47 @@ class DocumentQAAgent:
             }
         ]
 
+    def reformulate_answer(self, state: DocumentQAState):
+        if state.answer_cot.answer == "N/A":
+            return
+
+        start = time.perf_counter()
         response = self.model.generate_content(
-            messages,
-            generation_config={
-                "response_mime_type": "application/json",
-                "response_schema": self.declarative_answer_schema,
-                "temperature": 0.0,
-            },
+            self.reformulate_answer_messages(state),
+            generation_config=self.generation_config(self.declarative_answer_schema),
         )
 
         answer_reformulation = AnswerReformulation(**json.loads(response.text))
 
-        return {"answer_reformulation": answer_reformulation}
+        return self.timed(
+            state,
+            "reformulate_answer",
+            start,
+            {"answer_reformulation": answer_reformulation},
+        )
 
-    def verify_answer(self, state: DocumentQAState):
-        logger.info(f"Verifying answer '{state.answer_cot.answer}'")
+    async def areformulate_answer(self, state: DocumentQAState):
         if state.answer_cot.answer == "N/A":
             return
-        messages = [
+
+        start = time.perf_counter()
+        response = await self.model.generate_content_async(
+            self.reformulate_answer_messages(state),
+            generation_config=self.generation_config(self.declarative_answer_schema),
+        )
+
+        answer_reformulation = AnswerReformulation(**json.loads(response.text))
+
+        return self.timed(
+            state,
+            "reformulate_answer",
+            start,
+            {"answer_reformulation": answer_reformulation},
+        )
+
+    def verify_answer_messages(self, state: DocumentQAState) -> list:
+        logger.info(f"Verifying answer '{state.answer_cot.answer}'")
+        return [
             {
                 "role": "user",
                 "parts": [
@@ -158,46 +321,167 @@ class DocumentQAAgent:
             }
         ]
 
+    def verify_answer(self, state: DocumentQAState):
+        if state.answer_cot.answer == "N/A":
+            return
+
+        start = time.perf_counter()
         response = self.model.generate_content(
-            messages,
-            generation_config={
-                "response_mime_type": "application/json",
-                "response_schema": self.verification_cot_schema,
-                "temperature": 0.0,
-            },
+            self.verify_answer_messages(state),
+            generation_config=self.generation_config(self.verification_cot_schema),
+        )
+
+        verification_cot = VerificationChainOfThoughts(**json.loads(response.text))
+
+        return self.timed(
+            state, "verify_answer", start, {"verification_cot": verification_cot}
+        )
+
+    async def averify_answer(self, state: DocumentQAState):
+        if state.answer_cot.answer == "N/A":
+            return
+
+        start = time.perf_counter()
+        response = await self.model.generate_content_async(
+            self.verify_answer_messages(state),
+            generation_config=self.generation_config(self.verification_cot_schema),
         )
 
         verification_cot = VerificationChainOfThoughts(**json.loads(response.text))
 
-        return {"verification_cot": verification_cot}
+        return self.timed(
+            state, "verify_answer", start, {"verification_cot": verification_cot}
+        )
+
+    def skip_verification(self, state: DocumentQAState) -> bool:
+        if state.answer_cot.answer == "N/A":
+            return True
+        context_chars = sum(map(len, state.pages_as_text))
+        return (
+            not state.page_keys
+            and context_chars < self.verification_options.min_context_chars
+        )
+
+    def run_verification(self, state: DocumentQAState) -> dict:
+        updates = {}
+        for stage in [self.reformulate_answer, self.verify_answer]:
+            update = stage(state) or {}
+            state = state.model_copy(update=update)
+            updates.update(update)
+        self.cache_answer(state)
+        return updates
+
+    def verify_in_background(self, result: dict) -> Optional[Future]:
+        """
+        Hands the reformulation and the verification of a graph result over to a
+        worker thread. The future resolves to the answer_reformulation,
+        verification_cot and stage_latencies updates, and the answer is cached once
+        verified. None outside 'background' mode and for cached answers.
+        """
+        state = DocumentQAState.model_validate(result)
+        if self.verification_options.mode != "background" or state.answer_cached:
+            return None
+        if self._verification_executor is None:
+            self._verification_executor = ThreadPoolExecutor(
+                max_workers=self.verification_options.max_workers,
+                thread_name_prefix="qa-verification",
+            )
+        return self._verification_executor.submit(self.run_verification, state)
+
+    def invoke_with_verification(
+        self, state: DocumentQAState
+    ) -> tuple[dict, Optional[Future]]:
+        """Runs the graph and returns its result with `verify_in_background`'s."""
+        result = self.graph.invoke(state)
+        return result, self.verify_in_background(result)
+
+    async def ainvoke_with_verification(
+        self, state: DocumentQAState
+    ) -> tuple[dict, Optional[Future]]:
+        result = await self.graph.ainvoke(state)
+        return result, self.verify_in_background(result)
+
+    def close(self):
+        """Waits for the background verifications and stops their threads."""
+        if self._verification_executor is not None:
+            self._verification_executor.shutdown(wait=True)
+            self._verification_executor = None
+
+    def __enter__(self) -> "DocumentQAAgent":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def route_answer(self, state: DocumentQAState) -> str:
+        mode = self.verification_options.mode
+        if state.answer_cached or mode == "background":
+            return END
+        if mode == "fused" or (mode == "early_exit" and self.skip_verification(state)):
+            return "cache_answer"
+        return "reformulate_answer"
+
+    def cache_answer(self, state: DocumentQAState):
+        if self.answer_cache is None:
+            return
+        self.answer_cache.store(
+            self.answer_context_key(state),
+            state.question,
+            {
+                "answer_cot": state.answer_cot,
+                "answer_reformulation": state.answer_reformulation,
+                "verification_cot": state.verification_cot,
+            },
+        )
 
     def build_agent(self):
         builder = StateGraph(DocumentQAState)
-        builder.add_node("answer_question", self.answer_question)
-        builder.add_node("reformulate_answer", self.reformulate_answer)
-        builder.add_node("verify_answer", self.verify_answer)
+        builder.add_node(
+            "answer_question",
+            RunnableLambda(self.answer_question, afunc=self.aanswer_question),
+        )
+        builder.add_node(
+            "reformulate_answer",
+            RunnableLambda(self.reformulate_answer, afunc=self.areformulate_answer),
+        )
+        builder.add_node(
+            "verify_answer",
+            RunnableLambda(self.verify_answer, afunc=self.averify_answer),
+        )
+
+        builder.add_node("cache_answer", self.cache_answer)
 
         builder.add_edge(START, "answer_question")
-        builder.add_edge("answer_question", "reformulate_answer")
+        builder.add_conditional_edges("answer_question", self.route_answer)
         builder.add_edge("reformulate_answer", "verify_answer")
-        builder.add_edge("verify_answer", END)
+        builder.add_edge("verify_answer", "cache_answer")
+        builder.add_edge("cache_answer", END)
         self.graph = builder.compile()
 
 
 if __name__ == "__main__":
     from pathlib import Path
 
-    from document_ai_agents.document_utils import extract_images_from_pdf
-    from document_ai_agents.image_utils import pil_image_to_base64_jpeg
+    from document_ai_agents.document_utils import RenderOptions
+    from document_ai_agents.image_utils import JpegEncodingOptions
+    from document_ai_agents.page_cache import PageImageCache, iter_pdf_pages_as_jpeg
 
     document_path = str(Path(__file__).parents[1] / "data" / "docs.pdf")
 
-    images = extract_images_from_pdf(pdf_path=document_path)
-    pages_as_base64_jpeg_images = [pil_image_to_base64_jpeg(x) for x in images]
+    page_store = get_default_page_store()
+    page_keys = [
+        page_store.put(jpeg_bytes)
+        for _, jpeg_bytes in iter_pdf_pages_as_jpeg(
+            document_path,
+            render_options=RenderOptions(dpi=200, workers=4),
+            cache=PageImageCache(),
+            encoding_options=JpegEncodingOptions(max_bytes=400_000, grayscale=True),
+        )
+    ]
 
     _state = DocumentQAState(
         question="What is the highest score on M-RCNN ?",
-        pages_as_base64_jpeg_images=pages_as_base64_jpeg_images,
+        page_keys=page_keys,
         pages_as_text=[],
     )
 
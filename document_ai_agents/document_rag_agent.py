@@ -1,93 +1,923 @@
-from typing import Optional
+import asyncio
+import copy
+import hashlib
+import io
+import json
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterable, Iterable, Optional, Tuple
 
 import google.generativeai as genai
+import numpy as np
+import PIL.Image as Image
 from chromadb.api.types import EmbeddingFunction
-from chromadb.utils import embedding_functions
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, START, StateGraph
+from pdf2image.exceptions import (
+    PDFInfoNotInstalledError,
+    PDFPageCountError,
+    PDFSyntaxError,
+)
 from pydantic import BaseModel, Field
 
+from document_ai_agents.answer_cache import SemanticAnswerCache, make_context_key
+from document_ai_agents.context_packer import ContextBudgetOptions, pack_context
+from document_ai_agents.document_utils import render_pdf_page
+from document_ai_agents.embedding_cache import (
+    EmbeddingCache,
+    EmbeddingOptions,
+    make_embedding_key,
+)
+from document_ai_agents.embedding_registry import (
+    DEFAULT_EMBEDDING_MODEL,
+    get_embedding_registry,
+)
+from document_ai_agents.image_utils import (
+    JpegEncodingOptions,
+    crop_normalized_box,
+    encode_jpeg,
+)
+from document_ai_agents.lexical_index import (
+    BM25Index,
+    HybridSearchOptions,
+    reciprocal_rank_fusion,
+)
 from document_ai_agents.logger import logger
+from document_ai_agents.numpy_vector_store import NumpyVectorStore, VectorIndexOptions
+from document_ai_agents.page_store import PageStore, get_default_page_store
+from document_ai_agents.rate_limiter import estimate_request_tokens
 
 
 class ChromaEmbeddingsAdapter(Embeddings):
-    def __init__(self, ef: EmbeddingFunction):
+    """
+    Exposes a Chroma embedding function to LangChain. Texts are embedded once: each
+    vector is cached under a hash of the text, and texts missing from the cache are
+    embedded in batches, by several threads when `workers` > 1.
+    """
+
+    def __init__(
+        self,
+        ef: EmbeddingFunction,
+        embedding_options: Optional[EmbeddingOptions] = None,
+        model_id: str = "default",
+    ):
         self.ef = ef
+        self.embedding_options = embedding_options or EmbeddingOptions()
+        # Cached vectors are only valid for the model that produced them
+        self.model_id = model_id
+        self.cache = EmbeddingCache(
+            max_entries=self.embedding_options.memory_cache_size,
+            cache_dir=self.embedding_options.cache_dir,
+        )
+
+    def embed_batch(self, texts: list[str]) -> list[np.ndarray]:
+        return [np.asarray(vector, dtype=np.float32) for vector in self.ef(texts)]
 
     def embed_documents(self, texts):
-        return self.ef(texts)
+        keys = [make_embedding_key(text, self.model_id) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        missing = {
+            key: text for key, text in zip(keys, texts) if key not in vectors
+        }  # Identical texts are embedded once
+        if missing:
+            batch_size = self.embedding_options.batch_size
+            missing_keys = list(missing)
+            batches = [
+                missing_keys[start : start + batch_size]
+                for start in range(0, len(missing_keys), batch_size)
+            ]
+            texts_of = [[missing[key] for key in batch] for batch in batches]
+            if self.embedding_options.workers > 1 and len(batches) > 1:
+                # ONNX inference releases the GIL, batches run in parallel
+                with ThreadPoolExecutor(
+                    max_workers=self.embedding_options.workers
+                ) as executor:
+                    embedded = list(executor.map(self.embed_batch, texts_of))
+            else:
+                embedded = [self.embed_batch(batch) for batch in texts_of]
+
+            new_vectors = {
+                key: vector
+                for batch, batch_vectors in zip(batches, embedded)
+                for key, vector in zip(batch, batch_vectors)
+            }
+            self.cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+
+            logger.info(
+                f"Embedded {len(missing)} texts, {len(texts) - len(missing)} "
+                f"were cached."
+            )
+
+        return [vectors[key].tolist() for key in keys]
 
     def embed_query(self, query):
-        return self.ef([query])[0]
+        return self.embed_documents([query])[0]
+
+
+_shared_embeddings: dict[str, ChromaEmbeddingsAdapter] = {}
+_shared_embeddings_lock = threading.Lock()
+
+
+def get_shared_embeddings(
+    embedding_options: Optional[EmbeddingOptions] = None,
+    model_id: str = DEFAULT_EMBEDDING_MODEL,
+) -> ChromaEmbeddingsAdapter:
+    """
+    Embeddings shared by the agents of the process that use the same model and
+    options, so they share the loaded model, the cached vectors and the on-disk
+    cache files.
+    """
+    embedding_options = embedding_options or EmbeddingOptions()
+    key = f"{model_id}:{embedding_options.model_dump_json()}"
+    with _shared_embeddings_lock:
+        if key not in _shared_embeddings:
+            _shared_embeddings[key] = ChromaEmbeddingsAdapter(
+                get_embedding_registry().get(model_id),
+                embedding_options=embedding_options,
+                model_id=model_id,
+            )
+        return _shared_embeddings[key]
+
+
+def make_document_id(document: Document) -> str:
+    """
+    Deterministic id from the source file, the page and the content, so indexing the
+    same document twice targets the same entries.
+    """
+    content_hash = hashlib.sha256(document.page_content.encode()).hexdigest()
+    key = json.dumps(
+        [
+            document.metadata.get("document_path"),
+            document.metadata.get("page_number"),
+            content_hash,
+        ]
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class RetrievalFilter(BaseModel):
+    document_paths: Optional[list[str]] = None
+    element_types: Optional[list[str]] = Field(
+        None, description="For instance ['Table', 'Figure']."
+    )
+    page_range: Optional[Tuple[int, int]] = Field(
+        None, description="First and last page numbers, both included."
+    )
+
+    def to_where(self) -> Optional[dict]:
+        """Equivalent Chroma `where` clause, None when nothing is filtered."""
+        clauses = []
+        if self.document_paths is not None:
+            clauses.append({"document_path": {"$in": self.document_paths}})
+        if self.element_types is not None:
+            clauses.append({"element_type": {"$in": self.element_types}})
+        if self.page_range is not None:
+            clauses.append({"page_number": {"$gte": self.page_range[0]}})
+            clauses.append({"page_number": {"$lte": self.page_range[1]}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def matches(self, document: Document) -> bool:
+        metadata = document.metadata
+        if (
+            self.document_paths is not None
+            and metadata.get("document_path") not in self.document_paths
+        ):
+            return False
+        if (
+            self.element_types is not None
+            and metadata.get("element_type") not in self.element_types
+        ):
+            return False
+        if self.page_range is not None:
+            page_number = metadata.get("page_number")
+            first, last = self.page_range
+            if page_number is None or not first <= page_number <= last:
+                return False
+        return True
+
+
+class CropOptions(BaseModel):
+    dpi: int = Field(
+        300, gt=0, description="Resolution the page is rendered at before cropping."
+    )
+    padding: float = Field(
+        0.01, ge=0, description="Margin added around the box, as a page fraction."
+    )
+    min_size: int = Field(
+        32,
+        ge=1,
+        description="Crops narrower or shorter than this many pixels are "
+        "discarded and the whole page is sent instead.",
+    )
+    element_types: list[str] = Field(
+        default_factory=lambda: ["Table", "Figure", "Image"],
+        description="Items sent as a crop instead of their whole page.",
+    )
+    encoding_options: JpegEncodingOptions = Field(
+        default_factory=lambda: JpegEncodingOptions(quality=85)
+    )
+
+
+MAX_MEMOIZED_CROPS = 4_096
+
+# Chroma collection names start and end with a letter or a digit
+TENANT_PATTERN = re.compile(r"[a-zA-Z0-9](?:[a-zA-Z0-9_-]{0,29}[a-zA-Z0-9])?")
+MAX_COLLECTION_NAME_LENGTH = 63
+
+
+def tenant_collection_name(collection_name: str, tenant: str) -> str:
+    if not TENANT_PATTERN.fullmatch(tenant):
+        raise ValueError(
+            f"Invalid tenant {tenant!r}: use up to 31 letters, digits, '_' or '-', "
+            f"starting and ending with a letter or a digit"
+        )
+    name = f"{collection_name}--{tenant}"
+    if len(name) > MAX_COLLECTION_NAME_LENGTH:
+        raise ValueError(
+            f"Collection name {name!r} of tenant {tenant!r} is longer than "
+            f"{MAX_COLLECTION_NAME_LENGTH} characters"
+        )
+    return name
 
 
 class DocumentRAGState(BaseModel):
     question: str
     document_path: str
-    pages_as_base64_jpeg_images: list[str]
+    page_keys: list[str]
+    page_numbers: list[int] = Field(default_factory=list)
     documents: list[Document]
+    added_documents: Optional[list[Document]] = Field(
+        None,
+        description="When set with `removed_documents`, only these changes are "
+        "applied to the index instead of indexing `documents`.",
+    )
+    removed_documents: list[Document] = Field(default_factory=list)
+    retrieval_filter: Optional[RetrievalFilter] = Field(
+        None,
+        description="Restricts the retrieved documents. Retrieval is always scoped "
+        "to the files of `documents` unless `document_paths` is set.",
+    )
     relevant_documents: list[Document] = Field(default_factory=list)
     response: Optional[str] = None
 
 
 class DocumentRAGAgent:
-    def __init__(self, model_name="gemini-1.5-flash-002", k=3):
+    def __init__(
+        self,
+        model_name="gemini-1.5-flash-002",
+        k=3,
+        page_store: Optional[PageStore] = None,
+        collection_name: str = "document-rag",
+        persist_directory: Optional[str] = None,
+        embedding_options: Optional[EmbeddingOptions] = None,
+        hybrid_options: Optional[HybridSearchOptions] = None,
+        vector_index_options: Optional[VectorIndexOptions] = None,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        context_budget_options: Optional[ContextBudgetOptions] = None,
+        crop_options: Optional[CropOptions] = None,
+    ):
         self.model_name = model_name
         self.model = genai.GenerativeModel(
             self.model_name,
         )
-        self.vector_store = Chroma(
-            collection_name="document-rag",
-            embedding_function=ChromaEmbeddingsAdapter(
-                embedding_functions.DefaultEmbeddingFunction()
-            ),
+        self.k = k
+        self.embeddings = get_shared_embeddings(embedding_options)
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        # Dense retrieval only when no hybrid search options are given
+        self.hybrid_options = hybrid_options
+        # Chroma only when no vector index options are given
+        self.vector_index_options = vector_index_options
+        self.answer_cache = answer_cache
+        # Every retrieved text and page image is sent when no budget is given
+        self.context_budget_options = context_budget_options
+        # Whole pages are sent for every item when no crop options are given
+        self.crop_options = crop_options
+        # Least recently used last, bounded by MAX_MEMOIZED_CROPS
+        self._crop_keys: OrderedDict[tuple, Optional[str]] = OrderedDict()
+        self._crop_keys_lock = threading.Lock()
+        self.page_store = (
+            page_store if page_store is not None else get_default_page_store()
         )
-        self.retriever = self.vector_store.as_retriever(search_kwargs={"k": k})
+        self._tenant_agents: dict[str, "DocumentRAGAgent"] = {}
+        self._tenants_lock = threading.Lock()
+
+        self.vector_store = None
+        self.retriever = None
+        self.lexical_index = None
+        self.open_collection()
 
         self.graph = None
         self.build_agent()
 
+    def open_collection(self):
+        self.vector_store = self.open_vector_store()
+        self.retriever = self.vector_store.as_retriever(search_kwargs={"k": self.k})
+        self.lexical_index = None
+        if self.hybrid_options is not None:
+            self.lexical_index = BM25Index(
+                k1=self.hybrid_options.k1, b=self.hybrid_options.b
+            )
+            self.load_lexical_index()
+
+    def open_chroma(self) -> Chroma:
+        # The collection only lives in memory when no persist directory is given
+        return Chroma(
+            collection_name=self.collection_name,
+            embedding_function=self.embeddings,
+            persist_directory=self.persist_directory,
+        )
+
+    def open_numpy_store(self) -> NumpyVectorStore:
+        path = (
+            str(Path(self.persist_directory) / f"{self.collection_name}.numpy")
+            if self.persist_directory
+            else None
+        )
+        return NumpyVectorStore(
+            self.embeddings, path=path, dtype=self.vector_index_options.dtype
+        )
+
+    def open_vector_store(self):
+        options = self.vector_index_options
+        if options is None or options.backend == "chroma":
+            return self.open_chroma()
+        if options.backend == "numpy" or not self.persist_directory:
+            return self.open_numpy_store()
+
+        # Collections moved to Chroma once they grew past the NumPy store limit
+        # have no NumPy store left
+        numpy_path = Path(self.persist_directory) / f"{self.collection_name}.numpy"
+        chroma_path = Path(self.persist_directory) / "chroma.sqlite3"
+        if numpy_path.exists() or not chroma_path.exists():
+            return self.open_numpy_store()
+        chroma = self.open_chroma()
+        return chroma if chroma._collection.count() else self.open_numpy_store()
+
+    def move_to_chroma(self, batch_size: int = 1_000):
+        """
+        Copies a NumPy store that outgrew `max_numpy_size` to Chroma. Vectors come
+        from the embedding cache, the texts are not embedded again.
+        """
+        numpy_store = self.vector_store
+        chroma = self.open_chroma()
+        indexed = numpy_store.get()
+        for start in range(0, len(indexed["ids"]), batch_size):
+            chroma.add_texts(
+                indexed["documents"][start : start + batch_size],
+                indexed["metadatas"][start : start + batch_size],
+                ids=indexed["ids"][start : start + batch_size],
+            )
+        self.vector_store = chroma
+        self.retriever = chroma.as_retriever(search_kwargs={"k": self.k})
+        if numpy_store.path is not None:
+            shutil.rmtree(numpy_store.path)
+        logger.info(
+            f"Moved {len(indexed['ids'])} documents of {self.collection_name} "
+            f"from the NumPy store to Chroma"
+        )
+
+    def query_vector_store(
+        self, query_embeddings: list[list[float]], n_results: int, where: Optional[dict]
+    ) -> dict:
+        if isinstance(self.vector_store, NumpyVectorStore):
+            return self.vector_store.query(
+                query_embeddings, n_results=n_results, where=where
+            )
+        return self.vector_store._collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas"],
+        )
+
+    def for_tenant(self, tenant: str) -> "DocumentRAGAgent":
+        """
+        Agent sharing this one's model, embeddings and caches but indexing in a
+        collection of its own, so each tenant only searches its own documents and
+        query latency does not grow with the other tenants' corpora.
+        """
+        with self._tenants_lock:
+            if tenant not in self._tenant_agents:
+                agent = copy.copy(self)
+                agent.collection_name = tenant_collection_name(
+                    self.collection_name, tenant
+                )
+                agent._tenant_agents = {}
+                agent._tenants_lock = threading.Lock()
+                agent.open_collection()
+                agent.build_agent()
+                self._tenant_agents[tenant] = agent
+            return self._tenant_agents[tenant]
+
+    def load_lexical_index(self):
+        """
+        Fills the lexical index with the documents already in the vector store, for
+        instance from a persisted collection.
+        """
+        indexed = self.vector_store.get(include=["documents", "metadatas"])
+        self.lexical_index.add(
+            indexed["ids"],
+            [
+                Document(page_content=content, metadata=metadata or {})
+                for content, metadata in zip(indexed["documents"], indexed["metadatas"])
+            ],
+        )
+        if indexed["ids"]:
+            logger.info(f"Loaded {len(indexed['ids'])} documents in the lexical index")
+
+    def upsert_documents(self, documents: list[Document]) -> int:
+        """
+        Adds the documents that are not indexed yet and returns how many were added.
+        Already indexed documents are skipped before embedding, so indexing the same
+        documents again costs no embedding work.
+        """
+        documents_by_id = {make_document_id(doc): doc for doc in documents}
+        if not documents_by_id:  # Chroma rejects an empty list of ids
+            return 0
+        existing_ids = set(
+            self.vector_store.get(ids=list(documents_by_id), include=[])["ids"]
+        )
+        new_documents = {
+            id_: doc for id_, doc in documents_by_id.items() if id_ not in existing_ids
+        }
+        if new_documents:
+            self.vector_store.add_documents(
+                list(new_documents.values()), ids=list(new_documents)
+            )
+            if self.lexical_index is not None:
+                self.lexical_index.add(
+                    list(new_documents), list(new_documents.values())
+                )
+            if (
+                isinstance(self.vector_store, NumpyVectorStore)
+                and self.vector_index_options.backend == "auto"
+                and len(self.vector_store) > self.vector_index_options.max_numpy_size
+            ):
+                self.move_to_chroma()
+        return len(new_documents)
+
+    def delete_documents(self, documents: list[Document]) -> int:
+        ids = list(dict.fromkeys(make_document_id(doc) for doc in documents))
+        self.delete_ids(ids)
+        return len(ids)
+
+    def delete_ids(self, ids: list[str]):
+        if not ids:
+            return
+        self.vector_store.delete(ids=ids)
+        if self.lexical_index is not None:
+            self.lexical_index.delete(ids)
+
+    def stale_document_ids(self, documents: list[Document]) -> list[str]:
+        """
+        Indexed documents of the same files and pages as `documents` that are not
+        part of them anymore, left over from an earlier version of those pages.
+        """
+        current_ids = {make_document_id(doc) for doc in documents}
+        pages = {
+            (doc.metadata.get("document_path"), doc.metadata.get("page_number"))
+            for doc in documents
+        }
+        stale_ids = []
+        for document_path in {document_path for document_path, _ in pages}:
+            indexed = self.vector_store.get(
+                where={"document_path": document_path}, include=["metadatas"]
+            )
+            stale_ids += [
+                id_
+                for id_, metadata in zip(indexed["ids"], indexed["metadatas"])
+                if (document_path, metadata.get("page_number")) in pages
+                and id_ not in current_ids
+            ]
+        return stale_ids
+
+    def apply_document_deltas(
+        self, added_documents: list[Document], removed_documents: list[Document]
+    ):
+        # Content that is both removed and added keeps its id and its embedding
+        added_ids = {make_document_id(doc) for doc in added_documents}
+        n_removed = self.delete_documents(
+            [doc for doc in removed_documents if make_document_id(doc) not in added_ids]
+        )
+        n_added = self.upsert_documents(added_documents)
+
+        logger.info(f"Removed {n_removed} and added {n_added} indexed documents.")
+
+    def index_document_stream(self, documents: Iterable[list[Document]]) -> int:
+        """
+        Indexes documents as they are produced, for instance by
+        `DocumentParsingAgent.stream_documents`, so the first pages are searchable
+        before the whole document is parsed.
+        """
+        start = time.perf_counter()
+        n_documents = 0
+        for batch in documents:
+            self.upsert_documents(batch)
+            n_documents += len(batch)
+            logger.info(
+                f"Indexed {n_documents} documents after "
+                f"{time.perf_counter() - start:.2f}s"
+            )
+        return n_documents
+
+    async def aindex_document_stream(
+        self, documents: AsyncIterable[list[Document]]
+    ) -> int:
+        start = time.perf_counter()
+        n_documents = 0
+        async for batch in documents:
+            await asyncio.to_thread(self.upsert_documents, batch)
+            n_documents += len(batch)
+            logger.info(
+                f"Indexed {n_documents} documents after "
+                f"{time.perf_counter() - start:.2f}s"
+            )
+        return n_documents
+
     def index_documents(self, state: DocumentRAGState):
+        if state.added_documents is not None:
+            self.apply_document_deltas(state.added_documents, state.removed_documents)
+            return
+
         assert state.documents, "Documents should have at least one element"
 
-        if self.vector_store.get(where={"document_path": state.document_path})["ids"]:
-            logger.info(
-                "Documents for this file are already indexed, exiting this node"
+        stale_ids = self.stale_document_ids(state.documents)
+        self.delete_ids(stale_ids)
+        n_added = self.upsert_documents(state.documents)
+
+        logger.info(
+            f"Indexed {n_added} new documents, {len(state.documents) - n_added} were "
+            f"already indexed and {len(stale_ids)} stale ones were removed."
+        )
+
+    def crop_layout_item(
+        self, document: Document, page_key: str, rendered_pages: dict
+    ) -> Optional[str]:
+        """
+        Page store key of a crop of the item's bounding box, rendered again at
+        `crop_options.dpi`. Falls back to cropping the stored page image when the PDF
+        cannot be rendered. None when the item has no box or is not cropped.
+        """
+        metadata = document.metadata
+        if (
+            self.crop_options is None
+            or metadata.get("element_type") not in self.crop_options.element_types
+            or "bounding_box" not in metadata
+        ):
+            return None
+        crop_id = (
+            page_key,
+            metadata["bounding_box"],
+            self.crop_options.model_dump_json(),
+        )
+        with self._crop_keys_lock:
+            if crop_id in self._crop_keys:
+                self._crop_keys.move_to_end(crop_id)
+                crop_key = self._crop_keys[crop_id]
+                # The page store may have evicted the crop since
+                if crop_key is None or crop_key in self.page_store:
+                    return crop_key
+
+        document_path, page_number = (
+            metadata.get("document_path"),
+            metadata["page_number"],
+        )
+        if (document_path, page_number) not in rendered_pages:
+            try:
+                page_image = render_pdf_page(
+                    document_path, page_number, dpi=self.crop_options.dpi
+                )
+            except (
+                OSError,
+                PDFInfoNotInstalledError,
+                PDFPageCountError,
+                PDFSyntaxError,
+            ) as e:
+                logger.warning(
+                    f"Cropping the stored image of page {page_number} of "
+                    f"{document_path}, rendering failed: {e}"
+                )
+                page_image = Image.open(io.BytesIO(self.page_store.get(page_key)))
+            rendered_pages[(document_path, page_number)] = page_image
+
+        crop = crop_normalized_box(
+            rendered_pages[(document_path, page_number)],
+            json.loads(metadata["bounding_box"]),
+            padding=self.crop_options.padding,
+        )
+        if min(crop.size) < self.crop_options.min_size:
+            logger.warning(
+                f"Sending the whole page {page_number} of {document_path}, the crop "
+                f"of {metadata['bounding_box']} is only {crop.size} pixels"
+            )
+            self.memoize_crop(crop_id, None)
+            return None
+        crop_key = self.page_store.put(
+            encode_jpeg(crop, self.crop_options.encoding_options).data
+        )
+        self.memoize_crop(crop_id, crop_key)
+        return crop_key
+
+    def memoize_crop(self, crop_id: tuple, crop_key: Optional[str]):
+        with self._crop_keys_lock:
+            self._crop_keys[crop_id] = crop_key
+            self._crop_keys.move_to_end(crop_id)
+            while len(self._crop_keys) > MAX_MEMOIZED_CROPS:
+                self._crop_keys.popitem(last=False)
+
+    def answer_question_messages(
+        self, state: DocumentRAGState, relevant_documents: list[Document]
+    ) -> list:
+        # Images may only cover a subset of the pages when the document was rendered
+        # with explicit page numbers.
+        page_keys = dict(
+            zip(state.page_numbers or range(len(state.page_keys)), state.page_keys)
+        )
+        rendered_pages = {}
+
+        def page_key_of(doc: Document) -> Optional[str]:
+            # Page images are those of `state.document_path`, the page numbers of
+            # documents from other files do not refer to them
+            if doc.metadata.get("document_path", state.document_path) != (
+                state.document_path
+            ):
+                return None
+            page_key = page_keys.get(doc.metadata["page_number"])
+            if page_key is None:
+                return None
+            if page_key not in self.page_store:
+                logger.warning(
+                    f"Page {doc.metadata['page_number']} of {state.document_path} is "
+                    f"missing from the page store, sending its text only"
+                )
+                return None
+            # Tables and figures are sent as a crop of the item when possible
+            return self.crop_layout_item(doc, page_key, rendered_pages) or page_key
+
+        prompt = f"Answer this question using the context images and text elements only: {state.question}"
+
+        if self.context_budget_options is None:
+            images = list(
+                dict.fromkeys(
+                    page_key
+                    for page_key in map(page_key_of, relevant_documents)
+                    if page_key is not None
+                )
+            )  # Avoid duplicates
+        else:
+            packed = pack_context(
+                relevant_documents,
+                page_key_of,
+                self.page_store.size,
+                self.context_budget_options,
+                reserved_tokens=estimate_request_tokens(text_chars=len(prompt)),
             )
+            relevant_documents, images = packed.documents, packed.page_keys
+
+        logger.info(
+            f"Responding to question {state.question} with {len(images)} page images "
+            f"({sum(map(self.page_store.size, images))} bytes)"
+        )
+        return (
+            [self.page_store.as_part(page_key) for page_key in images]
+            + [doc.page_content for doc in relevant_documents]
+            + [prompt]
+        )
 
-        self.vector_store.add_documents(state.documents)
+    def answer_context_key(self, state: DocumentRAGState) -> str:
+        # Answers depend on the indexed content, the page images and what the
+        # retrieval may return, not on the path of the files
+        return make_context_key(
+            "rag",
+            self.model_name,
+            self.k,
+            self.collection_name,
+            sorted(make_document_id(doc) for doc in state.documents),
+            state.page_keys,
+            self.retrieval_filter(state).model_dump(),
+            self.context_budget_options,
+            self.crop_options,
+        )
+
+    def cached_answer(self, state: DocumentRAGState, question: str) -> Optional[dict]:
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.lookup(self.answer_context_key(state), question)
+
+    def cache_answer(self, state: DocumentRAGState, question: str, result: dict):
+        if self.answer_cache is not None:
+            self.answer_cache.store(self.answer_context_key(state), question, result)
 
     def answer_question(self, state: DocumentRAGState):
-        relevant_documents: list[Document] = self.retriever.invoke(state.question)
+        cached = self.cached_answer(state, state.question)
+        if cached is not None:
+            return cached
 
-        images = list(
-            set(
-                [
-                    state.pages_as_base64_jpeg_images[doc.metadata["page_number"]]
-                    for doc in relevant_documents
-                ]
+        relevant_documents = self.retrieve_many(
+            [state.question], self.retrieval_filter(state)
+        )[0]
+
+        response = self.model.generate_content(
+            self.answer_question_messages(state, relevant_documents)
+        )
+
+        result = {"response": response.text, "relevant_documents": relevant_documents}
+        self.cache_answer(state, state.question, result)
+        return result
+
+    async def aanswer_question(self, state: DocumentRAGState):
+        cached = await asyncio.to_thread(self.cached_answer, state, state.question)
+        if cached is not None:
+            return cached
+
+        relevant_documents = (
+            await asyncio.to_thread(
+                self.retrieve_many, [state.question], self.retrieval_filter(state)
             )
-        )  # Avoid duplicates
+        )[0]
 
-        logger.info(f"Responding to question {state.question}")
-        messages = (
-            [{"mime_type": "image/jpeg", "data": base64_jpeg} for base64_jpeg in images]
-            + [doc.page_content for doc in relevant_documents]
-            + [
-                f"Answer this question using the context images and text elements only: {state.question}",
-            ]
+        # Cropping renders PDF pages, which would block the event loop
+        messages = await asyncio.to_thread(
+            self.answer_question_messages, state, relevant_documents
         )
+        response = await self.model.generate_content_async(messages)
+
+        result = {"response": response.text, "relevant_documents": relevant_documents}
+        self.cache_answer(state, state.question, result)
+        return result
+
+    @staticmethod
+    def state_document_paths(state: DocumentRAGState) -> list[str]:
+        """Files of the documents in the state, which retrieval is scoped to."""
+        return list(
+            dict.fromkeys(
+                doc.metadata.get("document_path", state.document_path)
+                for doc in state.documents
+            )
+        ) or [state.document_path]
 
-        response = self.model.generate_content(messages)
+    def retrieval_filter(self, state: DocumentRAGState) -> RetrievalFilter:
+        retrieval_filter = state.retrieval_filter or RetrievalFilter()
+        if retrieval_filter.document_paths is None:
+            retrieval_filter = retrieval_filter.model_copy(
+                update={"document_paths": self.state_document_paths(state)}
+            )
+        return retrieval_filter
+
+    def retrieve_many(
+        self,
+        questions: list[str],
+        retrieval_filter: Optional[RetrievalFilter] = None,
+    ) -> list[list[Document]]:
+        """
+        Embeds all the questions in one batch and retrieves their `k` closest
+        documents with a single collection query. With hybrid search, the dense
+        candidates of each question are fused with its BM25 results. Both searches
+        only consider the documents accepted by `retrieval_filter`.
+        """
+        n_results = (
+            self.hybrid_options.n_candidates
+            if self.hybrid_options is not None
+            else self.k
+        )
+        query_embeddings = self.embeddings.embed_documents(questions)
+        results = self.query_vector_store(
+            query_embeddings,
+            n_results=n_results,
+            where=retrieval_filter.to_where() if retrieval_filter else None,
+        )
 
-        return {"response": response.text, "relevant_documents": relevant_documents}
+        retrieved = []
+        for question, ids, contents, metadatas in zip(
+            questions, results["ids"], results["documents"], results["metadatas"]
+        ):
+            documents = {
+                id_: Document(page_content=content, metadata=metadata or {})
+                for id_, content, metadata in zip(ids, contents, metadatas)
+            }
+            if self.lexical_index is None:
+                retrieved.append(list(documents.values()))
+                continue
+
+            lexical_ids = [
+                id_
+                for id_, _ in self.lexical_index.search(
+                    question,
+                    k=n_results,
+                    predicate=retrieval_filter.matches if retrieval_filter else None,
+                )
+            ]
+            fused = reciprocal_rank_fusion(
+                [ids, lexical_ids], rrf_k=self.hybrid_options.rrf_k
+            )
+            # Documents deleted since the search are skipped
+            fused_ids = [
+                id_ for id_, _ in fused if id_ in documents or id_ in self.lexical_index
+            ]
+            retrieved.append(
+                [
+                    documents[id_] if id_ in documents else self.lexical_index.get(id_)
+                    for id_ in fused_ids[: self.k]
+                ]
+            )
+        return retrieved
+
+    def answer_questions(
+        self, state: DocumentRAGState, questions: list[str], max_concurrency: int = 8
+    ) -> list[dict]:
+        """
+        Answers several questions about the same documents: they are indexed once,
+        retrieval is batched and up to `max_concurrency` answers are generated at a
+        time. Results are returned in the order of `questions`.
+        """
+        self.index_documents(state)
+        cached = [self.cached_answer(state, question) for question in questions]
+        missing = [q for q, answer in zip(questions, cached) if answer is None]
+        relevant_documents = dict(
+            zip(
+                missing,
+                self.retrieve_many(missing, self.retrieval_filter(state))
+                if missing
+                else [],
+            )
+        )
+
+        def answer(question: str, cached_result: Optional[dict]) -> dict:
+            if cached_result is not None:
+                return {"question": question, **cached_result}
+            documents = relevant_documents[question]
+            response = self.model.generate_content(
+                self.answer_question_messages(
+                    state.model_copy(update={"question": question}), documents
+                )
+            )
+            result = {"response": response.text, "relevant_documents": documents}
+            self.cache_answer(state, question, result)
+            return {"question": question, **result}
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return list(executor.map(answer, questions, cached))
+
+    async def aanswer_questions(
+        self, state: DocumentRAGState, questions: list[str], max_concurrency: int = 8
+    ) -> list[dict]:
+        await asyncio.to_thread(self.index_documents, state)
+        cached = [
+            await asyncio.to_thread(self.cached_answer, state, question)
+            for question in questions
+        ]
+        missing = [q for q, answer in zip(questions, cached) if answer is None]
+        relevant_documents = dict(
+            zip(
+                missing,
+                await asyncio.to_thread(
+                    self.retrieve_many, missing, self.retrieval_filter(state)
+                )
+                if missing
+                else [],
+            )
+        )
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def answer(question: str, cached_result: Optional[dict]) -> dict:
+            if cached_result is not None:
+                return {"question": question, **cached_result}
+            documents = relevant_documents[question]
+            async with semaphore:
+                messages = await asyncio.to_thread(
+                    self.answer_question_messages,
+                    state.model_copy(update={"question": question}),
+                    documents,
+                )
+                response = await self.model.generate_content_async(messages)
+            result = {"response": response.text, "relevant_documents": documents}
+            self.cache_answer(state, question, result)
+            return {"question": question, **result}
+
+        return await asyncio.gather(
+            *[answer(question, result) for question, result in zip(questions, cached)]
+        )
 
     def build_agent(self):
         builder = StateGraph(DocumentRAGState)
         builder.add_node("index_documents", self.index_documents)
-        builder.add_node("answer_question", self.answer_question)
+        builder.add_node(
+            "answer_question",
+            RunnableLambda(self.answer_question, afunc=self.aanswer_question),
+        )
 
         builder.add_edge(START, "index_documents")
         builder.add_edge("index_documents", "answer_question")
@@ -102,19 +932,29 @@ if __name__ == "__main__":
         DocumentLayoutParsingState,
         DocumentParsingAgent,
     )
+    from document_ai_agents.document_utils import RenderOptions
+    from document_ai_agents.image_utils import JpegEncodingOptions
+    from document_ai_agents.layout_cache import LayoutResultCache
+    from document_ai_agents.page_cache import PageImageCache
 
     state1 = DocumentLayoutParsingState(
-        document_path=str(Path(__file__).parents[1] / "data" / "docs.pdf")
+        document_path=str(Path(__file__).parents[1] / "data" / "docs.pdf"),
+        render_options=RenderOptions(dpi=200, workers=4),
     )
 
-    agent1 = DocumentParsingAgent()
+    agent1 = DocumentParsingAgent(
+        page_cache=PageImageCache(),
+        encoding_options=JpegEncodingOptions(max_bytes=400_000, grayscale=True),
+        layout_cache=LayoutResultCache(),
+    )
 
     result1 = agent1.graph.invoke(state1)
 
     state2 = DocumentRAGState(
         question="Who was acknowledge in this paper ?",
         document_path=str(Path(__file__).parents[1] / "data" / "docs.pdf"),
-        pages_as_base64_jpeg_images=result1["pages_as_base64_jpeg_images"],
+        page_keys=result1["page_keys"],
+        page_numbers=result1["page_numbers"],
         documents=result1["documents"],
     )
 
@@ -124,13 +964,13 @@ if __name__ == "__main__":
 
     print(result2["response"])
 
-    state3 = DocumentRAGState(
-        question="What is the macro average when fine tuning on publaynet using M-RCNN ? ",
-        document_path=str(Path(__file__).parents[1] / "data" / "docs.pdf"),
-        pages_as_base64_jpeg_images=result1["pages_as_base64_jpeg_images"],
-        documents=result1["documents"],
+    results = agent2.answer_questions(
+        state2,
+        [
+            "What is the macro average when fine tuning on publaynet using M-RCNN ? ",
+            "Which datasets are used in the experiments ?",
+        ],
     )
 
-    result3 = agent2.graph.invoke(state3)
-
-    print(result3["response"])
+    for result in results:
+        print(result["question"], result["response"])
@@ -1,19 +1,236 @@
+import hashlib
+import math
+import queue
+import re
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_path
+from PIL.Image import Image
+from pydantic import BaseModel, Field
 from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
 
 from document_ai_agents.logger import logger
 
+_END_OF_PAGES = object()
 
-def extract_images_from_pdf(pdf_path: str):
-    logger.info(f"Extracting images from PDF: {pdf_path}")
+
+class RenderOptions(BaseModel):
+    dpi: int = Field(200, gt=0, description="Rasterization resolution.")
+    page_numbers: Optional[list[int]] = Field(
+        None, description="Zero-based pages to render, all pages when not set."
+    )
+    workers: int = Field(
+        1, gt=0, description="Number of poppler processes rendering concurrently."
+    )
+    window_size: int = Field(
+        8, gt=0, description="Pages rendered per window when streaming."
+    )
+
+
+def get_pdf_page_count(pdf_path: str) -> int:
     with open(pdf_path, "rb") as f:
+        return len(PdfReader(f).pages)
+
+
+def resolve_page_numbers(
+    pdf_path: str, page_numbers: Optional[list[int]] = None
+) -> list[int]:
+    page_count = get_pdf_page_count(pdf_path)
+    if page_numbers is None:
+        return list(range(page_count))
+
+    page_numbers = sorted(set(page_numbers))
+    assert all(
+        0 <= page_number < page_count for page_number in page_numbers
+    ), f"Page numbers should be between 0 and {page_count - 1}"
+    return page_numbers
+
+
+def split_into_page_ranges(
+    page_numbers: list[int], n_ranges: int = 1
+) -> list[tuple[int, int]]:
+    """
+    Groups sorted zero-based page numbers into one-based (first_page, last_page) runs
+    of consecutive pages, splitting long runs so the work spreads over `n_ranges`.
+    """
+    if not page_numbers:
+        return []
+
+    max_range_size = math.ceil(len(page_numbers) / n_ranges)
+    ranges = []
+    first = last = page_numbers[0]
+    for page_number in page_numbers[1:]:
+        if page_number == last + 1 and page_number - first < max_range_size:
+            last = page_number
+        else:
+            ranges.append((first + 1, last + 1))
+            first = last = page_number
+    ranges.append((first + 1, last + 1))
+
+    return ranges
+
+
+def render_pdf_pages(
+    pdf_path: str,
+    page_numbers: list[int],
+    output_folder: str,
+    dpi: int = 200,
+    workers: int = 1,
+) -> list[Image]:
+    """
+    Renders the given sorted zero-based pages as JPEG images in `output_folder`.
+    Page ranges are rendered by up to `workers` poppler processes at the same time.
+    Images are returned in page order.
+    """
+    page_ranges = split_into_page_ranges(page_numbers, n_ranges=workers)
+
+    def render(page_range: tuple[int, int]) -> list[Image]:
+        return convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            first_page=page_range[0],
+            last_page=page_range[1],
+            output_folder=output_folder,
+            fmt="jpeg",
+        )
+
+    start = time.perf_counter()
+    if workers > 1 and len(page_ranges) > 1:
+        # The rendering itself happens in pdftoppm subprocesses, threads only wait.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rendered = list(executor.map(render, page_ranges))
+    else:
+        rendered = [render(page_range) for page_range in page_ranges]
+    duration = time.perf_counter() - start
+
+    images = [image for images in rendered for image in images]
+    logger.info(
+        f"Rendered {len(images)} pages at {dpi} DPI with {workers} workers in "
+        f"{duration:.2f}s ({len(images) / max(duration, 1e-6):.2f} pages/s)"
+    )
+    return images
+
+
+def render_pdf_page(pdf_path: str, page_number: int, dpi: int = 200) -> Image:
+    """Renders a single zero-based page in memory."""
+    return convert_from_path(
+        pdf_path, dpi=dpi, first_page=page_number + 1, last_page=page_number + 1
+    )[0]
+
+
+def extract_images_from_pdf(
+    pdf_path: str, render_options: Optional[RenderOptions] = None
+):
+    render_options = render_options or RenderOptions()
+    logger.info(f"Extracting images from PDF: {pdf_path}")
+    page_numbers = resolve_page_numbers(pdf_path, render_options.page_numbers)
+    with tempfile.TemporaryDirectory() as path:
+        logger.info(f"Converting PDF to images using temporary directory: {path}")
+        images = render_pdf_pages(
+            pdf_path,
+            page_numbers,
+            output_folder=path,
+            dpi=render_options.dpi,
+            workers=render_options.workers,
+        )
+        logger.info(f"Extracted {len(images)} images from the PDF.")
+        return images
+
+
+def _render_pdf_windows(
+    pdf_path: str, page_numbers: list[int], render_options: RenderOptions
+) -> Iterator[Image]:
+    window_size = render_options.window_size
+
+    for start in range(0, len(page_numbers), window_size):
+        window = page_numbers[start : start + window_size]
+        logger.info(f"Rendering pages {window[0] + 1}-{window[-1] + 1}")
         with tempfile.TemporaryDirectory() as path:
-            logger.info(f"Converting PDF to images using temporary directory: {path}")
-            images = convert_from_bytes(f.read(), output_folder=path, fmt="jpeg")
-            logger.info(f"Extracted {len(images)} images from the PDF.")
-            return images
+            images = render_pdf_pages(
+                pdf_path,
+                window,
+                output_folder=path,
+                dpi=render_options.dpi,
+                workers=render_options.workers,
+            )
+            for image in images:
+                image.load()  # Read pixels before the window's folder is removed
+                yield image
+            del images
+
+
+def iter_images_from_pdf(
+    pdf_path: str,
+    render_options: Optional[RenderOptions] = None,
+    prefetch: bool = True,
+) -> Iterator[Image]:
+    """
+    Renders the PDF `window_size` pages at a time and yields each page as soon as it
+    is ready. At most about two windows of pages are alive at once, whatever the page
+    count. With `prefetch`, the next window renders in a background thread while the
+    caller consumes the current one. Use `resolve_page_numbers` to know which page
+    each yielded image belongs to.
+    """
+    render_options = render_options or RenderOptions()
+    page_numbers = resolve_page_numbers(pdf_path, render_options.page_numbers)
+    logger.info(
+        f"Streaming {len(page_numbers)} images from PDF: {pdf_path} "
+        f"(window_size={render_options.window_size})"
+    )
+
+    if not prefetch:
+        yield from _render_pdf_windows(pdf_path, page_numbers, render_options)
+        return
+
+    pages: queue.Queue = queue.Queue(maxsize=render_options.window_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for image in _render_pdf_windows(pdf_path, page_numbers, render_options):
+                if not put(image):
+                    return
+            put(_END_OF_PAGES)
+        except Exception as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    start = time.perf_counter()
+    n_pages = 0
+    try:
+        while True:
+            item = pages.get()
+            if item is _END_OF_PAGES:
+                break
+            if isinstance(item, Exception):
+                raise item
+            n_pages += 1
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+    duration = time.perf_counter() - start
+    logger.info(
+        f"Streamed {n_pages} pages in {duration:.2f}s "
+        f"({n_pages / max(duration, 1e-6):.2f} pages/s)"
+    )
 
 
 def extract_text_from_pdf(pdf_path: str):
@@ -24,3 +241,151 @@ def extract_text_from_pdf(pdf_path: str):
         texts = [page.extract_text() for page in reader.pages]
         logger.info(f"Extracted text from {len(texts)} pages.")
         return texts
+
+
+_TABLE_OR_FIGURE_CAPTION = re.compile(
+    r"^\s*(table|fig\.?|figure)\s*(\d+|[ivxlc]+\b)", re.IGNORECASE
+)
+_NUMERIC_TOKEN = re.compile(r"^[-+(]?[$€£]?\d[\d.,:%)]*$")
+
+
+class PageTextLayer(BaseModel):
+    page_number: int
+    text: str
+    n_usable_chars: int = Field(
+        ..., description="Letters and digits, the text that carries content."
+    )
+    usable_ratio: float = Field(
+        ...,
+        description="Share of characters that are readable text rather than "
+        "replacement characters or encoding artifacts.",
+    )
+    n_images: int
+    n_numeric_rows: int = Field(
+        ..., description="Lines made mostly of numbers, typical of table rows."
+    )
+    has_table_or_figure_caption: bool
+
+
+def _is_usable_char(char: str) -> bool:
+    return char.isprintable() and char != "\ufffd"
+
+
+def analyze_page_text_layer(page, page_number: int) -> PageTextLayer:
+    text = page.extract_text() or ""
+    non_space_chars = [char for char in text if not char.isspace()]
+    lines = [line.split() for line in text.splitlines()]
+
+    try:
+        n_images = len(page.images)
+    except Exception as e:  # Broken image streams should not stop the analysis
+        logger.warning(f"Could not list images of page {page_number + 1}: {e}")
+        n_images = 1
+
+    return PageTextLayer(
+        page_number=page_number,
+        text=text,
+        n_usable_chars=sum(char.isalnum() for char in non_space_chars),
+        usable_ratio=(
+            sum(_is_usable_char(char) for char in non_space_chars)
+            / len(non_space_chars)
+            if non_space_chars
+            else 0.0
+        ),
+        n_images=n_images,
+        n_numeric_rows=sum(
+            len(tokens) >= 3
+            and sum(bool(_NUMERIC_TOKEN.match(token)) for token in tokens)
+            >= len(tokens) / 2
+            for tokens in lines
+        ),
+        has_table_or_figure_caption=any(
+            _TABLE_OR_FIGURE_CAPTION.match(line) for line in text.splitlines()
+        ),
+    )
+
+
+def analyze_pdf_text_layers(
+    pdf_path: str, page_numbers: Optional[list[int]] = None
+) -> list[PageTextLayer]:
+    logger.info(f"Analyzing text layer of PDF: {pdf_path}")
+    with open(pdf_path, "rb") as f:
+        reader = PdfReader(f)
+        if page_numbers is None:
+            page_numbers = list(range(len(reader.pages)))
+        return [
+            analyze_page_text_layer(reader.pages[page_number], page_number)
+            for page_number in page_numbers
+        ]
+
+
+def split_text_into_blocks(text: str, max_chars: int = 1500) -> list[str]:
+    """
+    Splits text into blocks of whole lines, starting a new block on empty lines or
+    when the current one would exceed `max_chars`.
+    """
+    blocks = []
+    current: list[str] = []
+    current_size = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if current and (not line or current_size + len(line) > max_chars):
+            blocks.append("\n".join(current))
+            current, current_size = [], 0
+        if line:
+            current.append(line)
+            current_size += len(line) + 1
+    if current:
+        blocks.append("\n".join(current))
+
+    return blocks
+
+
+# Back references and structure tree indices change when other pages change
+_FINGERPRINT_IGNORED_KEYS = {"/Parent", "/P", "/StructParents", "/StructParent"}
+
+
+def _update_fingerprint(sha256, obj, visited: set):
+    if isinstance(obj, IndirectObject):
+        if obj.idnum in visited:
+            # Object numbers differ between revisions, only the shape is hashed
+            sha256.update(b"<visited>")
+            return
+        visited.add(obj.idnum)
+        obj = obj.get_object()
+
+    if isinstance(obj, StreamObject):
+        sha256.update(obj.get_data())
+    if isinstance(obj, DictionaryObject):
+        for key in sorted(obj.keys()):
+            if key in _FINGERPRINT_IGNORED_KEYS:
+                continue
+            sha256.update(key.encode())
+            _update_fingerprint(sha256, obj.raw_get(key), visited)
+    elif isinstance(obj, ArrayObject):
+        sha256.update(b"[")
+        for item in obj:
+            _update_fingerprint(sha256, item, visited)
+        sha256.update(b"]")
+    else:
+        sha256.update(repr(obj).encode())
+
+
+def fingerprint_pdf_pages(
+    pdf_path: str, page_numbers: Optional[list[int]] = None
+) -> dict[int, str]:
+    """
+    Hashes what each page draws (content streams, fonts, images, page boxes) without
+    rendering it. Pages keep their fingerprint when other pages of the document are
+    edited, added or removed.
+    """
+    with open(pdf_path, "rb") as f:
+        reader = PdfReader(f)
+        if page_numbers is None:
+            page_numbers = list(range(len(reader.pages)))
+        fingerprints = {}
+        for page_number in page_numbers:
+            sha256 = hashlib.sha256()
+            _update_fingerprint(sha256, reader.pages[page_number], set())
+            fingerprints[page_number] = sha256.hexdigest()
+        return fingerprints
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from document_ai_agents.logger import logger
+
+
+class EmbeddingOptions(BaseModel):
+    batch_size: int = Field(32, gt=0, description="Texts per embedding call.")
+    workers: int = Field(
+        1, gt=0, description="Batches embedded concurrently by worker threads."
+    )
+    memory_cache_size: int = Field(
+        10_000, ge=0, description="Vectors kept in the in-memory LRU cache."
+    )
+    cache_dir: Optional[str] = Field(
+        None, description="Directory of the on-disk vector cache, disabled if not set."
+    )
+
+
+def make_embedding_key(text: str, model_id: str = "default") -> str:
+    return hashlib.sha256(f"{model_id}\0{text}".encode()).hexdigest()
+
+
+class DiskVectorStore:
+    """
+    Append-only float32 matrix memory-mapped from `vectors.f32`, with the key and row
+    of each vector in `keys.txt`. Rows written without their key before a crash are
+    ignored.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.cache_dir / "vectors.f32"
+        self._keys_path = self.cache_dir / "keys.txt"
+        self._meta_path = self.cache_dir / "meta.json"
+        self._lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self._index: dict[str, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._load()
+
+    def _load(self):
+        if not self._meta_path.is_file():
+            return
+        self.dim = json.loads(self._meta_path.read_text())["dim"]
+        n_rows = self._n_rows()
+        if self._keys_path.is_file():
+            for line in self._keys_path.read_text().splitlines():
+                key, _, row = line.partition(" ")
+                if row.isdigit() and int(row) < n_rows:
+                    self._index[key] = int(row)
+        self._remap()
+        logger.info(
+            f"Loaded {len(self._index)} cached embeddings from {self.cache_dir}"
+        )
+
+    def _n_rows(self) -> int:
+        if not self._vectors_path.is_file():
+            return 0
+        return self._vectors_path.stat().st_size // (4 * self.dim)
+
+    def _remap(self):
+        n_rows = self._n_rows()
+        self._vectors = (
+            np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dim)
+            )
+            if n_rows
+            else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        with self._lock:
+            rows = {key: self._index[key] for key in keys if key in self._index}
+            if not rows:
+                return {}
+            if self._vectors is None or max(rows.values()) >= len(self._vectors):
+                self._remap()
+            return {key: np.array(self._vectors[row]) for key, row in rows.items()}
+
+    def put_many(self, vectors: dict[str, np.ndarray]):
+        with self._lock:
+            new = {key: v for key, v in vectors.items() if key not in self._index}
+            if not new:
+                return
+            if self.dim is None:
+                self.dim = len(next(iter(new.values())))
+                self._meta_path.write_text(json.dumps({"dim": self.dim}))
+
+            matrix = np.asarray(list(new.values()), dtype=np.float32)
+            assert matrix.shape[1] == self.dim, "Embedding size changed"
+            offset = self._n_rows()
+            # Vectors are written before their keys, so a key always has its row
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(offset * 4 * self.dim)  # Drop a partially written row
+                f.write(matrix.tobytes())
+            with open(self._keys_path, "a") as f:
+                f.write(
+                    "".join(f"{key} {row}\n" for row, key in enumerate(new, offset))
+                )
+            for row, key in enumerate(new, start=offset):
+                self._index[key] = row
+
+
+class EmbeddingCache:
+    """
+    Content-hash to vector cache: an in-memory LRU in front of an optional on-disk
+    store shared by processes that run one after the other.
+    """
+
+    def __init__(self, max_entries: int = 10_000, cache_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk = DiskVectorStore(cache_dir) if cache_dir else None
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _remember(self, vectors: dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.disk is not None:
+            from_disk = self.disk.get_many(missing)
+            self._remember(from_disk)
+            found.update(from_disk)
+
+        with self._lock:
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, vectors: dict[str, np.ndarray]):
+        self._remember(vectors)
+        if self.disk is not None:
+            self.disk.put_many(vectors)
@@ -0,0 +1,133 @@
+import os
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+from chromadb.api.types import EmbeddingFunction
+from chromadb.utils import embedding_functions
+from pydantic import BaseModel
+
+from document_ai_agents.logger import logger
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+def current_rss_bytes() -> int:
+    """
+    Resident memory of the process, the peak where /proc is not available and 0
+    where neither is (Windows).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class EmbeddingModelStats(BaseModel):
+    model_id: str
+    load_seconds: float
+    memory_bytes: int
+
+
+class SharedEmbeddingFunction(EmbeddingFunction):
+    """
+    Handle on a registry model. The model is loaded by the first call, or by a
+    warm-up, exactly once however many threads ask for it.
+    """
+
+    def __init__(self, registry: "EmbeddingModelRegistry", model_id: str):
+        self.registry = registry
+        self.model_id = model_id
+
+    def __call__(self, input):
+        return self.registry.load(self.model_id)(input)
+
+
+class EmbeddingModelRegistry:
+    """
+    Process-wide embedding models, shared by all the agents. Loading a model means
+    running it once, which downloads the weights if needed and creates the ONNX
+    session, so the first question does not pay for it.
+    """
+
+    def __init__(self):
+        self._factories: dict[str, Callable[[], EmbeddingFunction]] = {
+            DEFAULT_EMBEDDING_MODEL: embedding_functions.DefaultEmbeddingFunction
+        }
+        self._models: dict[str, EmbeddingFunction] = {}
+        self._lock = threading.Lock()
+        self._load_locks: dict[str, threading.Lock] = {}
+        self.stats: dict[str, EmbeddingModelStats] = {}
+
+    def register(self, model_id: str, factory: Callable[[], EmbeddingFunction]):
+        with self._lock:
+            self._factories[model_id] = factory
+
+    def get(self, model_id: str = DEFAULT_EMBEDDING_MODEL) -> SharedEmbeddingFunction:
+        if model_id not in self._factories:
+            raise KeyError(f"Unknown embedding model {model_id}")
+        return SharedEmbeddingFunction(self, model_id)
+
+    def is_loaded(self, model_id: str = DEFAULT_EMBEDDING_MODEL) -> bool:
+        return model_id in self._models
+
+    def load(self, model_id: str = DEFAULT_EMBEDDING_MODEL) -> EmbeddingFunction:
+        model = self._models.get(model_id)
+        if model is not None:
+            return model
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+        with load_lock:
+            if model_id in self._models:
+                return self._models[model_id]
+
+            start = time.perf_counter()
+            memory_before = current_rss_bytes()
+            model = self._factories[model_id]()
+            model(["warm up"])
+            self.stats[model_id] = EmbeddingModelStats(
+                model_id=model_id,
+                load_seconds=time.perf_counter() - start,
+                memory_bytes=current_rss_bytes() - memory_before,
+            )
+            self._models[model_id] = model
+
+        logger.info(
+            f"Loaded embedding model {model_id} in "
+            f"{self.stats[model_id].load_seconds:.2f}s "
+            f"(+{self.stats[model_id].memory_bytes / 2**20:.1f} MiB)"
+        )
+        return model
+
+    def warm_up(
+        self, model_id: str = DEFAULT_EMBEDDING_MODEL, background: bool = False
+    ) -> Optional[threading.Thread]:
+        """
+        Loads the model now, or in a daemon thread when `background` is set.
+        Callers that need the model before the thread is done wait for it.
+        """
+        if not background:
+            self.load(model_id)
+            return None
+        thread = threading.Thread(target=self.load, args=(model_id,), daemon=True)
+        thread.start()
+        return thread
+
+
+_default_registry = EmbeddingModelRegistry()
+
+
+def get_embedding_registry() -> EmbeddingModelRegistry:
+    """
+    Process-wide registry shared by all the agents.
+    """
+    return _default_registry
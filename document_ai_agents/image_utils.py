@@ -1,42 +1,196 @@
 import base64
 import io
 import math
+from typing import Optional
 
+import numpy as np
 import PIL.Image as Image
 import PIL.ImageDraw as ImageDraw
 import PIL.ImageFont as ImageFont
+from pydantic import BaseModel, Field
 
+from document_ai_agents.logger import logger
 
-def pil_image_to_base64_jpeg(rgb_image: Image):
-    # In-memory buffer for the JPEG image
+DEFAULT_JPEG_QUALITY = 75  # PIL's default
+
+
+class JpegEncodingOptions(BaseModel):
+    quality: int = Field(
+        DEFAULT_JPEG_QUALITY,
+        ge=1,
+        le=95,
+        description="JPEG quality, the highest one tried when searching for a budget.",
+    )
+    max_bytes: Optional[int] = Field(
+        None, gt=0, description="Byte budget of an encoded image, no limit if not set."
+    )
+    max_long_edge: Optional[int] = Field(
+        None, gt=0, description="Images are downscaled to fit this size in pixels."
+    )
+    min_quality: int = Field(30, ge=1, le=95)
+    min_long_edge: int = Field(
+        512, gt=0, description="Downscaling to meet `max_bytes` stops at this size."
+    )
+    grayscale: bool = Field(
+        False, description="Encode pages without color content as grayscale."
+    )
+
+    def cache_key(self) -> str:
+        return self.model_dump_json()
+
+
+class EncodedJpeg(BaseModel):
+    data: bytes
+    quality: int
+    width: int
+    height: int
+    grayscale: bool
+
+    @property
+    def n_bytes(self) -> int:
+        return len(self.data)
+
+
+def is_monochrome(image: Image, tolerance: int = 16, max_color_ratio=0.001) -> bool:
+    """
+    True when (almost) all pixels have equal channels, e.g. scanned text.
+    """
+    if image.mode in ("1", "L", "LA", "I", "F"):
+        return True
+
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((256, 256))
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    spread = pixels.max(axis=-1) - pixels.min(axis=-1)
+
+    return float(np.mean(spread > tolerance)) <= max_color_ratio
+
+
+def _save_jpeg(image: Image, quality: int) -> bytes:
     buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+
+def _largest_quality_within_budget(
+    image: Image, min_quality: int, max_quality: int, max_bytes: int
+) -> tuple[int, bytes]:
+    # JPEG size grows with quality, so binary search the best quality that fits
+    best = min_quality, _save_jpeg(image, min_quality)
+    if len(best[1]) > max_bytes:
+        return best
+
+    low, high = min_quality + 1, max_quality
+    while low <= high:
+        quality = (low + high) // 2
+        data = _save_jpeg(image, quality)
+        if len(data) <= max_bytes:
+            best = quality, data
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    return best
+
+
+def encode_jpeg(
+    image: Image, encoding_options: Optional[JpegEncodingOptions] = None
+) -> EncodedJpeg:
+    """
+    Encodes an image as JPEG. With `max_bytes`, the highest quality between
+    `min_quality` and `quality` that fits the budget is used, and the image is
+    progressively downscaled when even `min_quality` is too large.
+    """
+    options = encoding_options or JpegEncodingOptions()
+
+    grayscale = options.grayscale and is_monochrome(image)
+    image = image.convert("L" if grayscale else "RGB")
+
+    if options.max_long_edge and max(image.size) > options.max_long_edge:
+        image = image.copy()
+        image.thumbnail(
+            (options.max_long_edge, options.max_long_edge), Image.Resampling.LANCZOS
+        )
+
+    if options.max_bytes is None:
+        quality, data = options.quality, _save_jpeg(image, options.quality)
+    else:
+        quality, data = _largest_quality_within_budget(
+            image, options.min_quality, options.quality, options.max_bytes
+        )
+        while len(data) > options.max_bytes and max(image.size) > options.min_long_edge:
+            long_edge = max(options.min_long_edge, int(max(image.size) * 0.8))
+            image = image.copy()
+            image.thumbnail((long_edge, long_edge), Image.Resampling.LANCZOS)
+            quality, data = _largest_quality_within_budget(
+                image, options.min_quality, options.quality, options.max_bytes
+            )
+        if len(data) > options.max_bytes:
+            logger.warning(
+                f"Could not encode image within {options.max_bytes} bytes, "
+                f"got {len(data)} bytes at {image.size}"
+            )
+
+    return EncodedJpeg(
+        data=data,
+        quality=quality,
+        width=image.size[0],
+        height=image.size[1],
+        grayscale=grayscale,
+    )
+
+
+def summarize_encoded_sizes(sizes: list[int]) -> dict[str, float]:
+    if not sizes:
+        return {}
+    return {
+        "n_images": len(sizes),
+        "total_bytes": int(np.sum(sizes)),
+        "mean_bytes": float(np.mean(sizes)),
+        "p50_bytes": float(np.percentile(sizes, 50)),
+        "p95_bytes": float(np.percentile(sizes, 95)),
+        "max_bytes": int(np.max(sizes)),
+    }
+
+
+def pil_image_to_jpeg_bytes(
+    rgb_image: Image, encoding_options: Optional[JpegEncodingOptions] = None
+):
+    return encode_jpeg(rgb_image, encoding_options).data
+
 
-    # Save as JPEG
-    rgb_image.save(buffered, format="JPEG")
+def jpeg_bytes_to_base64(jpeg_bytes: bytes) -> str:
+    return base64.b64encode(jpeg_bytes).decode()
 
+
+def pil_image_to_base64_jpeg(
+    rgb_image: Image, encoding_options: Optional[JpegEncodingOptions] = None
+):
     # Encode as base64
-    img_str = base64.b64encode(buffered.getvalue()).decode()
+    img_str = jpeg_bytes_to_base64(pil_image_to_jpeg_bytes(rgb_image, encoding_options))
 
     return img_str
 
 
-def image_file_to_base64_jpeg(image_path: str) -> str:
+def image_file_to_jpeg_bytes(
+    image_path: str, encoding_options: Optional[JpegEncodingOptions] = None
+) -> bytes:
     """
-    Reads an image from disk, converts it to JPEG, and encodes it as a base64 string.
+    Reads an image from disk and converts it to JPEG.
     """
     # Open the image
     rgb_image = Image.open(image_path).convert("RGB")
 
-    # In-memory buffer for the JPEG image
-    buffered = io.BytesIO()
-
-    # Save as JPEG
-    rgb_image.save(buffered, format="JPEG")
+    return pil_image_to_jpeg_bytes(rgb_image, encoding_options)
 
-    # Encode as base64
-    img_str = base64.b64encode(buffered.getvalue()).decode()
 
-    return img_str
+def image_file_to_base64_jpeg(
+    image_path: str, encoding_options: Optional[JpegEncodingOptions] = None
+) -> str:
+    """
+    Reads an image from disk, converts it to JPEG, and encodes it as a base64 string.
+    """
+    return jpeg_bytes_to_base64(image_file_to_jpeg_bytes(image_path, encoding_options))
 
 
 def base64_to_pil_image(base64_string: str):
@@ -52,6 +206,46 @@ def base64_to_pil_image(base64_string: str):
     return pil_image
 
 
+def normalize_bounding_box(box) -> Optional[list[float]]:
+    """
+    Validates a [ymin, xmin, ymax, xmax] box in the normalized convention of
+    `draw_bounding_box_on_image`. Boxes on a 0-1000 scale, which Gemini often
+    returns, are rescaled. Fractions slightly outside [0, 1] are clamped. Returns
+    None for anything that is not a box.
+    """
+    if not isinstance(box, (list, tuple)) or len(box) != 4:
+        return None
+    try:
+        box = [float(x) for x in box]
+    except (TypeError, ValueError):
+        return None
+    # Fractions may overshoot 1 a little, values above 2 are on the 0-1000 scale
+    if max(box) > 2:
+        box = [x / 1000 for x in box]
+    box = [min(max(x, 0.0), 1.0) for x in box]
+    ymin, xmin, ymax, xmax = box
+    if ymin >= ymax or xmin >= xmax:
+        return None
+    return box
+
+
+def crop_normalized_box(image: Image, box: list[float], padding: float = 0.0) -> Image:
+    """
+    Crops a normalized [ymin, xmin, ymax, xmax] box, grown by `padding` (a
+    fraction of the image size) on each side to keep item edges.
+    """
+    width, height = image.size
+    ymin, xmin, ymax, xmax = box
+    return image.crop(
+        (
+            int(max(xmin - padding, 0) * width),
+            int(max(ymin - padding, 0) * height),
+            math.ceil(min(xmax + padding, 1) * width),
+            math.ceil(min(ymax + padding, 1) * height),
+        )
+    )
+
+
 def draw_bounding_box_on_image(
     image,
     ymin,
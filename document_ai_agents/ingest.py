@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Literal, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from document_ai_agents.document_parsing_agent import (
+    DocumentLayoutParsingState,
+    DocumentParsingAgent,
+    TextLayerOptions,
+)
+from document_ai_agents.document_rag_agent import DocumentRAGAgent
+from document_ai_agents.document_utils import RenderOptions
+from document_ai_agents.embedding_cache import EmbeddingOptions
+from document_ai_agents.embedding_registry import get_embedding_registry
+from document_ai_agents.image_utils import JpegEncodingOptions
+from document_ai_agents.layout_cache import LayoutResultCache
+from document_ai_agents.logger import logger
+from document_ai_agents.page_cache import hash_file
+from document_ai_agents.page_filters import PageFilterOptions
+from document_ai_agents.page_manifest import ManifestStore
+from document_ai_agents.page_store import MmapPageStore
+from document_ai_agents.rate_limiter import RequestScheduler, SchedulerOptions
+
+
+class IngestionRecord(BaseModel):
+    document_path: str
+    file_hash: str
+    status: Literal["done", "failed"]
+    n_pages: int = 0
+    n_indexed_documents: int = 0
+    n_removed_documents: int = 0
+    n_reused_documents: int = 0
+    latency: float = 0.0
+    error: Optional[str] = None
+
+
+class IngestionJournal:
+    """
+    Append-only JSONL log of ingested documents. The last record of each document
+    wins, so a restarted run skips documents that were ingested and have not changed
+    since, and retries the failed ones.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.records: dict[str, IngestionRecord] = {}
+        if self.path.is_file():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = IngestionRecord.model_validate_json(line)
+                    except ValueError:  # Line cut short by a crash
+                        continue
+                    self.records[record.document_path] = record
+
+    def is_done(self, document_path: str, file_hash: str) -> bool:
+        record = self.records.get(document_path)
+        return (
+            record is not None
+            and record.status == "done"
+            and record.file_hash == file_hash
+        )
+
+    def append(self, record: IngestionRecord):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(record.model_dump_json() + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.records[record.document_path] = record
+
+
+def find_pdfs(inputs: list[str]) -> list[str]:
+    """
+    Expands directories (recursively) and manifest files listing one path per line
+    into a deduplicated list of PDF paths.
+    """
+    paths = []
+    for input_path in map(Path, inputs):
+        if input_path.is_dir():
+            paths += sorted(input_path.rglob("*.pdf"))
+        elif input_path.suffix.lower() == ".pdf":
+            paths.append(input_path)
+        else:
+            with open(input_path) as f:
+                paths += [Path(line.strip()) for line in f if line.strip()]
+    return list(dict.fromkeys(str(path.resolve()) for path in paths))
+
+
+def summarize_latencies(latencies: list[float]) -> dict[str, float]:
+    if not latencies:
+        return {}
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {"p50": p50, "p90": p90, "p99": p99, "max": max(latencies)}
+
+
+def plan_ingestion(
+    document_paths: list[str], journal: IngestionJournal
+) -> tuple[list[tuple[str, str]], int, list[IngestionRecord]]:
+    """
+    Splits the documents into those to ingest, with their hash, and the number of
+    unchanged ones to skip. Files that cannot be read get a failed record instead
+    of aborting the run.
+    """
+    pending = []
+    n_skipped = 0
+    unreadable = []
+    for document_path in document_paths:
+        try:
+            file_hash = hash_file(document_path)
+        except OSError as e:
+            logger.error(f"Cannot read {document_path}: {e}")
+            unreadable.append(
+                IngestionRecord(
+                    document_path=document_path,
+                    file_hash="",
+                    status="failed",
+                    error=f"{type(e).__name__}: {e}",
+                )
+            )
+            continue
+        if journal.is_done(document_path, file_hash):
+            n_skipped += 1
+        else:
+            pending.append((document_path, file_hash))
+    return pending, n_skipped, unreadable
+
+
+def ingest_document(
+    document_path: str,
+    file_hash: str,
+    parsing_agent: DocumentParsingAgent,
+    rag_agent: DocumentRAGAgent,
+    index_lock: threading.Lock,
+) -> IngestionRecord:
+    start = time.perf_counter()
+    try:
+        result = parsing_agent.graph.invoke(
+            DocumentLayoutParsingState(document_path=document_path)
+        )
+        # The parsing agent runs in incremental mode, so only changes are indexed
+        with index_lock:
+            rag_agent.apply_document_deltas(
+                result["added_documents"], result["removed_documents"]
+            )
+        parsing_agent.commit_manifest(result["manifest"])
+    except Exception as e:
+        logger.exception(f"Failed to ingest {document_path}")
+        return IngestionRecord(
+            document_path=document_path,
+            file_hash=file_hash,
+            status="failed",
+            latency=time.perf_counter() - start,
+            error=f"{type(e).__name__}: {e}",
+        )
+
+    failed_page_numbers = result["failed_page_numbers"]
+    return IngestionRecord(
+        document_path=document_path,
+        file_hash=file_hash,
+        # Failed pages are not in the manifest, the next run parses only them
+        status="failed" if failed_page_numbers else "done",
+        n_pages=len(result["page_fingerprints"]),
+        n_indexed_documents=len(result["added_documents"]),
+        n_removed_documents=len(result["removed_documents"]),
+        # Documents of unchanged pages, kept in the index from an earlier run
+        n_reused_documents=len(result["documents"]) - len(result["added_documents"]),
+        latency=time.perf_counter() - start,
+        error=f"Failed pages: {failed_page_numbers}" if failed_page_numbers else None,
+    )
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Parse PDFs and index them in a persistent RAG vector store."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="PDF files, directories searched recursively, or text files listing one "
+        "PDF path per line.",
+    )
+    parser.add_argument(
+        "--state-dir",
+        default="ingest_state",
+        help="Holds the journal, manifests, page images, layout and embedding caches "
+        "and the vector store.",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--model-name", default="gemini-1.5-flash-002")
+    parser.add_argument("--collection-name", default="document-rag")
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--pages-per-request", type=int, default=1)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument(
+        "--embedding-batch-size", type=int, default=32, help="Texts per embedding call."
+    )
+    parser.add_argument(
+        "--embedding-workers",
+        type=int,
+        default=1,
+        help="Embedding batches computed concurrently.",
+    )
+    parser.add_argument("--requests-per-minute", type=int, default=None)
+    parser.add_argument("--tokens-per-minute", type=int, default=None)
+    parser.add_argument(
+        "--max-image-bytes", type=int, default=400_000, help="JPEG size budget."
+    )
+    parser.add_argument(
+        "--text-layer",
+        action="store_true",
+        help="Use the PDF text layer of text-only pages instead of a vision call.",
+    )
+    parser.add_argument(
+        "--filter-pages",
+        action="store_true",
+        help="Skip blank pages and reuse the layout of duplicate pages.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None):
+    args = parse_args(argv)
+    state_dir = Path(args.state_dir)
+    # The model loads while the first documents are parsed
+    get_embedding_registry().warm_up(background=True)
+
+    document_paths = find_pdfs(args.inputs)
+    journal = IngestionJournal(str(state_dir / "journal.jsonl"))
+    page_store = MmapPageStore(str(state_dir / "pages.bin"))
+
+    parsing_agent = DocumentParsingAgent(
+        model_name=args.model_name,
+        render_options=RenderOptions(dpi=args.dpi),
+        encoding_options=JpegEncodingOptions(max_bytes=args.max_image_bytes),
+        text_layer_options=TextLayerOptions() if args.text_layer else None,
+        page_store=page_store,
+        page_filter_options=PageFilterOptions() if args.filter_pages else None,
+        scheduler=RequestScheduler(
+            SchedulerOptions(
+                max_in_flight=args.max_in_flight,
+                requests_per_minute=args.requests_per_minute,
+                tokens_per_minute=args.tokens_per_minute,
+            )
+        ),
+        pages_per_request=args.pages_per_request,
+        layout_cache=LayoutResultCache(str(state_dir / "layouts.sqlite")),
+        manifest_store=ManifestStore(str(state_dir / "manifests")),
+    )
+    rag_agent = DocumentRAGAgent(
+        page_store=page_store,
+        collection_name=args.collection_name,
+        persist_directory=str(state_dir / "chroma"),
+        embedding_options=EmbeddingOptions(
+            batch_size=args.embedding_batch_size,
+            workers=args.embedding_workers,
+            cache_dir=str(state_dir / "embeddings"),
+        ),
+    )
+    index_lock = threading.Lock()
+
+    pending, n_skipped, records = plan_ingestion(document_paths, journal)
+    for record in records:
+        journal.append(record)
+    logger.info(
+        f"Ingesting {len(pending)} documents, skipping {n_skipped} unchanged ones "
+        f"and {len(records)} unreadable ones."
+    )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(
+                ingest_document,
+                document_path,
+                file_hash,
+                parsing_agent,
+                rag_agent,
+                index_lock,
+            )
+            for document_path, file_hash in pending
+        ]
+        for i, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            journal.append(record)
+            records.append(record)
+            logger.info(
+                f"[{i}/{len(pending)}] {record.status} {record.document_path} "
+                f"in {record.latency:.2f}s"
+            )
+    duration = time.perf_counter() - start
+    page_store.close()
+
+    done = [record for record in records if record.status == "done"]
+    n_pages = sum(record.n_pages for record in records)
+    summary = {
+        "documents": len(document_paths),
+        "ingested": len(done),
+        "failed": len(records) - len(done),
+        "skipped": n_skipped,
+        "pages": n_pages,
+        "indexed_documents": sum(record.n_indexed_documents for record in records),
+        "removed_documents": sum(record.n_removed_documents for record in records),
+        "reused_documents": sum(record.n_reused_documents for record in records),
+        "duration_s": round(duration, 2),
+        "documents_per_s": round(len(records) / max(duration, 1e-6), 3),
+        "pages_per_s": round(n_pages / max(duration, 1e-6), 3),
+        "latency_s": {
+            key: round(value, 2)
+            for key, value in summarize_latencies(
+                [record.latency for record in records]
+            ).items()
+        },
+        "model_requests": parsing_agent.scheduler.stats,
+        "embedding_models": {
+            model_id: stats.model_dump(exclude={"model_id"})
+            for model_id, stats in get_embedding_registry().stats.items()
+        },
+    }
+    print(json.dumps(summary, indent=2))
+
+    for record in records:
+        if record.status == "failed":
+            print(f"FAILED {record.document_path}: {record.error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from document_ai_agents.logger import logger
+
+DEFAULT_LAYOUT_CACHE_PATH = (
+    Path.home() / ".cache" / "document_ai_agents" / "layouts.sqlite"
+)
+
+
+class LayoutResultCache:
+    """
+    SQLite store of the layout items extracted from each page. Entries are keyed by
+    the page image hash, the model name and a hash of the prompt and response schema,
+    so changing any of them parses the page again. The least recently used entries
+    are evicted once there are more than `max_entries`.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 100_000):
+        self.path = Path(path) if path else DEFAULT_LAYOUT_CACHE_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # Graph nodes run in a thread pool, the lock serializes access instead
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS layouts ("
+                "key TEXT PRIMARY KEY, model_name TEXT, layout_items TEXT, "
+                "last_used REAL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS layouts_last_used ON layouts (last_used)"
+            )
+        self._n_entries = len(self)
+
+    @staticmethod
+    def make_key(page_key: str, model_name: str, prompt: str, schema: dict) -> str:
+        prompt_hash = hashlib.sha256(
+            (prompt + json.dumps(schema, sort_keys=True)).encode()
+        ).hexdigest()
+        return hashlib.sha256(
+            f"{page_key}:{model_name}:{prompt_hash}".encode()
+        ).hexdigest()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM layouts").fetchone()[
+                0
+            ]
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM layouts WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, key: str) -> Optional[list[dict]]:
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT layout_items FROM layouts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE layouts SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+        return json.loads(row[0])
+
+    def put(self, key: str, layout_items: list[dict], model_name: str = ""):
+        with self._lock, self._connection:
+            is_new = (
+                self._connection.execute(
+                    "SELECT 1 FROM layouts WHERE key = ?", (key,)
+                ).fetchone()
+                is None
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO layouts VALUES (?, ?, ?, ?)",
+                (key, model_name, json.dumps(layout_items), time.time()),
+            )
+            self._n_entries += is_new
+            if self._n_entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        n_evicted = self._n_entries - self.max_entries
+        self._connection.execute(
+            "DELETE FROM layouts WHERE key IN "
+            "(SELECT key FROM layouts ORDER BY last_used LIMIT ?)",
+            (n_evicted,),
+        )
+        self._n_entries -= n_evicted
+        logger.info(f"Evicted {n_evicted} layout cache entries")
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM layouts")
+            self._n_entries = 0
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,147 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Callable, Optional
+
+from langchain_core.documents import Document
+from pydantic import BaseModel, Field
+
+# Identifiers like "M-RCNN", "Fig. 3.2" or "0.708" are kept whole
+TOKEN_PATTERN = re.compile(r"\w+(?:[.\-/]\w+)*")
+
+
+class HybridSearchOptions(BaseModel):
+    n_candidates: int = Field(
+        20, gt=0, description="Results taken from each retriever before fusion."
+    )
+    rrf_k: int = Field(
+        60, gt=0, description="Reciprocal rank fusion constant, damps top ranks."
+    )
+    k1: float = Field(1.5, description="BM25 term frequency saturation.")
+    b: float = Field(0.75, description="BM25 document length normalization.")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased word tokens. Compound tokens are also split into their parts so
+    "M-RCNN" matches both "M-RCNN" and "RCNN".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[.\-/]", token)
+        if len(parts) > 1:
+            tokens += parts
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory inverted index scored with Okapi BM25. Documents are added and
+    deleted by id without rebuilding, and IDF and average length are derived from
+    running counts at query time.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[str, int]] = defaultdict(dict)
+        self._doc_terms: dict[str, Counter] = {}
+        self._documents: dict[str, Document] = {}
+        self._lengths: dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, id_: str) -> bool:
+        return id_ in self._documents
+
+    def get(self, id_: str) -> Document:
+        return self._documents[id_]
+
+    def add(self, ids: list[str], documents: list[Document]):
+        with self._lock:
+            for id_, document in zip(ids, documents):
+                if id_ in self._documents:
+                    self._remove(id_)
+                terms = Counter(tokenize(document.page_content))
+                for term, count in terms.items():
+                    self._postings[term][id_] = count
+                self._doc_terms[id_] = terms
+                self._documents[id_] = document
+                self._lengths[id_] = sum(terms.values())
+                self._total_length += self._lengths[id_]
+
+    def delete(self, ids: list[str]):
+        with self._lock:
+            for id_ in ids:
+                if id_ in self._documents:
+                    self._remove(id_)
+
+    def _remove(self, id_: str):
+        terms = self._doc_terms.pop(id_)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[id_]
+            if not postings:
+                del self._postings[term]
+        del self._documents[id_]
+        self._total_length -= self._lengths.pop(id_)
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        predicate: Optional[Callable[[Document], bool]] = None,
+    ) -> list[tuple[str, float]]:
+        """
+        Returns the ids and scores of the `k` best matches, among the documents
+        accepted by `predicate` when it is given.
+        """
+        with self._lock:
+            n_documents = len(self._documents)
+            if not n_documents:
+                return []
+            average_length = self._total_length / n_documents or 1
+
+            scores: dict[str, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(
+                    1 + (n_documents - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+                for id_, count in postings.items():
+                    norm = self.k1 * (
+                        1 - self.b + self.b * self._lengths[id_] / average_length
+                    )
+                    scores[id_] += idf * count * (self.k1 + 1) / (count + norm)
+
+            if predicate is not None:
+                scores = {
+                    id_: score
+                    for id_, score in scores.items()
+                    if predicate(self._documents[id_])
+                }
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[str]], rrf_k: int = 60
+) -> list[tuple[str, float]]:
+    """
+    Merges ranked id lists: each id scores the sum of 1 / (rrf_k + rank) over the
+    lists it appears in. Only ranks are used, so BM25 and cosine scores need no
+    calibration.
+    """
+    scores: dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] += 1 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
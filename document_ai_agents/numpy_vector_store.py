@@ -0,0 +1,350 @@
+import json
+import operator
+import threading
+import uuid
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Iterable, Literal, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from pydantic import BaseModel, Field
+
+from document_ai_agents.logger import logger
+
+SCORE_CHUNK_ROWS = 65_536
+
+WHERE_OPERATORS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+class VectorIndexOptions(BaseModel):
+    backend: Literal["auto", "numpy", "chroma"] = Field(
+        "auto",
+        description="'auto' uses the NumPy store until the collection grows past "
+        "`max_numpy_size`, then moves it to Chroma.",
+    )
+    dtype: Literal["float16", "int8"] = Field(
+        "float16", description="Storage type of the NumPy store vectors."
+    )
+    max_numpy_size: int = Field(5_000, gt=0)
+
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """Evaluates the subset of Chroma `where` clauses used by the agents."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                try:
+                    if not WHERE_OPERATORS[op](value, operand):
+                        return False
+                except TypeError:  # Missing value compared with a number
+                    return False
+    return True
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the stored rows and their scales. int8 rows are scaled per row so their
+    largest component maps to 127, float16 rows keep a scale of 1.
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    rows = np.round(vectors / scales[:, None]).astype(np.int8)
+    return rows, scales.astype(np.float32)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact cosine search over a quantized matrix, for collections small enough that
+    a brute force matrix product beats maintaining an HNSW index.
+
+    With a `path`, rows are appended to `vectors.bin` (memory-mapped for search),
+    `scales.f32` and `records.jsonl`, and loaded back by the next instance. Deleted
+    rows are masked, not reclaimed. The read and write API mirrors the part of
+    Chroma's that `DocumentRAGAgent` uses.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        path: Optional[str] = None,
+        dtype: Literal["float16", "int8"] = "float16",
+    ):
+        self.embedding = embedding
+        self.path = Path(path) if path else None
+        self.dtype = dtype
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._ids: list[Optional[str]] = []  # Row to id, None once deleted
+        self._rows: dict[str, int] = {}
+        self._records: dict[str, tuple[str, dict]] = {}
+        self._matrix = None
+        self._scales = np.zeros(0, dtype=np.float32)
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load(self):
+        meta_path = self.path / "meta.json"
+        if not meta_path.is_file():
+            return
+        meta = json.loads(meta_path.read_text())
+        self.dim, self.dtype = meta["dim"], meta["dtype"]
+        n_rows = self._n_rows_on_disk()
+        records_path = self.path / "records.jsonl"
+        with open(records_path) if records_path.is_file() else nullcontext([]) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # Line cut short by a crash
+                    continue
+                if record.get("deleted"):
+                    self._forget(record["id"])
+                elif record["row"] < n_rows:
+                    self._forget(record["id"])
+                    self._remember(
+                        record["id"],
+                        record["row"],
+                        record["page_content"],
+                        record["metadata"],
+                    )
+        self._remap()
+        logger.info(f"Loaded {len(self)} vectors from {self.path}")
+
+    def _n_rows_on_disk(self) -> int:
+        vectors_path, scales_path = self.path / "vectors.bin", self.path / "scales.f32"
+        if not vectors_path.is_file() or not scales_path.is_file():
+            return 0
+        row_bytes = self.dim * np.dtype(self.dtype).itemsize
+        return min(
+            vectors_path.stat().st_size // row_bytes, scales_path.stat().st_size // 4
+        )
+
+    def _remap(self):
+        n_rows = self._n_rows_on_disk()
+        if n_rows:
+            self._matrix = np.memmap(
+                self.path / "vectors.bin",
+                dtype=self.dtype,
+                mode="r",
+                shape=(n_rows, self.dim),
+            )
+            self._scales = np.fromfile(
+                self.path / "scales.f32", dtype=np.float32, count=n_rows
+            )
+        self._ids += [None] * (n_rows - len(self._ids))
+
+    def _remember(self, id_: str, row: int, page_content: str, metadata: dict):
+        self._ids += [None] * (row + 1 - len(self._ids))
+        self._ids[row] = id_
+        self._rows[id_] = row
+        self._records[id_] = (page_content, metadata)
+
+    def _forget(self, id_: str):
+        row = self._rows.pop(id_, None)
+        if row is not None:
+            self._ids[row] = None
+            del self._records[id_]
+
+    def _append_rows(self, rows: np.ndarray, scales: np.ndarray) -> int:
+        offset = len(self._ids)
+        if self.path is None:
+            self._matrix = (
+                rows if self._matrix is None else np.concatenate([self._matrix, rows])
+            )
+            self._scales = np.concatenate([self._scales, scales])
+            return offset
+
+        # Vectors are written before their records, so a record always has its row
+        for name, data in [("vectors.bin", rows), ("scales.f32", scales)]:
+            with open(self.path / name, "ab") as f:
+                f.truncate(offset * data[0].nbytes)  # Drop a partially written row
+                f.write(data.tobytes())
+        return offset
+
+    def _write_records(self, records: list[dict]):
+        if self.path is not None and records:
+            with open(self.path / "records.jsonl", "a") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        rows, scales = quantize(vectors / np.maximum(norms, 1e-12), self.dtype)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                if self.path is not None:
+                    (self.path / "meta.json").write_text(
+                        json.dumps({"dim": self.dim, "dtype": self.dtype})
+                    )
+            offset = self._append_rows(rows, scales)
+            records = []
+            for row, (id_, text, metadata) in enumerate(
+                zip(ids, texts, metadatas), start=offset
+            ):
+                self._forget(id_)
+                self._remember(id_, row, text, metadata)
+                records.append(
+                    {"id": id_, "row": row, "page_content": text, "metadata": metadata}
+                )
+            self._write_records(records)
+            if self.path is not None:
+                self._remap()
+        return ids
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any):
+        with self._lock:
+            deleted = [id_ for id_ in ids or [] if id_ in self._rows]
+            for id_ in deleted:
+                self._forget(id_)
+            self._write_records([{"id": id_, "deleted": True} for id_ in deleted])
+
+    def get(
+        self,
+        ids: Optional[list[str]] = None,
+        where: Optional[dict] = None,
+        include: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> dict[str, list]:
+        with self._lock:
+            selected = [
+                id_
+                for id_ in (ids if ids is not None else list(self._rows))
+                if id_ in self._records and matches_where(self._records[id_][1], where)
+            ]
+            return {
+                "ids": selected,
+                "documents": [self._records[id_][0] for id_ in selected],
+                "metadatas": [self._records[id_][1] for id_ in selected],
+            }
+
+    def query(
+        self,
+        query_embeddings: list[list[float]],
+        n_results: int = 4,
+        where: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> dict[str, list]:
+        """Top `n_results` rows by cosine similarity for each query, Chroma style."""
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            candidates = np.asarray(
+                [
+                    row
+                    for row, id_ in enumerate(self._ids)
+                    if id_ is not None
+                    and (where is None or matches_where(self._records[id_][1], where))
+                ],
+                dtype=np.int64,
+            )
+            matrix, scales, ids = self._matrix, self._scales, list(self._ids)
+            records = dict(self._records)
+
+        if not len(candidates):
+            empty = [[] for _ in queries]
+            return {
+                "ids": empty,
+                "documents": empty,
+                "metadatas": empty,
+                "distances": empty,
+            }
+
+        if len(candidates) == len(ids):
+            # Chunks bound the float32 copy of a large memory-mapped matrix
+            scores = np.vstack(
+                [
+                    matrix[start : start + SCORE_CHUNK_ROWS].astype(np.float32)
+                    @ queries.T
+                    for start in range(0, len(ids), SCORE_CHUNK_ROWS)
+                ]
+            )
+            scores *= scales[: len(ids), None]
+        else:
+            scores = matrix[candidates].astype(np.float32) @ queries.T
+            scores *= scales[candidates, None]
+
+        n_results = min(n_results, len(candidates))
+        top = np.argpartition(-scores, n_results - 1, axis=0)[:n_results]
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for i in range(len(queries)):
+            order = top[np.argsort(-scores[top[:, i], i]), i]
+            result_ids = [ids[candidates[j]] for j in order]
+            results["ids"].append(result_ids)
+            results["documents"].append([records[id_][0] for id_ in result_ids])
+            results["metadatas"].append([records[id_][1] for id_ in result_ids])
+            results["distances"].append((1 - scores[order, i]).tolist())
+        return results
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[Document]:
+        results = self.query([self.embedding.embed_query(query)], k, where=filter)
+        return [
+            Document(page_content=content, metadata=metadata)
+            for content, metadata in zip(
+                results["documents"][0], results["metadatas"][0]
+            )
+        ]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(
+            embedding,
+            path=kwargs.pop("path", None),
+            dtype=kwargs.pop("dtype", "float16"),
+        )
+        store.add_texts(texts, metadatas, **kwargs)
+        return store
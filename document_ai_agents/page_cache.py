@@ -0,0 +1,180 @@
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Iterator, Optional
+
+from document_ai_agents.document_utils import (
+    RenderOptions,
+    extract_images_from_pdf,
+    iter_images_from_pdf,
+    resolve_page_numbers,
+)
+from document_ai_agents.image_utils import JpegEncodingOptions, pil_image_to_jpeg_bytes
+from document_ai_agents.logger import logger
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "document_ai_agents" / "pages"
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class PageImageCache:
+    """
+    Content-addressed store of encoded page images on disk. Entries are keyed by the
+    PDF content hash, the page number and the rendering/encoding settings, and the
+    least recently used ones are evicted once the cache grows past `max_size_bytes`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_size_bytes: int = 2 * 1024**3,
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self._size_bytes = sum(f.stat().st_size for f in self._entries())
+
+    @staticmethod
+    def make_key(
+        pdf_hash: str,
+        page_number: int,
+        dpi: int,
+        encoding_options: Optional[JpegEncodingOptions] = None,
+    ) -> str:
+        encoding_key = (encoding_options or JpegEncodingOptions()).cache_key()
+        return hashlib.sha256(
+            f"{pdf_hash}:{page_number}:{dpi}:{encoding_key}".encode()
+        ).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.jpg"
+
+    def _entries(self) -> list[Path]:
+        return list(self.cache_dir.glob("*/*.jpg"))
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see partial data
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+            f.write(data)
+        previous_size = path.stat().st_size if path.is_file() else 0
+        os.replace(f.name, path)
+
+        with self._lock:
+            self._size_bytes += len(data) - previous_size
+            if self._size_bytes > self.max_size_bytes:
+                self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((entry.stat().st_mtime, entry.stat().st_size, entry))
+            except FileNotFoundError:
+                continue
+        size_bytes = sum(size for _, size, _ in entries)
+
+        n_evicted = 0
+        for _, size, entry in sorted(entries):
+            if size_bytes <= self.max_size_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            size_bytes -= size
+            n_evicted += 1
+
+        self._size_bytes = size_bytes
+        logger.info(f"Evicted {n_evicted} page images from the cache")
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries():
+                entry.unlink(missing_ok=True)
+            self._size_bytes = 0
+
+
+def iter_pdf_pages_as_jpeg(
+    pdf_path: str,
+    render_options: Optional[RenderOptions] = None,
+    cache: Optional[PageImageCache] = None,
+    encoding_options: Optional[JpegEncodingOptions] = None,
+) -> Iterator[tuple[int, bytes]]:
+    """
+    Yields (page_number, jpeg_bytes) in page order. Pages found in the cache are read
+    from disk and only the missing ones are rendered, so a repeated run on an
+    unchanged document does not start poppler at all.
+    """
+    render_options = render_options or RenderOptions()
+    page_numbers = resolve_page_numbers(pdf_path, render_options.page_numbers)
+
+    if cache is None:
+        images = iter_images_from_pdf(pdf_path, render_options)
+        for page_number, image in zip(page_numbers, images):
+            yield page_number, pil_image_to_jpeg_bytes(image, encoding_options)
+        return
+
+    pdf_hash = hash_file(pdf_path)
+    keys = {
+        page_number: cache.make_key(
+            pdf_hash, page_number, render_options.dpi, encoding_options
+        )
+        for page_number in page_numbers
+    }
+    missing_page_numbers = [x for x in page_numbers if keys[x] not in cache]
+    logger.info(
+        f"Found {len(page_numbers) - len(missing_page_numbers)}/{len(page_numbers)} "
+        f"pages of {pdf_path} in the page cache"
+    )
+
+    rendered_images = iter(())
+    if missing_page_numbers:
+        rendered_images = iter_images_from_pdf(
+            pdf_path,
+            render_options.model_copy(update={"page_numbers": missing_page_numbers}),
+        )
+    missing_page_numbers = set(missing_page_numbers)
+
+    for page_number in page_numbers:
+        data = None
+        if page_number not in missing_page_numbers:
+            data = cache.get(keys[page_number])
+        if data is None:
+            if page_number in missing_page_numbers:
+                # Missing pages are rendered in order, so the next one is this page
+                image = next(rendered_images)
+            else:  # Evicted since the lookup
+                (image,) = extract_images_from_pdf(
+                    pdf_path,
+                    render_options.model_copy(update={"page_numbers": [page_number]}),
+                )
+            data = pil_image_to_jpeg_bytes(image, encoding_options)
+            cache.put(keys[page_number], data)
+        yield page_number, data
@@ -0,0 +1,100 @@
+import io
+
+import numpy as np
+import PIL.Image as Image
+from pydantic import BaseModel, Field
+
+THUMBNAIL_SIZE = 128
+
+
+class PageFilterOptions(BaseModel):
+    ink_threshold: int = Field(
+        48, description="Gray level difference from the background counted as ink."
+    )
+    max_ink_ratio: float = Field(
+        0.002, description="Pages with a smaller share of ink pixels are blank."
+    )
+    hash_size: int = Field(16, description="Side of the average hash grid.")
+    max_hash_distance: int = Field(
+        8, description="Pages whose hashes differ by more bits are never duplicates."
+    )
+    max_mean_abs_diff: float = Field(
+        4.0,
+        description="Maximum mean gray level difference between the thumbnails of "
+        "two pages confirmed as duplicates.",
+    )
+
+
+def jpeg_to_thumbnail(jpeg_bytes: bytes, size: int = THUMBNAIL_SIZE) -> np.ndarray:
+    image = Image.open(io.BytesIO(jpeg_bytes))
+    image.draft("L", (size, size))  # Lets the JPEG decoder skip most of the work
+    image = image.convert("L").resize((size, size), Image.Resampling.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
+
+
+def find_blank_pages(
+    thumbnails: np.ndarray, ink_threshold: int = 48, max_ink_ratio: float = 0.002
+) -> np.ndarray:
+    """
+    Flags pages of a (n_pages, height, width) grayscale stack that are almost only
+    background. The background is each page's median gray level, so tinted or
+    scanned paper is still detected as blank.
+    """
+    pixels = thumbnails.reshape(len(thumbnails), -1).astype(np.int16)
+    background = np.median(pixels, axis=1, keepdims=True)
+    ink_ratio = np.mean(np.abs(pixels - background) > ink_threshold, axis=1)
+    return ink_ratio <= max_ink_ratio
+
+
+def average_hashes(thumbnails: np.ndarray, hash_size: int = 16) -> np.ndarray:
+    """
+    Packed average hashes of a (n_pages, size, size) grayscale stack: one bit per
+    cell of a `hash_size` grid, set when the cell is brighter than the page mean.
+    Unlike gradient based hashes, large uniform areas of paper give stable bits.
+    """
+    n_pages, size, _ = thumbnails.shape
+    block = size // hash_size
+    pooled = (
+        thumbnails[:, : hash_size * block, : hash_size * block]
+        .reshape(n_pages, hash_size, block, hash_size, block)
+        .mean(axis=(2, 4))
+    )
+    bits = pooled > pooled.mean(axis=(1, 2), keepdims=True)
+    return np.packbits(bits.reshape(n_pages, -1), axis=1)
+
+
+def hamming_distances(hashes: np.ndarray) -> np.ndarray:
+    xor = np.bitwise_xor(hashes[:, None, :], hashes[None, :, :])
+    return np.unpackbits(xor, axis=2).sum(axis=2)
+
+
+def find_duplicate_pages(
+    thumbnails: np.ndarray,
+    hash_size: int = 16,
+    max_hash_distance: int = 8,
+    max_mean_abs_diff: float = 4.0,
+) -> dict[int, int]:
+    """
+    Maps the index of each near-duplicate page to the index of the first page it
+    duplicates. Perceptual hashes select candidates and a pixel comparison of the
+    thumbnails confirms them, as similar layouts with different text can share a
+    hash.
+    """
+    if len(thumbnails) < 2:  # Nothing to compare, e.g. when every page is blank
+        return {}
+    distances = hamming_distances(average_hashes(thumbnails, hash_size))
+    pixels = thumbnails.reshape(len(thumbnails), -1).astype(np.float32)
+
+    duplicates = {}
+    for i in range(1, len(thumbnails)):
+        candidates = [
+            j
+            for j in np.flatnonzero(distances[i, :i] <= max_hash_distance)
+            if j not in duplicates
+        ]
+        for j in candidates:
+            if np.mean(np.abs(pixels[i] - pixels[j])) <= max_mean_abs_diff:
+                duplicates[i] = int(j)
+                break
+
+    return duplicates
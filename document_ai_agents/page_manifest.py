@@ -0,0 +1,110 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from langchain_core.documents import Document
+from pydantic import BaseModel, Field
+
+DEFAULT_MANIFEST_DIR = Path.home() / ".cache" / "document_ai_agents" / "manifests"
+
+
+class PageRecord(BaseModel):
+    page_number: int
+    fingerprint: str
+    page_key: Optional[str] = Field(
+        None, description="Page store key of the rendered page, if it was rendered."
+    )
+    documents: list[Document] = Field(default_factory=list)
+
+
+class DocumentManifest(BaseModel):
+    document_path: str
+    pages: list[PageRecord] = Field(default_factory=list)
+
+    def pages_by_fingerprint(self) -> dict[str, PageRecord]:
+        return {page.fingerprint: page for page in self.pages}
+
+
+class PageDiff(BaseModel):
+    changed_page_numbers: list[int] = Field(
+        default_factory=list, description="New or edited pages that need parsing."
+    )
+    reused_pages: dict[int, PageRecord] = Field(
+        default_factory=dict,
+        description="Pages whose content was already parsed, possibly at another "
+        "page number in the previous version.",
+    )
+
+
+def diff_pages(
+    fingerprints: dict[int, str], manifest: Optional[DocumentManifest]
+) -> PageDiff:
+    previous_pages = manifest.pages_by_fingerprint() if manifest else {}
+    diff = PageDiff()
+    for page_number, fingerprint in sorted(fingerprints.items()):
+        if fingerprint in previous_pages:
+            diff.reused_pages[page_number] = previous_pages[fingerprint]
+        else:
+            diff.changed_page_numbers.append(page_number)
+    return diff
+
+
+def manifest_deltas(
+    previous: Optional[DocumentManifest], current: DocumentManifest
+) -> tuple[list[Document], list[Document]]:
+    """
+    Returns the documents to add and to remove to go from the previous version of a
+    document to the current one. Pages that kept both their content and their page
+    number are left alone.
+    """
+    previous_pages = previous.pages if previous else []
+    previous_ids = {(page.page_number, page.fingerprint) for page in previous_pages}
+    current_ids = {(page.page_number, page.fingerprint) for page in current.pages}
+
+    added = [
+        document
+        for page in current.pages
+        if (page.page_number, page.fingerprint) not in previous_ids
+        for document in page.documents
+    ]
+    removed = [
+        document
+        for page in previous_pages
+        if (page.page_number, page.fingerprint) not in current_ids
+        for document in page.documents
+    ]
+    return added, removed
+
+
+class ManifestStore:
+    """
+    Keeps the manifest of the last parsed version of each document as a JSON file,
+    named after the absolute document path.
+    """
+
+    def __init__(self, manifest_dir: Optional[str] = None):
+        self.manifest_dir = Path(manifest_dir) if manifest_dir else DEFAULT_MANIFEST_DIR
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, document_path: str) -> Path:
+        key = hashlib.sha256(str(Path(document_path).resolve()).encode()).hexdigest()
+        return self.manifest_dir / f"{key}.json"
+
+    def load(self, document_path: str) -> Optional[DocumentManifest]:
+        path = self._path(document_path)
+        if not path.is_file():
+            return None
+        return DocumentManifest.model_validate_json(path.read_text())
+
+    def save(self, manifest: DocumentManifest):
+        path = self._path(manifest.document_path)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=path.parent, suffix=".tmp", delete=False
+        ) as f:
+            f.write(manifest.model_dump_json())
+        os.replace(f.name, path)
+
+    def delete(self, document_path: str):
+        self._path(document_path).unlink(missing_ok=True)
@@ -0,0 +1,182 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from document_ai_agents.logger import logger
+
+
+def make_page_key(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class PageStore(ABC):
+    """
+    Holds encoded page images once and hands out short content-addressed keys, so
+    graph states carry page references instead of the images themselves. Identical
+    pages are stored a single time.
+    """
+
+    @abstractmethod
+    def put(self, data: bytes) -> str: ...
+
+    @abstractmethod
+    def get(self, key: str) -> bytes: ...
+
+    def size(self, key: str) -> int:
+        return len(self.get(key))
+
+    @abstractmethod
+    def __contains__(self, key: str) -> bool: ...
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+    def as_part(self, key: str) -> dict:
+        # The SDK takes raw bytes, base64 encoding only happens when serializing
+        return {"mime_type": "image/jpeg", "data": self.get(key)}
+
+
+class InMemoryPageStore(PageStore):
+    """
+    Pages kept in the Python heap. With `max_bytes`, the least recently used pages
+    are evicted once the total size goes over it, so states still referencing an
+    evicted page should be rebuilt from a persistent store.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pages: OrderedDict[str, bytes] = OrderedDict()
+        self._n_bytes = 0
+        self.n_evictions = 0
+
+    def put(self, data: bytes) -> str:
+        key = make_page_key(data)
+        with self._lock:
+            if key in self._pages:
+                self._pages.move_to_end(key)
+                return key
+            self._pages[key] = data
+            self._n_bytes += len(data)
+            # The page just added is kept even if it is larger than the budget
+            while (
+                self.max_bytes is not None
+                and self._n_bytes > self.max_bytes
+                and len(self._pages) > 1
+            ):
+                _, evicted = self._pages.popitem(last=False)
+                self._n_bytes -= len(evicted)
+                self.n_evictions += 1
+        return key
+
+    def get(self, key: str) -> bytes:
+        with self._lock:
+            data = self._pages[key]
+            self._pages.move_to_end(key)
+            return data
+
+    @property
+    def n_bytes(self) -> int:
+        return self._n_bytes
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._pages
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+
+class MmapPageStore(PageStore):
+    """
+    Append-only file of (length, key, data) records read back through a memory map,
+    so page bytes live in the OS page cache rather than the Python heap. The index is
+    rebuilt from the file when it is reopened.
+    """
+
+    _header = struct.Struct("<Q16s")
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a+b")
+        self._lock = threading.Lock()
+        self._index: dict[str, tuple[int, int]] = {}
+        self._mmap: Optional[mmap.mmap] = None
+        self._load_index()
+
+    def _load_index(self):
+        self._remap()
+        offset = 0
+        size = len(self._mmap) if self._mmap is not None else 0
+        while offset + self._header.size <= size:
+            length, digest = self._header.unpack_from(self._mmap, offset)
+            data_offset = offset + self._header.size
+            if data_offset + length > size:
+                logger.warning(f"Ignoring truncated record at {offset} in {self.path}")
+                break
+            self._index[digest.hex()] = (data_offset, length)
+            offset = data_offset + length
+        logger.info(f"Loaded {len(self._index)} pages from {self.path}")
+
+    def _remap(self):
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            return
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def put(self, data: bytes) -> str:
+        key = make_page_key(data)
+        with self._lock:
+            if key in self._index:
+                return key
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(self._header.pack(len(data), bytes.fromhex(key)))
+            self._file.write(data)
+            self._file.flush()
+            self._index[key] = (offset + self._header.size, len(data))
+        return key
+
+    def get(self, key: str) -> bytes:
+        offset, length = self._index[key]
+        with self._lock:
+            if self._mmap is None or offset + length > len(self._mmap):
+                self._remap()
+            return self._mmap[offset : offset + length]
+
+    def size(self, key: str) -> int:
+        return self._index[key][1]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._file.close()
+
+
+_default_page_store = InMemoryPageStore()
+
+
+def get_default_page_store() -> PageStore:
+    """
+    Process-wide store shared by agents that are not given one explicitly. It is not
+    bounded, since a parse needs all the pages of its document until the end:
+    long-running services should pass a `MmapPageStore`, or an `InMemoryPageStore`
+    with `max_bytes` sized for their largest document.
+    """
+    return _default_page_store
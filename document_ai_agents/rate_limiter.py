@@ -0,0 +1,175 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from google.api_core import exceptions
+from pydantic import BaseModel, Field
+
+from document_ai_agents.logger import logger
+
+T = TypeVar("T")
+
+RATE_LIMIT_ERRORS = (
+    exceptions.ResourceExhausted,
+    exceptions.TooManyRequests,
+    exceptions.ServiceUnavailable,
+    exceptions.InternalServerError,
+    exceptions.DeadlineExceeded,
+)
+
+IMAGE_TOKENS = 258  # Gemini bills each image up to 384px per side as 258 tokens
+CHARS_PER_TOKEN = 4
+
+
+def estimate_request_tokens(
+    text_chars: int = 0, n_images: int = 0, max_output_tokens: int = 0
+) -> int:
+    return text_chars // CHARS_PER_TOKEN + n_images * IMAGE_TOKENS + max_output_tokens
+
+
+class TokenBucket:
+    """
+    Refills `rate_per_minute` units per minute up to `capacity`. Reservations are
+    granted immediately and may overdraw the bucket, the caller then waits for the
+    returned delay, which keeps requests in arrival order.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated_at) * self.rate_per_second,
+            )
+            self.updated_at = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate_per_second)
+
+
+class SchedulerOptions(BaseModel):
+    max_in_flight: int = Field(8, gt=0, description="Concurrent requests at most.")
+    requests_per_minute: Optional[int] = Field(None, gt=0)
+    tokens_per_minute: Optional[int] = Field(None, gt=0)
+    max_retries: int = Field(5, ge=0)
+    initial_backoff: float = Field(2.0, ge=0, description="Seconds.")
+    max_backoff: float = Field(60.0, ge=0, description="Seconds.")
+    backoff_multiplier: float = Field(2.0, ge=1)
+
+
+class RequestScheduler:
+    """
+    Runs model calls with at most `max_in_flight` of them at once, under optional
+    requests/tokens per minute quotas, and retries rate limit and transient server
+    errors with exponential backoff and jitter. Safe to share between threads.
+    `arun` does the same for coroutines, sharing the quotas and capping in-flight
+    requests per event loop.
+    """
+
+    def __init__(self, options: Optional[SchedulerOptions] = None):
+        self.options = options or SchedulerOptions()
+        self._semaphore = threading.BoundedSemaphore(self.options.max_in_flight)
+        self._request_bucket = (
+            TokenBucket(self.options.requests_per_minute)
+            if self.options.requests_per_minute
+            else None
+        )
+        self._token_bucket = (
+            TokenBucket(self.options.tokens_per_minute)
+            if self.options.tokens_per_minute
+            else None
+        )
+        self._async_semaphores: dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def quota_delay(self, estimated_tokens: int = 0) -> float:
+        delay = 0.0
+        if self._request_bucket is not None:
+            delay = max(delay, self._request_bucket.reserve(1))
+        if self._token_bucket is not None and estimated_tokens:
+            delay = max(delay, self._token_bucket.reserve(estimated_tokens))
+        return delay
+
+    def backoff_delay(self, attempt: int) -> float:
+        delay = min(
+            self.options.max_backoff,
+            self.options.initial_backoff * self.options.backoff_multiplier**attempt,
+        )
+        return delay * random.uniform(0.5, 1.0)
+
+    def _async_semaphore(self) -> asyncio.Semaphore:
+        # asyncio semaphores are bound to the loop they are first used in
+        loop = asyncio.get_running_loop()
+        with self._stats_lock:
+            if loop not in self._async_semaphores:
+                self._async_semaphores = {
+                    other: semaphore
+                    for other, semaphore in self._async_semaphores.items()
+                    if not other.is_closed()
+                }
+                self._async_semaphores[loop] = asyncio.Semaphore(
+                    self.options.max_in_flight
+                )
+            return self._async_semaphores[loop]
+
+    def run(
+        self,
+        func: Callable[[], T],
+        estimated_tokens: int = 0,
+        retry_on: tuple[type[Exception], ...] = RATE_LIMIT_ERRORS,
+    ) -> T:
+        for attempt in range(self.options.max_retries + 1):
+            time.sleep(self.quota_delay(estimated_tokens))
+            try:
+                with self._semaphore:
+                    self._count("requests")
+                    return func()
+            except retry_on as e:
+                if attempt == self.options.max_retries:
+                    self._count("failures")
+                    raise
+                delay = self.backoff_delay(attempt)
+                self._count("retries")
+                logger.warning(
+                    f"Request failed with {type(e).__name__}: {e}, retrying in "
+                    f"{delay:.1f}s ({attempt + 1}/{self.options.max_retries})"
+                )
+                time.sleep(delay)
+
+    async def arun(
+        self,
+        func: Callable[[], Awaitable[T]],
+        estimated_tokens: int = 0,
+        retry_on: tuple[type[Exception], ...] = RATE_LIMIT_ERRORS,
+    ) -> T:
+        semaphore = self._async_semaphore()
+        for attempt in range(self.options.max_retries + 1):
+            await asyncio.sleep(self.quota_delay(estimated_tokens))
+            try:
+                async with semaphore:
+                    self._count("requests")
+                    return await func()
+            except retry_on as e:
+                if attempt == self.options.max_retries:
+                    self._count("failures")
+                    raise
+                delay = self.backoff_delay(attempt)
+                self._count("retries")
+                logger.warning(
+                    f"Request failed with {type(e).__name__}: {e}, retrying in "
+                    f"{delay:.1f}s ({attempt + 1}/{self.options.max_retries})"
+                )
+                await asyncio.sleep(delay)
@@ -11,7 +11,8 @@ def replace_value_in_dict(item, original_schema):
             res = original_schema.copy()
             for definition in definitions:
                 res = res[definition]
-            return res
+            # Definitions can reference other definitions
+            return replace_value_in_dict(res, original_schema)
         else:
             return {
                 key: replace_value_in_dict(i, original_schema)
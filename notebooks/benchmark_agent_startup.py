@@ -0,0 +1,38 @@
+import sys
+import time
+
+from document_ai_agents.document_rag_agent import DocumentRAGAgent
+from document_ai_agents.embedding_registry import (
+    current_rss_bytes,
+    get_embedding_registry,
+)
+
+if __name__ == "__main__":
+    # Usage: python notebooks/benchmark_agent_startup.py [n_agents] [--warm-up]
+    n_agents = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 10
+    registry = get_embedding_registry()
+
+    if "--warm-up" in sys.argv:
+        start = time.perf_counter()
+        registry.warm_up()
+        print(f"Warm-up: {time.perf_counter() - start:.2f}s")
+
+    memory = current_rss_bytes()
+    start = time.perf_counter()
+    agents = [DocumentRAGAgent(collection_name=f"startup-{i}") for i in range(n_agents)]
+    duration = time.perf_counter() - start
+    print(
+        f"{n_agents} agents: {duration / n_agents * 1000:.1f}ms and "
+        f"{(current_rss_bytes() - memory) / n_agents / 2**20:.2f} MiB per agent"
+    )
+
+    for i, agent in enumerate(agents[:2]):
+        start = time.perf_counter()
+        agent.embeddings.embed_query(f"First question of agent {i}")
+        print(f"Agent {i} first query embedding: {time.perf_counter() - start:.3f}s")
+
+    for model_id, stats in registry.stats.items():
+        print(
+            f"{model_id}: loaded in {stats.load_seconds:.2f}s, "
+            f"+{stats.memory_bytes / 2**20:.1f} MiB"
+        )
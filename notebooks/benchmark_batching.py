@@ -0,0 +1,43 @@
+import sys
+import time
+from pathlib import Path
+
+from document_ai_agents.document_parsing_agent import (
+    DocumentLayoutParsingState,
+    DocumentParsingAgent,
+)
+from document_ai_agents.document_utils import RenderOptions
+from document_ai_agents.image_utils import JpegEncodingOptions
+from document_ai_agents.page_store import InMemoryPageStore
+
+if __name__ == "__main__":
+    # Usage: python notebooks/benchmark_batching.py [document.pdf] [batch sizes...]
+    document_path = (
+        sys.argv[1]
+        if len(sys.argv) > 1
+        else str(Path(__file__).parents[1] / "data" / "docs.pdf")
+    )
+    batch_sizes = [int(x) for x in sys.argv[2:]] or [1, 2, 4, 8]
+
+    page_store = InMemoryPageStore()
+    for pages_per_request in batch_sizes:
+        agent = DocumentParsingAgent(
+            render_options=RenderOptions(workers=4),
+            encoding_options=JpegEncodingOptions(max_bytes=400_000),
+            page_store=page_store,
+            pages_per_request=pages_per_request,
+        )
+        state = DocumentLayoutParsingState(document_path=document_path)
+
+        start = time.perf_counter()
+        result = agent.graph.invoke(state)
+        duration = time.perf_counter() - start
+
+        n_pages = len(result["page_keys"])
+        print(
+            f"pages_per_request={pages_per_request}: {n_pages} pages in "
+            f"{duration:.2f}s ({n_pages / max(duration, 1e-6):.2f} pages/s), "
+            f"{agent.scheduler.stats['requests']} requests, "
+            f"{len(result['documents'])} documents, "
+            f"failed pages: {result['failed_page_numbers']}"
+        )
@@ -0,0 +1,49 @@
+import sys
+import time
+
+from document_ai_agents.document_qa_agent import (
+    DocumentQAAgent,
+    DocumentQAState,
+    VerificationOptions,
+)
+
+QUESTIONS = [
+    ("Who is the 20th president of the US?", "James Garfield"),
+    ("In which year was the 20th president elected?", "1880"),
+    ("Who is the 30th president of the US?", "N/A"),
+]
+CONTEXT = (
+    "James Garfield was elected as the United States' 20th President in 1880, "
+    "after nine terms in the U.S. House of Representatives."
+)
+
+if __name__ == "__main__":
+    # Usage: python notebooks/benchmark_qa_verification.py [modes...]
+    modes = sys.argv[1:] or ["sequential", "fused", "early_exit", "background"]
+
+    for mode in modes:
+        agent = DocumentQAAgent(verification_options=VerificationOptions(mode=mode))
+        for question, expected in QUESTIONS:
+            start = time.perf_counter()
+            result, verification = agent.invoke_with_verification(
+                DocumentQAState(question=question, pages_as_text=[CONTEXT])
+            )
+            answered = time.perf_counter() - start
+            stage_latencies = result["stage_latencies"]
+            verification_cot = result.get("verification_cot")
+            if verification is not None:
+                update = verification.result()
+                stage_latencies = update.get("stage_latencies", stage_latencies)
+                verification_cot = update.get("verification_cot")
+            verified = time.perf_counter() - start
+
+            stages = ", ".join(
+                f"{stage} {latency:.2f}s" for stage, latency in stage_latencies.items()
+            )
+            print(
+                f"{mode}: answered in {answered:.2f}s, verified in {verified:.2f}s "
+                f"({stages}), answer {result['answer_cot'].answer!r} "
+                f"(expected {expected!r}), entailment "
+                f"{verification_cot.entailment if verification_cot else None}"
+            )
+        agent.close()
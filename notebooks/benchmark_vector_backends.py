@@ -0,0 +1,92 @@
+import sys
+import time
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+from document_ai_agents.numpy_vector_store import NumpyVectorStore
+
+DIM = 384
+N_QUERIES = 200
+K = 10
+
+
+class LookupEmbeddings(Embeddings):
+    """Returns precomputed vectors, so only the vector stores are measured."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[int(text)].tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[int(text)].tolist()
+
+
+def recall(results: list[list[str]], expected: np.ndarray) -> float:
+    return np.mean(
+        [
+            len({int(id_) for id_ in ids} & set(exact)) / K
+            for ids, exact in zip(results, expected)
+        ]
+    )
+
+
+if __name__ == "__main__":
+    # Usage: python notebooks/benchmark_vector_backends.py [collection sizes...]
+    sizes = [int(x) for x in sys.argv[1:]] or [300, 3_000, 30_000]
+    rng = np.random.default_rng(0)
+
+    for size in sizes:
+        vectors = rng.normal(size=(size + N_QUERIES, DIM)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        embeddings = LookupEmbeddings(vectors)
+        ids = [str(i) for i in range(size)]
+        queries = vectors[size:]
+        expected = np.argsort(-(queries @ vectors[:size].T), axis=1)[:, :K]
+
+        backends = {
+            "chroma": lambda: Chroma(
+                collection_name=f"benchmark-{size}", embedding_function=embeddings
+            ),
+            "numpy-float16": lambda: NumpyVectorStore(embeddings, dtype="float16"),
+            "numpy-int8": lambda: NumpyVectorStore(embeddings, dtype="int8"),
+        }
+        for name, open_store in backends.items():
+            start = time.perf_counter()
+            store = open_store()
+            startup = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for batch_start in range(0, size, 1_000):
+                batch = ids[batch_start : batch_start + 1_000]
+                store.add_texts(batch, ids=batch)
+            build = time.perf_counter() - start
+
+            query = (
+                store.query
+                if isinstance(store, NumpyVectorStore)
+                else store._collection.query
+            )
+            latencies = []
+            results = []
+            for vector in queries:
+                start = time.perf_counter()
+                result = query(query_embeddings=[vector.tolist()], n_results=K)
+                latencies.append(time.perf_counter() - start)
+                results.append(result["ids"][0])
+
+            start = time.perf_counter()
+            query(query_embeddings=queries.tolist(), n_results=K)
+            batched = time.perf_counter() - start
+
+            print(
+                f"{name} n={size}: startup {startup * 1000:.1f}ms, "
+                f"build {build:.2f}s, "
+                f"query p50 {np.percentile(latencies, 50) * 1000:.2f}ms "
+                f"p99 {np.percentile(latencies, 99) * 1000:.2f}ms, "
+                f"{N_QUERIES} batched queries {batched * 1000:.1f}ms, "
+                f"recall@{K} {recall(results, expected):.3f}"
+            )
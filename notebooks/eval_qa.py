@@ -1,7 +1,11 @@
 from pathlib import Path
 
 from document_ai_agents.document_qa_agent import DocumentQAAgent, DocumentQAState
-from document_ai_agents.image_utils import image_file_to_base64_jpeg
+from document_ai_agents.image_utils import (
+    JpegEncodingOptions,
+    image_file_to_jpeg_bytes,
+)
+from document_ai_agents.page_store import get_default_page_store
 
 if __name__ == "__main__":
     image_path = str(
@@ -12,12 +16,22 @@ if __name__ == "__main__":
         / "hxxl0226_1.png"
     )
 
-    pages_as_base64_jpeg_images = [image_file_to_base64_jpeg(image_path)]
+    page_store = get_default_page_store()
+    page_keys = [
+        page_store.put(
+            image_file_to_jpeg_bytes(
+                image_path,
+                encoding_options=JpegEncodingOptions(
+                    max_long_edge=2048, grayscale=True
+                ),
+            )
+        )
+    ]
 
     state = DocumentQAState(
         # question="What is the milk substitute discussed in this document?",
         question="What day of the week was this invoice received?",
-        pages_as_base64_jpeg_images=pages_as_base64_jpeg_images,
+        page_keys=page_keys,
         pages_as_text=[],
     )
 
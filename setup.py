@@ -18,6 +18,9 @@ setup(
         "requirements.txt"
     ).readlines(),  # Reads dependencies from file
     extras_require={"dev": open("requirements-dev.txt").readlines()},
+    entry_points={
+        "console_scripts": ["document-ai-ingest=document_ai_agents.ingest:main"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
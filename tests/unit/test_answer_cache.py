@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+
+from document_ai_agents.answer_cache import (
+    AnswerCacheOptions,
+    SemanticAnswerCache,
+    make_context_key,
+)
+
+VOCABULARY = ["who", "wrote", "the", "paper", "authors", "of", "what", "score"]
+
+
+def bag_of_words(texts: list[str]) -> list[np.ndarray]:
+    return [
+        np.array(
+            [text.lower().strip("?").split().count(word) for word in VOCABULARY],
+            dtype=np.float32,
+        )
+        for text in texts
+    ]
+
+
+def make_cache(**kwargs) -> SemanticAnswerCache:
+    return SemanticAnswerCache(
+        AnswerCacheOptions(similarity_threshold=0.8, **kwargs),
+        embedding_function=bag_of_words,
+    )
+
+
+def test_similar_questions_hit():
+    cache = make_cache()
+    context = make_context_key("model", ["page-key"])
+    cache.store(context, "Who wrote the paper?", "Manoj")
+
+    assert cache.lookup(context, "who wrote the paper") == "Manoj"
+    assert cache.lookup(context, "What score?") is None
+    assert cache.lookup(make_context_key("model", ["other"]), "Who wrote?") is None
+    assert cache.stats["hits"] == 1
+    assert cache.hit_rate == 1 / 3
+
+
+def test_entries_expire():
+    cache = make_cache(ttl_seconds=0.01)
+    cache.store("context", "Who wrote the paper?", "Manoj")
+    time.sleep(0.02)
+
+    assert cache.lookup("context", "Who wrote the paper?") is None
+    assert cache.stats["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = make_cache(max_entries=2)
+    cache.store("a", "Who wrote the paper?", 1)
+    cache.store("b", "Who wrote the paper?", 2)
+    cache.lookup("a", "Who wrote the paper?")
+    cache.store("c", "Who wrote the paper?", 3)
+
+    assert cache.lookup("b", "Who wrote the paper?") is None
+    assert cache.lookup("a", "Who wrote the paper?") == 1
+    assert cache.stats["evictions"] == 1
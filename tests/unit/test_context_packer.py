@@ -0,0 +1,61 @@
+from langchain_core.documents import Document
+
+from document_ai_agents.context_packer import ContextBudgetOptions, pack_context
+from document_ai_agents.rate_limiter import IMAGE_TOKENS
+
+
+def make_document(content: str, page_number: int, element_type: str) -> Document:
+    return Document(
+        page_content=content,
+        metadata={"page_number": page_number, "element_type": element_type},
+    )
+
+
+def page_key_of(document: Document) -> str:
+    return f"page-{document.metadata['page_number']}"
+
+
+def test_images_only_for_tables_and_figures():
+    documents = [
+        make_document("Results table", 0, "Table"),
+        make_document("Introduction", 1, "Text-block"),
+        make_document("Another table of page 0", 0, "Table"),
+    ]
+
+    packed = pack_context(
+        documents, page_key_of, lambda key: 1_000, ContextBudgetOptions()
+    )
+
+    assert packed.documents == documents
+    assert packed.page_keys == ["page-0"]
+    assert packed.image_bytes == 1_000
+
+
+def test_budget_keeps_most_relevant_items():
+    documents = [
+        make_document("a" * 400, 0, "Figure"),  # 100 tokens
+        make_document("b" * 4_000, 1, "Text-block"),  # 1000 tokens
+        make_document("c" * 40, 2, "Text-block"),  # 10 tokens
+        make_document("d" * 40, 3, "Table"),
+    ]
+    options = ContextBudgetOptions(max_tokens=100 + IMAGE_TOKENS + 20 + 50)
+
+    packed = pack_context(
+        documents, page_key_of, lambda key: 1_000, options, reserved_tokens=50
+    )
+
+    assert [doc.page_content[0] for doc in packed.documents] == ["a", "c", "d"]
+    assert [doc.page_content[0] for doc in packed.dropped_documents] == ["b"]
+    assert packed.page_keys == ["page-0"]
+    assert packed.dropped_page_keys == ["page-3"]
+    assert packed.estimated_tokens <= options.max_tokens
+
+
+def test_image_byte_budget():
+    documents = [make_document("Figure", i, "Figure") for i in range(3)]
+    options = ContextBudgetOptions(max_image_bytes=2_500)
+
+    packed = pack_context(documents, page_key_of, lambda key: 1_000, options)
+
+    assert packed.page_keys == ["page-0", "page-1"]
+    assert packed.dropped_page_keys == ["page-2"]
@@ -4,7 +4,10 @@ from document_ai_agents.document_parsing_agent import (
     DocumentLayoutParsingState,
     DocumentParsingAgent,
     FindLayoutItemsInput,
+    TextLayerOptions,
 )
+from document_ai_agents.page_manifest import ManifestStore
+from document_ai_agents.page_store import InMemoryPageStore
 
 
 def test_load_document_success():
@@ -13,8 +16,29 @@ def test_load_document_success():
     state = DocumentLayoutParsingState(document_path=str(docs_path))
     agent = DocumentParsingAgent()
     result = agent.get_images(state)
-    assert "pages_as_base64_jpeg_images" in result
-    assert len(result["pages_as_base64_jpeg_images"]) > 0  # Expecting at least one page
+    assert "page_keys" in result
+    assert len(result["page_keys"]) > 0  # Expecting at least one page
+    assert all(key in agent.page_store for key in result["page_keys"])
+
+
+def test_route_pages():
+    docs_path = Path(__file__).parents[2] / "data" / "docs.pdf"
+
+    state = DocumentLayoutParsingState(document_path=str(docs_path))
+
+    # The sample page has a table, so it still needs a vision call
+    agent = DocumentParsingAgent(text_layer_options=TextLayerOptions())
+    result = agent.route_pages(state)
+    assert result["vision_page_numbers"] == [0]
+    assert result["documents"] == []
+
+    agent.is_text_rich = lambda page: True
+    result = agent.route_pages(state)
+    assert result["vision_page_numbers"] == []
+    assert result["text_layer_page_numbers"] == [0]
+    assert all(
+        doc.metadata["extraction_method"] == "text_layer" for doc in result["documents"]
+    )
 
 
 def test_extract_layout_elements_success():
@@ -23,10 +47,10 @@ def test_extract_layout_elements_success():
     state = DocumentLayoutParsingState(document_path=str(docs_path))
     agent = DocumentParsingAgent()
     result_images = agent.get_images(state)
-    state.pages_as_base64_jpeg_images = result_images["pages_as_base64_jpeg_images"]
+    state.page_keys = result_images["page_keys"]
     result = agent.find_layout_items(
         FindLayoutItemsInput(
-            base64_jpeg=result_images["pages_as_base64_jpeg_images"][0],
+            page_key=result_images["page_keys"][0],
             page_number=0,
             document_path=state.document_path,
         )
@@ -43,3 +67,82 @@ def test_document_parser_agent():
     result = agent.graph.invoke(state)
 
     assert len(result["documents"]) > 0  # Expecting at least one item
+
+
+def test_document_parser_agent_batched():
+    docs_path = Path(__file__).parents[2] / "data" / "docs.pdf"
+
+    state = DocumentLayoutParsingState(document_path=str(docs_path))
+    agent = DocumentParsingAgent(pages_per_request=4)
+
+    result = agent.graph.invoke(state)
+
+    assert len(result["documents"]) > 0  # Expecting at least one item
+    assert all(doc.metadata["page_number"] == 0 for doc in result["documents"])
+
+
+def test_document_parser_agent_incremental(tmp_path):
+    docs_path = Path(__file__).parents[2] / "data" / "docs.pdf"
+
+    agent = DocumentParsingAgent(manifest_store=ManifestStore(str(tmp_path)))
+
+    first = agent.graph.invoke(DocumentLayoutParsingState(document_path=str(docs_path)))
+    assert len(first["added_documents"]) == len(first["documents"]) > 0
+    assert first["removed_documents"] == []
+
+    # Not committed, as if indexing had failed, so the page is parsed again
+    retry = agent.graph.invoke(DocumentLayoutParsingState(document_path=str(docs_path)))
+    assert retry["reused_page_numbers"] == []
+    assert len(retry["added_documents"]) > 0
+    agent.commit_manifest(retry["manifest"])
+
+    # Nothing changed, so the previous documents are reused without model calls
+    second = agent.graph.invoke(
+        DocumentLayoutParsingState(document_path=str(docs_path))
+    )
+    assert second["reused_page_numbers"] == [0]
+    assert second["added_documents"] == []
+    assert second["removed_documents"] == []
+    assert len(second["documents"]) == len(first["documents"])
+
+
+def test_document_parser_agent_stream_documents():
+    docs_path = Path(__file__).parents[2] / "data" / "docs.pdf"
+
+    state = DocumentLayoutParsingState(document_path=str(docs_path))
+    agent = DocumentParsingAgent()
+
+    stream = agent.stream_documents(state)
+    batches = list(stream)
+
+    assert len(batches) > 0
+    assert sum(map(len, batches)) == len(stream.state["documents"])
+
+
+def test_layout_items_to_documents_keeps_bounding_boxes():
+    documents = DocumentParsingAgent.layout_items_to_documents(
+        [
+            {
+                "element_type": "Table",
+                "summary": "Scores",
+                "bounding_box": [100, 0, 500, 1000],
+            },
+            {"element_type": "Text-block", "summary": "Title", "bounding_box": []},
+        ],
+        page_number=2,
+        document_path="doc.pdf",
+    )
+
+    assert documents[0].metadata["bounding_box"] == "[0.1, 0.0, 0.5, 1.0]"
+    assert "bounding_box" not in documents[1].metadata
+
+
+def test_page_missing_from_the_store_is_a_failed_page():
+    page_store = InMemoryPageStore(max_bytes=1_000)
+    agent = DocumentParsingAgent(page_store=page_store)
+    assert agent.page_store is page_store  # Even though it is empty, so falsy
+    evicted = FindLayoutItemsInput(
+        document_path="doc.pdf", page_key="evicted", page_number=3
+    )
+
+    assert agent.find_layout_items(evicted) == {"failed_page_numbers": [3]}
@@ -1,19 +1,30 @@
+import asyncio
 from pathlib import Path
 
-from document_ai_agents.document_qa_agent import DocumentQAAgent, DocumentQAState
+from langgraph.graph import END
+
+from document_ai_agents.answer_cache import SemanticAnswerCache
+from document_ai_agents.document_qa_agent import (
+    AnswerChainOfThoughts,
+    DocumentQAAgent,
+    DocumentQAState,
+    VerificationOptions,
+)
 from document_ai_agents.document_utils import extract_images_from_pdf
-from document_ai_agents.image_utils import pil_image_to_base64_jpeg
+from document_ai_agents.image_utils import pil_image_to_jpeg_bytes
+from document_ai_agents.page_store import InMemoryPageStore, get_default_page_store
 
 
 def test_document_qa_agent():
     document_path = str(Path(__file__).parents[2] / "data" / "docs.pdf")
 
     images = extract_images_from_pdf(pdf_path=document_path)
-    pages_as_base64_jpeg_images = [pil_image_to_base64_jpeg(x) for x in images]
+    page_store = get_default_page_store()
+    page_keys = [page_store.put(pil_image_to_jpeg_bytes(x)) for x in images]
 
     state2 = DocumentQAState(
         question="What is the highest score on M-RCNN ?",
-        pages_as_base64_jpeg_images=pages_as_base64_jpeg_images,
+        page_keys=page_keys,
     )
 
     agent = DocumentQAAgent()
@@ -27,7 +38,7 @@ def test_document_qa_agent():
 def test_document_qa_agent_text():
     state2 = DocumentQAState(
         question="Who is the 20th president of the US?",
-        pages_as_base64_jpeg_images=[],
+        page_keys=[],
         pages_as_text=[
             "James Garfield was elected as the United States' 20th President in 1880, after nine terms in "
             "the U.S. House of Representatives."
@@ -40,3 +51,131 @@ def test_document_qa_agent_text():
 
     assert result["answer_cot"].answer == "James Garfield"
     assert result["verification_cot"].entailment == "Yes"
+
+
+def test_document_qa_agent_async():
+    state = DocumentQAState(
+        question="Who is the 20th president of the US?",
+        page_keys=[],
+        pages_as_text=[
+            "James Garfield was elected as the United States' 20th President in 1880, after nine terms in "
+            "the U.S. House of Representatives."
+        ],
+    )
+
+    agent = DocumentQAAgent()
+
+    result = asyncio.run(agent.graph.ainvoke(state))
+
+    assert result["answer_cot"].answer == "James Garfield"
+    assert result["verification_cot"].entailment == "Yes"
+
+
+def test_document_qa_agent_answer_cache():
+    state = DocumentQAState(
+        question="Who is the 20th president of the US?",
+        page_keys=[],
+        pages_as_text=[
+            "James Garfield was elected as the United States' 20th President in 1880, after nine terms in "
+            "the U.S. House of Representatives."
+        ],
+    )
+
+    agent = DocumentQAAgent(answer_cache=SemanticAnswerCache())
+
+    result1 = agent.graph.invoke(state)
+    result2 = agent.graph.invoke(
+        state.model_copy(update={"question": "Who is the 20th president of the US ?"})
+    )
+
+    assert not result1["answer_cached"]
+    assert result2["answer_cached"]
+    assert result2["answer_cot"] == result1["answer_cot"]
+    assert agent.answer_cache.stats["hits"] == 1
+
+
+def test_document_qa_agent_fused_verification():
+    state = DocumentQAState(
+        question="Who is the 20th president of the US?",
+        page_keys=[],
+        pages_as_text=[
+            "James Garfield was elected as the United States' 20th President in 1880, after nine terms in "
+            "the U.S. House of Representatives."
+        ],
+    )
+
+    agent = DocumentQAAgent(verification_options=VerificationOptions(mode="fused"))
+
+    result = agent.graph.invoke(state)
+
+    assert result["answer_cot"].answer == "James Garfield"
+    assert result["verification_cot"].entailment == "Yes"
+    assert list(result["stage_latencies"]) == ["answer_question"]
+
+
+def test_document_qa_agent_background_verification():
+    state = DocumentQAState(
+        question="Who is the 20th president of the US?",
+        page_keys=[],
+        pages_as_text=[
+            "James Garfield was elected as the United States' 20th President in 1880, after nine terms in "
+            "the U.S. House of Representatives."
+        ],
+    )
+
+    with DocumentQAAgent(
+        verification_options=VerificationOptions(mode="background")
+    ) as agent:
+        result, future = asyncio.run(agent.ainvoke_with_verification(state))
+        verification = future.result(timeout=60)
+
+    assert result["answer_cot"].answer == "James Garfield"
+    assert result.get("verification_cot") is None
+    assert verification["verification_cot"].entailment == "Yes"
+    assert set(verification["stage_latencies"]) == {
+        "answer_question",
+        "reformulate_answer",
+        "verify_answer",
+    }
+
+
+def test_early_exit_skips_short_contexts_and_missing_answers():
+    agent = DocumentQAAgent(
+        verification_options=VerificationOptions(
+            mode="early_exit", min_context_chars=100
+        )
+    )
+    answer_cot = AnswerChainOfThoughts(
+        rationale="", relevant_context="", answer="James Garfield"
+    )
+    short = DocumentQAState(
+        question="q", pages_as_text=["Garfield was 20th."], answer_cot=answer_cot
+    )
+    long = short.model_copy(update={"pages_as_text": ["Garfield was 20th. " * 10]})
+    images = short.model_copy(update={"page_keys": ["page"]})
+    not_found = long.model_copy(
+        update={"answer_cot": answer_cot.model_copy(update={"answer": "N/A"})}
+    )
+
+    assert agent.route_answer(short) == "cache_answer"
+    assert agent.route_answer(long) == "reformulate_answer"
+    assert agent.route_answer(images) == "reformulate_answer"
+    assert agent.route_answer(not_found) == "cache_answer"
+
+    agent.verification_options.mode = "sequential"
+    assert agent.route_answer(short) == "reformulate_answer"
+
+    # Background verification happens outside the graph, whose state stays JSON
+    agent.verification_options.mode = "background"
+    assert agent.route_answer(long) == END
+    assert DocumentQAState.model_validate_json(long.model_dump_json()) == long
+
+
+def test_missing_page_images_are_skipped():
+    page_store = InMemoryPageStore()
+    page_key = page_store.put(b"page")
+    state = DocumentQAState(question="q", page_keys=[page_key, "evicted"])
+
+    messages = DocumentQAAgent(page_store=page_store).answer_question_messages(state)
+
+    assert messages[0]["parts"][:2] == [page_store.as_part(page_key), {"text": "q"}]
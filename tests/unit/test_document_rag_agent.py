@@ -1,10 +1,27 @@
+import io
 from pathlib import Path
 
+import pytest
+from langchain_core.documents import Document
+from PIL import Image
+
+from document_ai_agents import document_rag_agent
 from document_ai_agents.document_parsing_agent import (
     DocumentLayoutParsingState,
     DocumentParsingAgent,
 )
-from document_ai_agents.document_rag_agent import DocumentRAGAgent, DocumentRAGState
+from document_ai_agents.document_rag_agent import (
+    CropOptions,
+    DocumentRAGAgent,
+    DocumentRAGState,
+    RetrievalFilter,
+    make_document_id,
+    tenant_collection_name,
+)
+from document_ai_agents.image_utils import pil_image_to_jpeg_bytes
+from document_ai_agents.lexical_index import HybridSearchOptions
+from document_ai_agents.numpy_vector_store import NumpyVectorStore, VectorIndexOptions
+from document_ai_agents.page_store import InMemoryPageStore
 
 
 def test_rag_agent():
@@ -19,7 +36,7 @@ def test_rag_agent():
     state2 = DocumentRAGState(
         question="Who was acknowledge in this paper ?",
         document_path=str(Path(__file__).parents[1] / "data" / "docs.pdf"),
-        pages_as_base64_jpeg_images=result1["pages_as_base64_jpeg_images"],
+        page_keys=result1["page_keys"],
         documents=result1["documents"],
     )
 
@@ -28,3 +45,331 @@ def test_rag_agent():
     result2 = agent2.graph.invoke(state2)
 
     assert "Manoj" in result2["response"]
+
+
+def test_rag_agent_index_document_stream():
+    state1 = DocumentLayoutParsingState(
+        document_path=str(Path(__file__).parents[2] / "data" / "docs.pdf")
+    )
+
+    agent1 = DocumentParsingAgent()
+    agent2 = DocumentRAGAgent()
+
+    stream = agent1.stream_documents(state1)
+    n_documents = agent2.index_document_stream(stream)
+
+    assert n_documents == len(stream.state["documents"]) > 0
+
+    state2 = DocumentRAGState(
+        question="Who was acknowledge in this paper ?",
+        document_path=str(Path(__file__).parents[2] / "data" / "docs.pdf"),
+        page_keys=stream.state["page_keys"],
+        page_numbers=stream.state["page_numbers"],
+        documents=stream.state["documents"],
+    )
+
+    result2 = agent2.answer_question(state2)
+
+    assert "Manoj" in result2["response"]
+
+
+def test_rag_agent_answer_questions():
+    state1 = DocumentLayoutParsingState(
+        document_path=str(Path(__file__).parents[2] / "data" / "docs.pdf")
+    )
+
+    agent1 = DocumentParsingAgent()
+
+    result1 = agent1.graph.invoke(state1)
+
+    state2 = DocumentRAGState(
+        question="",
+        document_path=str(Path(__file__).parents[2] / "data" / "docs.pdf"),
+        page_keys=result1["page_keys"],
+        documents=result1["documents"],
+    )
+
+    agent2 = DocumentRAGAgent()
+
+    questions = [
+        "What is the title of this paper ?",
+        "Who was acknowledge in this paper ?",
+    ]
+    results = agent2.answer_questions(state2, questions, max_concurrency=2)
+
+    assert [result["question"] for result in results] == questions
+    assert all(result["relevant_documents"] for result in results)
+    assert "Manoj" in results[1]["response"]
+
+
+def make_documents(contents: list[str]) -> list[Document]:
+    return [
+        Document(
+            page_content=content,
+            metadata={"document_path": "doc.pdf", "page_number": i // 2},
+        )
+        for i, content in enumerate(contents)
+    ]
+
+
+def test_make_document_id():
+    first, same, _, other_page = make_documents(["Table"] * 4)
+    assert make_document_id(first) == make_document_id(same)
+    assert make_document_id(first) != make_document_id(other_page)
+    assert make_document_id(first) != make_document_id(make_documents(["Text"])[0])
+
+
+def test_rag_agent_index_is_idempotent(tmp_path):
+    documents = make_documents(["Introduction", "Results table", "Conclusion"])
+    state = DocumentRAGState(
+        question="What are the results?",
+        document_path="doc.pdf",
+        page_keys=[],
+        documents=documents,
+    )
+
+    agent = DocumentRAGAgent(persist_directory=str(tmp_path))
+    agent.index_documents(state)
+    agent.index_documents(state)
+    assert len(agent.vector_store.get()["ids"]) == 3
+
+    # A new process finds the persisted documents and adds nothing
+    agent = DocumentRAGAgent(persist_directory=str(tmp_path))
+    assert agent.upsert_documents(documents) == 0
+    agent.apply_document_deltas([], [])  # Unchanged incremental run
+
+    # The edited page replaces its previous documents
+    edited = documents[:1] + make_documents(["Introduction", "Updated results"])[1:]
+    agent.index_documents(state.model_copy(update={"documents": edited}))
+    assert sorted(agent.vector_store.get()["documents"]) == [
+        "Conclusion",
+        "Introduction",
+        "Updated results",
+    ]
+
+
+def test_retrieve_many_matches_retriever():
+    documents = make_documents(["Introduction", "Results table", "Conclusion"])
+    agent = DocumentRAGAgent(k=2)
+    agent.upsert_documents(documents)
+
+    questions = ["What are the results?", "How does it end?"]
+    for question, retrieved in zip(questions, agent.retrieve_many(questions)):
+        expected = agent.retriever.invoke(question)
+        assert [doc.page_content for doc in retrieved] == [
+            doc.page_content for doc in expected
+        ]
+        assert [doc.metadata for doc in retrieved] == [doc.metadata for doc in expected]
+
+
+def test_hybrid_search_finds_exact_identifiers(tmp_path):
+    documents = make_documents(
+        [f"Section {i} describes the training of detection models" for i in range(8)]
+        + ["Table 3: M-RCNN macro average 0.708"]
+    )
+    agent = DocumentRAGAgent(
+        k=1,
+        persist_directory=str(tmp_path),
+        hybrid_options=HybridSearchOptions(n_candidates=2),
+    )
+    agent.upsert_documents(documents)
+
+    question = "What is the M-RCNN macro average?"
+    assert (
+        agent.retrieve_many([question])[0][0].page_content == documents[-1].page_content
+    )
+
+    # The lexical index is rebuilt from the persisted collection and follows deletes
+    agent = DocumentRAGAgent(
+        k=1,
+        persist_directory=str(tmp_path),
+        hybrid_options=HybridSearchOptions(n_candidates=2),
+    )
+    assert len(agent.lexical_index) == len(documents)
+    agent.delete_documents(documents[-1:])
+    assert len(agent.lexical_index) == len(documents) - 1
+
+
+def test_retrieval_filter():
+    documents = [
+        Document(
+            page_content=f"{element_type} of {document_path} page {page_number}",
+            metadata={
+                "document_path": document_path,
+                "page_number": page_number,
+                "element_type": element_type,
+            },
+        )
+        for document_path in ["a.pdf", "b.pdf"]
+        for page_number in range(3)
+        for element_type in ["Table", "Text-block"]
+    ]
+    agent = DocumentRAGAgent(
+        k=10,
+        collection_name="filters",
+        hybrid_options=HybridSearchOptions(n_candidates=10),
+    )
+    agent.upsert_documents(documents)
+
+    retrieval_filter = RetrievalFilter(
+        document_paths=["b.pdf"], element_types=["Table"], page_range=(1, 2)
+    )
+    (retrieved,) = agent.retrieve_many(["Table page"], retrieval_filter)
+    assert sorted(doc.page_content for doc in retrieved) == [
+        "Table of b.pdf page 1",
+        "Table of b.pdf page 2",
+    ]
+
+    # Retrieval for a state is scoped to its own files by default
+    state = DocumentRAGState(
+        question="Table", document_path="a.pdf", page_keys=[], documents=documents[:6]
+    )
+    (retrieved,) = agent.retrieve_many(["Table"], agent.retrieval_filter(state))
+    assert {doc.metadata["document_path"] for doc in retrieved} == {"a.pdf"}
+
+
+def test_tenants_have_separate_collections():
+    agent = DocumentRAGAgent(collection_name="tenants")
+    agent.for_tenant("acme").upsert_documents(make_documents(["Acme report"]))
+    agent.for_tenant("globex").upsert_documents(make_documents(["Globex report"]))
+
+    assert agent.for_tenant("acme") is agent.for_tenant("acme")
+    assert agent.for_tenant("acme").vector_store.get()["documents"] == ["Acme report"]
+    assert agent.vector_store.get()["ids"] == []
+
+
+def test_tenant_collection_name():
+    assert tenant_collection_name("docs", "a") == "docs--a"
+    assert tenant_collection_name("docs", "acme_eu-1") == "docs--acme_eu-1"
+    for tenant in ["", "acme-", "_acme", "ac me", "a" * 32]:
+        with pytest.raises(ValueError):
+            tenant_collection_name("docs", tenant)
+    # Chroma limits collection names to 63 characters
+    with pytest.raises(ValueError):
+        tenant_collection_name("d" * 40, "t" * 25)
+
+
+def test_numpy_backend_moves_to_chroma_when_large(tmp_path):
+    documents = make_documents([f"Paragraph {i}" for i in range(6)])
+    options = VectorIndexOptions(backend="auto", max_numpy_size=4)
+
+    agent = DocumentRAGAgent(
+        persist_directory=str(tmp_path), vector_index_options=options
+    )
+    agent.upsert_documents(documents[:4])
+    assert isinstance(agent.vector_store, NumpyVectorStore)
+    assert agent.upsert_documents(documents[:4]) == 0
+    assert len(agent.retrieve_many(["Paragraph 2"])[0]) == 3
+
+    agent.upsert_documents(documents)
+    assert not isinstance(agent.vector_store, NumpyVectorStore)
+    assert len(agent.vector_store.get()["ids"]) == 6
+
+    # The collection is opened with Chroma from now on
+    agent = DocumentRAGAgent(
+        persist_directory=str(tmp_path), vector_index_options=options
+    )
+    assert not isinstance(agent.vector_store, NumpyVectorStore)
+
+
+def test_tables_are_sent_as_crops():
+    page_store = InMemoryPageStore()
+    page_key = page_store.put(pil_image_to_jpeg_bytes(Image.new("RGB", (1000, 800))))
+    table = Document(
+        page_content="Results table",
+        metadata={
+            "document_path": "missing.pdf",
+            "page_number": 0,
+            "element_type": "Table",
+            "bounding_box": "[0.5, 0.0, 1.0, 0.5]",
+        },
+    )
+    text = Document(
+        page_content="Introduction",
+        metadata={
+            "document_path": "missing.pdf",
+            "page_number": 0,
+            "element_type": "Text-block",
+        },
+    )
+    state = DocumentRAGState(
+        question="What are the results?",
+        document_path="missing.pdf",
+        page_keys=[page_key],
+        documents=[table, text],
+    )
+    agent = DocumentRAGAgent(page_store=page_store, crop_options=CropOptions(padding=0))
+
+    # The PDF cannot be rendered, the stored page image is cropped instead
+    messages = agent.answer_question_messages(state, [table, text])
+    crop_key = agent.crop_layout_item(table, page_key, {})
+    assert [m for m in messages if not isinstance(m, str)] == [
+        page_store.as_part(crop_key),
+        page_store.as_part(page_key),
+    ]
+    assert Image.open(io.BytesIO(page_store.get(crop_key))).size == (500, 400)
+
+    # A tiny crop is not worth sending, the whole page is used instead
+    sliver = Document(
+        page_content="Footnote table",
+        metadata={**table.metadata, "bounding_box": "[0.5, 0.0, 0.51, 0.5]"},
+    )
+    assert agent.crop_layout_item(sliver, page_key, {}) is None
+
+
+def test_page_images_are_only_matched_to_the_state_document():
+    page_store = InMemoryPageStore()
+    page_keys = [page_store.put(f"page {i} of a.pdf".encode()) for i in range(2)]
+    documents = [
+        Document(
+            page_content=f"Table of {document_path}",
+            metadata={
+                "document_path": document_path,
+                "page_number": page_number,
+                "element_type": "Table",
+            },
+        )
+        for document_path, page_number in [("a.pdf", 0), ("b.pdf", 1)]
+    ]
+    state = DocumentRAGState(
+        question="Tables",
+        document_path="a.pdf",
+        page_keys=page_keys,
+        documents=documents,
+    )
+    agent = DocumentRAGAgent(page_store=page_store)
+
+    messages = agent.answer_question_messages(state, documents)
+    assert [m for m in messages if not isinstance(m, str)] == [
+        page_store.as_part(page_keys[0])
+    ]
+
+    # A page evicted from the store is skipped, its text is still sent
+    state = state.model_copy(update={"page_keys": ["evicted", page_keys[1]]})
+    messages = agent.answer_question_messages(state, documents)
+    assert messages[:2] == ["Table of a.pdf", "Table of b.pdf"]
+
+
+def test_memoized_crops_are_bounded(monkeypatch):
+    monkeypatch.setattr(document_rag_agent, "MAX_MEMOIZED_CROPS", 2)
+    page_store = InMemoryPageStore()
+    page_key = page_store.put(pil_image_to_jpeg_bytes(Image.new("RGB", (100, 100))))
+    agent = DocumentRAGAgent(
+        page_store=page_store, crop_options=CropOptions(padding=0, min_size=1)
+    )
+    tables = [
+        Document(
+            page_content="Table",
+            metadata={
+                "document_path": "missing.pdf",
+                "page_number": 0,
+                "element_type": "Table",
+                "bounding_box": f"[0.0, 0.0, {size}, {size}]",
+            },
+        )
+        for size in [0.5, 0.6, 0.7]
+    ]
+    crop_keys = [agent.crop_layout_item(table, page_key, {}) for table in tables]
+
+    assert len(agent._crop_keys) == 2
+    assert agent.crop_layout_item(tables[0], page_key, {}) == crop_keys[0]
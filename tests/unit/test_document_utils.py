@@ -1,8 +1,19 @@
 from pathlib import Path
 
+import PIL.Image as Image
+import pytest
+
 from document_ai_agents.document_utils import (
+    RenderOptions,
+    analyze_pdf_text_layers,
     extract_images_from_pdf,
     extract_text_from_pdf,
+    fingerprint_pdf_pages,
+    get_pdf_page_count,
+    iter_images_from_pdf,
+    resolve_page_numbers,
+    split_into_page_ranges,
+    split_text_into_blocks,
 )
 
 
@@ -16,6 +27,64 @@ def test_extract_images_from_pdf():
     ), "Images should be in JPEG format"
 
 
+# Test for iter_images_from_pdf
+def test_iter_images_from_pdf():
+    pdf_file = Path(__file__).parents[2] / "data" / "docs.pdf"
+    images = list(
+        iter_images_from_pdf(str(pdf_file), RenderOptions(window_size=2, workers=2))
+    )
+    assert len(images) == get_pdf_page_count(str(pdf_file))
+    assert all(
+        image.format == "JPEG" for image in images
+    ), "Images should be in JPEG format"
+
+
+def test_iter_images_from_pdf_early_stop():
+    pdf_file = Path(__file__).parents[2] / "data" / "docs.pdf"
+    pages = iter_images_from_pdf(str(pdf_file), RenderOptions(window_size=1))
+    first_page = next(pages)
+    pages.close()  # Should stop the background renderer without hanging
+    assert first_page.size[0] > 0
+
+
+def test_extract_images_from_pdf_page_subset():
+    pdf_file = Path(__file__).parents[2] / "data" / "docs.pdf"
+    images = extract_images_from_pdf(
+        str(pdf_file), RenderOptions(dpi=72, page_numbers=[0, 0], workers=2)
+    )
+    full_size_images = extract_images_from_pdf(
+        str(pdf_file), RenderOptions(page_numbers=[0])
+    )
+    assert len(images) == 1
+    assert images[0].size[0] < full_size_images[0].size[0]
+
+
+def test_split_into_page_ranges():
+    assert split_into_page_ranges([]) == []
+    assert split_into_page_ranges([0, 1, 2, 5, 6, 9]) == [(1, 3), (6, 7), (10, 10)]
+    assert split_into_page_ranges(list(range(8)), n_ranges=4) == [
+        (1, 2),
+        (3, 4),
+        (5, 6),
+        (7, 8),
+    ]
+
+
+def test_resolve_page_numbers():
+    pdf_file = Path(__file__).parents[2] / "data" / "docs.pdf"
+    page_count = get_pdf_page_count(str(pdf_file))
+    assert resolve_page_numbers(str(pdf_file)) == list(range(page_count))
+    assert resolve_page_numbers(str(pdf_file), [0, 0]) == [0]
+    with pytest.raises(AssertionError):
+        resolve_page_numbers(str(pdf_file), [page_count])
+
+
+# Test for get_pdf_page_count
+def test_get_pdf_page_count():
+    pdf_file = Path(__file__).parents[2] / "data" / "docs.pdf"
+    assert get_pdf_page_count(str(pdf_file)) > 0
+
+
 # Test for extract_text_from_pdf
 def test_extract_text_from_pdf():
     pdf_file = Path(__file__).parents[2] / "data" / "docs.pdf"
@@ -23,3 +92,49 @@ def test_extract_text_from_pdf():
     assert len(texts) > 0, "Expected text from at least one page"
     for page_text in texts:
         assert page_text.strip(), "Extracted text should not be empty"
+
+
+# Test for analyze_pdf_text_layers
+def test_analyze_pdf_text_layers():
+    pdf_file = Path(__file__).parents[2] / "data" / "docs.pdf"
+    text_layers = analyze_pdf_text_layers(str(pdf_file))
+    assert len(text_layers) == get_pdf_page_count(str(pdf_file))
+
+    page = text_layers[0]
+    assert page.n_usable_chars > 1000
+    assert page.usable_ratio > 0.95
+    assert page.has_table_or_figure_caption  # The page starts with "TABLE V:"
+    assert page.n_numeric_rows > 2
+
+
+def test_split_text_into_blocks():
+    text = "first line\nsecond line\n\nnew paragraph\n" + "x" * 20
+    assert split_text_into_blocks(text) == [
+        "first line\nsecond line",
+        "new paragraph\n" + "x" * 20,
+    ]
+    assert split_text_into_blocks(text, max_chars=15) == [
+        "first line",
+        "second line",
+        "new paragraph",
+        "x" * 20,
+    ]
+    assert split_text_into_blocks("") == []
+
+
+def save_pdf(path, colors):
+    pages = [Image.new("RGB", (64, 64), color) for color in colors]
+    pages[0].save(path, save_all=True, append_images=pages[1:])
+    return str(path)
+
+
+def test_fingerprint_pdf_pages(tmp_path):
+    red, green, blue = (255, 0, 0), (0, 255, 0), (0, 0, 255)
+    before = fingerprint_pdf_pages(save_pdf(tmp_path / "v1.pdf", [red, green]))
+    after = fingerprint_pdf_pages(save_pdf(tmp_path / "v2.pdf", [blue, red, green]))
+
+    assert len(set(before.values())) == 2
+    assert after[1] == before[0]
+    assert after[2] == before[1]
+    assert after[0] not in before.values()
+    assert list(fingerprint_pdf_pages(str(tmp_path / "v2.pdf"), [2])) == [2]
@@ -0,0 +1,76 @@
+import numpy as np
+
+from document_ai_agents.document_rag_agent import ChromaEmbeddingsAdapter
+from document_ai_agents.embedding_cache import (
+    DiskVectorStore,
+    EmbeddingCache,
+    EmbeddingOptions,
+    make_embedding_key,
+)
+
+
+class CountingEmbeddingFunction:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(list(input))
+        return [np.full(4, len(text), dtype=np.float32) for text in input]
+
+
+def vectors(*values):
+    return {f"key{value}": np.full(4, value, dtype=np.float32) for value in values}
+
+
+def test_embedding_key_depends_on_model():
+    assert make_embedding_key("text", "model-a") != make_embedding_key("text", "b")
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put_many(vectors(1, 2))
+    cache.get_many(["key1"])
+    cache.put_many(vectors(3))
+
+    assert set(cache.get_many(["key1", "key2", "key3"])) == {"key1", "key3"}
+
+
+def test_disk_store_persists(tmp_path):
+    store = DiskVectorStore(str(tmp_path))
+    store.put_many(vectors(1, 2))
+    store.put_many(vectors(2, 3))
+
+    store = DiskVectorStore(str(tmp_path))
+    assert len(store) == 3
+    assert store.get_many(["key3", "missing"])["key3"].tolist() == [3.0] * 4
+
+
+def test_disk_store_ignores_rows_without_key(tmp_path):
+    store = DiskVectorStore(str(tmp_path))
+    store.put_many(vectors(1))
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(b"\0" * 10)  # Crash while writing the next vectors
+
+    store = DiskVectorStore(str(tmp_path))
+    store.put_many(vectors(2))
+    store = DiskVectorStore(str(tmp_path))
+    assert store.get_many(["key1"])["key1"].tolist() == [1.0] * 4
+    assert store.get_many(["key2"])["key2"].tolist() == [2.0] * 4
+
+
+def test_adapter_embeds_each_text_once(tmp_path):
+    ef = CountingEmbeddingFunction()
+    options = EmbeddingOptions(batch_size=2, workers=2, cache_dir=str(tmp_path))
+    adapter = ChromaEmbeddingsAdapter(ef, embedding_options=options)
+
+    texts = ["a", "bb", "a", "ccc", "dddd", "bb"]
+    assert [v[0] for v in adapter.embed_documents(texts)] == [1, 2, 1, 3, 4, 2]
+    assert sorted(map(len, ef.calls)) == [2, 2]
+    assert adapter.embed_query("ccc") == [3.0] * 4
+    assert len(ef.calls) == 2
+
+    # A new adapter finds the vectors on disk
+    ef = CountingEmbeddingFunction()
+    adapter = ChromaEmbeddingsAdapter(ef, embedding_options=options)
+    adapter.embed_documents(texts)
+    assert ef.calls == []
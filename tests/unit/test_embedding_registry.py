@@ -0,0 +1,76 @@
+import builtins
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from document_ai_agents.embedding_registry import (
+    EmbeddingModelRegistry,
+    current_rss_bytes,
+)
+
+
+class SlowModel:
+    instances = 0
+
+    def __init__(self):
+        SlowModel.instances += 1
+        time.sleep(0.05)
+
+    def __call__(self, input):
+        return [[float(len(text))] for text in input]
+
+
+@pytest.fixture
+def registry():
+    SlowModel.instances = 0
+    registry = EmbeddingModelRegistry()
+    registry.register("slow", SlowModel)
+    return registry
+
+
+def test_model_is_loaded_once(registry):
+    ef = registry.get("slow")
+    assert not registry.is_loaded("slow")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda text: ef([text]), ["a", "bb"] * 8))
+
+    assert results[:2] == [[[1.0]], [[2.0]]]
+    assert SlowModel.instances == 1
+    assert registry.stats["slow"].load_seconds >= 0.05
+
+
+def test_background_warm_up(registry):
+    thread = registry.warm_up("slow", background=True)
+    registry.get("slow")(["text"])
+    thread.join()
+    assert SlowModel.instances == 1
+
+
+def test_unknown_model(registry):
+    with pytest.raises(KeyError):
+        registry.get("missing")
+
+
+def test_current_rss_bytes_without_proc_or_resource(monkeypatch):
+    assert current_rss_bytes() > 0
+
+    # As on Windows: no /proc and no resource module
+    real_open, real_import = builtins.open, builtins.__import__
+
+    def open_without_proc(path, *args, **kwargs):
+        if str(path).startswith("/proc"):
+            raise FileNotFoundError(path)
+        return real_open(path, *args, **kwargs)
+
+    def import_without_resource(name, *args, **kwargs):
+        if name == "resource":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", open_without_proc)
+    monkeypatch.delitem(sys.modules, "resource", raising=False)
+    monkeypatch.setattr(builtins, "__import__", import_without_resource)
+    assert current_rss_bytes() == 0
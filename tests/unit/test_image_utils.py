@@ -1,10 +1,20 @@
 import base64
 import io
 
+import numpy as np
 import pytest
 from PIL import Image
 
-from document_ai_agents.image_utils import base64_to_pil_image, pil_image_to_base64_jpeg
+from document_ai_agents.image_utils import (
+    JpegEncodingOptions,
+    base64_to_pil_image,
+    crop_normalized_box,
+    encode_jpeg,
+    is_monochrome,
+    normalize_bounding_box,
+    pil_image_to_base64_jpeg,
+    summarize_encoded_sizes,
+)
 
 
 @pytest.fixture
@@ -15,6 +25,13 @@ def test_image():
     return img
 
 
+@pytest.fixture
+def noisy_image():
+    """Fixture to create a hard to compress RGB image."""
+    pixels = np.random.default_rng(0).integers(0, 255, (900, 1200, 3), dtype=np.uint8)
+    return Image.fromarray(pixels, mode="RGB")
+
+
 def test_pil_image_to_base64_jpeg(test_image):
     """Test the `pil_image_to_base64_jpeg` function."""
     # Convert the test image to base64
@@ -67,3 +84,69 @@ def test_round_trip_conversion(test_image):
     # original_pixels = list(test_image.getdata())
     # result_pixels = list(result_image.getdata())
     # assert original_pixels == result_pixels
+
+
+def test_encode_jpeg_defaults_keep_size(noisy_image):
+    encoded = encode_jpeg(noisy_image)
+    assert (encoded.width, encoded.height) == noisy_image.size
+    assert encoded.quality == 75
+    assert not encoded.grayscale
+
+
+def test_encode_jpeg_max_long_edge(noisy_image):
+    encoded = encode_jpeg(noisy_image, JpegEncodingOptions(max_long_edge=600))
+    assert (encoded.width, encoded.height) == (600, 450)
+    assert Image.open(io.BytesIO(encoded.data)).size == (600, 450)
+
+
+def test_encode_jpeg_byte_budget(noisy_image):
+    full_size = encode_jpeg(noisy_image).n_bytes
+    budget = full_size // 2
+
+    encoded = encode_jpeg(noisy_image, JpegEncodingOptions(max_bytes=budget))
+    assert encoded.n_bytes <= budget
+    assert encoded.quality < 75
+
+    # A budget that quality alone can't reach also reduces the resolution
+    encoded = encode_jpeg(noisy_image, JpegEncodingOptions(max_bytes=budget // 4))
+    assert encoded.n_bytes <= budget // 4
+    assert encoded.width < noisy_image.size[0]
+
+
+def test_encode_jpeg_grayscale():
+    gray_page = Image.new("RGB", (300, 200), color=(250, 250, 250))
+    assert is_monochrome(gray_page)
+    encoded = encode_jpeg(gray_page, JpegEncodingOptions(grayscale=True))
+    assert encoded.grayscale
+    assert Image.open(io.BytesIO(encoded.data)).mode == "L"
+
+    red_page = Image.new("RGB", (300, 200), color="red")
+    assert not is_monochrome(red_page)
+    assert not encode_jpeg(red_page, JpegEncodingOptions(grayscale=True)).grayscale
+
+
+def test_summarize_encoded_sizes():
+    assert summarize_encoded_sizes([]) == {}
+    summary = summarize_encoded_sizes([100, 200, 300])
+    assert summary["total_bytes"] == 600
+    assert summary["max_bytes"] == 300
+    assert summary["p50_bytes"] == 200
+
+
+def test_normalize_bounding_box():
+    assert normalize_bounding_box([0.1, 0.2, 0.5, 0.6]) == [0.1, 0.2, 0.5, 0.6]
+    assert normalize_bounding_box([100, 200, 500, 600]) == [0.1, 0.2, 0.5, 0.6]
+    assert normalize_bounding_box([0.1, 0.2, 0.5, 1.01]) == [0.1, 0.2, 0.5, 1.0]
+    assert normalize_bounding_box([-0.01, 0, 1.5, 1]) == [0.0, 0.0, 1.0, 1.0]
+    assert normalize_bounding_box([0.5, 0.2, 0.1, 0.6]) is None
+    assert normalize_bounding_box([0.1, 0.2]) is None
+    assert normalize_bounding_box(None) is None
+
+
+def test_crop_normalized_box():
+    image = Image.new("RGB", (200, 100))
+    assert crop_normalized_box(image, [0.1, 0.25, 0.5, 0.75]).size == (100, 40)
+    assert crop_normalized_box(image, [0.0, 0.0, 0.5, 0.5], padding=0.1).size == (
+        120,
+        60,
+    )
@@ -0,0 +1,77 @@
+import pytest
+
+from document_ai_agents.ingest import (
+    IngestionJournal,
+    IngestionRecord,
+    find_pdfs,
+    plan_ingestion,
+    summarize_latencies,
+)
+
+
+def test_journal_resumes(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = IngestionJournal(path)
+    journal.append(IngestionRecord(document_path="a.pdf", file_hash="1", status="done"))
+    journal.append(
+        IngestionRecord(document_path="b.pdf", file_hash="2", status="failed")
+    )
+    with open(path, "a") as f:
+        f.write('{"document_path": "c.pdf", "file_ha')  # Interrupted write
+
+    journal = IngestionJournal(path)
+    assert journal.is_done("a.pdf", "1")
+    assert not journal.is_done("a.pdf", "changed")
+    assert not journal.is_done("b.pdf", "2")
+    assert not journal.is_done("c.pdf", "3")
+
+
+def test_journal_last_record_wins(tmp_path):
+    journal = IngestionJournal(str(tmp_path / "journal.jsonl"))
+    journal.append(
+        IngestionRecord(document_path="a.pdf", file_hash="1", status="failed")
+    )
+    journal.append(IngestionRecord(document_path="a.pdf", file_hash="1", status="done"))
+    assert IngestionJournal(str(tmp_path / "journal.jsonl")).is_done("a.pdf", "1")
+
+
+def test_find_pdfs(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ["a.pdf", "sub/b.pdf", "notes.txt"]:
+        (tmp_path / name).touch()
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(f"{tmp_path / 'a.pdf'}\n\n{tmp_path / 'c.pdf'}\n")
+
+    assert find_pdfs([str(tmp_path), str(manifest)]) == [
+        str(tmp_path / "a.pdf"),
+        str(tmp_path / "sub" / "b.pdf"),
+        str(tmp_path / "c.pdf"),
+    ]
+
+
+def test_summarize_latencies():
+    summary = summarize_latencies([float(x) for x in range(1, 101)])
+    assert summary["p50"] == pytest.approx(50.5)
+    assert summary["max"] == 100
+    assert summarize_latencies([]) == {}
+
+
+def test_plan_ingestion_records_unreadable_files(tmp_path):
+    (tmp_path / "a.pdf").write_bytes(b"a")
+    (tmp_path / "b.pdf").write_bytes(b"b")
+    journal = IngestionJournal(str(tmp_path / "journal.jsonl"))
+    pending, _, _ = plan_ingestion([str(tmp_path / "a.pdf")], journal)
+    journal.append(
+        IngestionRecord(
+            document_path=pending[0][0], file_hash=pending[0][1], status="done"
+        )
+    )
+
+    paths = [str(tmp_path / name) for name in ["a.pdf", "b.pdf", "missing.pdf"]]
+    pending, n_skipped, unreadable = plan_ingestion(paths, journal)
+
+    assert [path for path, _ in pending] == [paths[1]]
+    assert n_skipped == 1
+    assert [record.document_path for record in unreadable] == [paths[2]]
+    assert unreadable[0].status == "failed"
+    assert "FileNotFoundError" in unreadable[0].error
@@ -0,0 +1,51 @@
+from document_ai_agents.layout_cache import LayoutResultCache
+
+LAYOUT_ITEMS = [{"element_type": "Table", "summary": "Results per model"}]
+
+
+def test_put_and_get(tmp_path):
+    cache = LayoutResultCache(str(tmp_path / "layouts.sqlite"))
+    key = cache.make_key("page", "gemini-1.5-flash-002", "prompt", {"type": "object"})
+    assert cache.get(key) is None
+
+    cache.put(key, LAYOUT_ITEMS, model_name="gemini-1.5-flash-002")
+    assert key in cache
+    assert cache.get(key) == LAYOUT_ITEMS
+    assert len(cache) == 1
+
+
+def test_key_depends_on_model_prompt_and_schema():
+    keys = {
+        LayoutResultCache.make_key("page", "model-a", "prompt", {}),
+        LayoutResultCache.make_key("page", "model-b", "prompt", {}),
+        LayoutResultCache.make_key("page", "model-a", "other prompt", {}),
+        LayoutResultCache.make_key("page", "model-a", "prompt", {"type": "object"}),
+        LayoutResultCache.make_key("other page", "model-a", "prompt", {}),
+    }
+    assert len(keys) == 5
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "layouts.sqlite")
+    LayoutResultCache(path).put("key", LAYOUT_ITEMS)
+    assert LayoutResultCache(path).get("key") == LAYOUT_ITEMS
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = LayoutResultCache(str(tmp_path / "layouts.sqlite"), max_entries=2)
+    cache.put("a", LAYOUT_ITEMS)
+    cache.put("b", LAYOUT_ITEMS)
+    cache.get("a")
+    cache.put("c", LAYOUT_ITEMS)
+
+    assert len(cache) == 2
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+
+def test_clear(tmp_path):
+    cache = LayoutResultCache(str(tmp_path / "layouts.sqlite"))
+    cache.put("a", LAYOUT_ITEMS)
+    cache.clear()
+    assert len(cache) == 0
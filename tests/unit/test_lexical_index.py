@@ -0,0 +1,58 @@
+from langchain_core.documents import Document
+
+from document_ai_agents.lexical_index import (
+    BM25Index,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+
+def make_index(contents: dict[str, str]) -> BM25Index:
+    index = BM25Index()
+    index.add(
+        list(contents), [Document(page_content=text) for text in contents.values()]
+    )
+    return index
+
+
+def test_tokenize_keeps_identifiers():
+    assert tokenize("M-RCNN scores 0.708") == [
+        "m-rcnn",
+        "m",
+        "rcnn",
+        "scores",
+        "0.708",
+        "0",
+        "708",
+    ]
+
+
+def test_bm25_ranks_rare_terms_first():
+    index = make_index(
+        {
+            "intro": "Layout detection of documents with deep learning models",
+            "table": "Table 2: macro average of M-RCNN fine tuned on PubLayNet",
+            "method": "We train detection models on documents",
+        }
+    )
+
+    results = index.search("M-RCNN macro average", k=2)
+    assert [id_ for id_, _ in results] == ["table"]
+    assert index.search("unknown words") == []
+
+
+def test_bm25_add_and_delete():
+    index = make_index({"a": "figure 3 shows results", "b": "figure 4 shows errors"})
+    index.delete(["a"])
+    assert "a" not in index
+    assert [id_ for id_, _ in index.search("figure 3")] == ["b"]
+
+    # Adding an existing id replaces its content
+    index.add(["b"], [Document(page_content="figure 5")])
+    assert index.search("errors") == []
+    assert len(index) == 1
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], rrf_k=60)
+    assert [id_ for id_, _ in fused] == ["a", "c", "b"]
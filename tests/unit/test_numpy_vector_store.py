@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from document_ai_agents.numpy_vector_store import (
+    NumpyVectorStore,
+    matches_where,
+    quantize,
+)
+
+
+class RandomEmbeddings(Embeddings):
+    """Deterministic pseudo-random vector per text."""
+
+    def embed_documents(self, texts):
+        return [
+            np.random.default_rng(abs(hash(text)) % 2**32).normal(size=32).tolist()
+            for text in texts
+        ]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_matches_where():
+    metadata = {"document_path": "a.pdf", "page_number": 3, "element_type": "Table"}
+    assert matches_where(metadata, None)
+    assert matches_where(metadata, {"document_path": "a.pdf"})
+    assert matches_where(
+        metadata,
+        {"$and": [{"page_number": {"$gte": 1}}, {"page_number": {"$lte": 3}}]},
+    )
+    assert not matches_where(metadata, {"element_type": {"$in": ["Figure"]}})
+    assert not matches_where({}, {"page_number": {"$gte": 1}})
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantize_keeps_directions(dtype):
+    vectors = np.random.default_rng(0).normal(size=(100, 64)).astype(np.float32)
+    rows, scales = quantize(vectors, dtype)
+    restored = rows.astype(np.float32) * scales[:, None]
+    cosine = np.sum(restored * vectors, axis=1) / (
+        np.linalg.norm(restored, axis=1) * np.linalg.norm(vectors, axis=1)
+    )
+    assert cosine.min() > 0.999
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_query_matches_exact_search(dtype):
+    embeddings = RandomEmbeddings()
+    texts = [f"text {i}" for i in range(200)]
+    store = NumpyVectorStore(embeddings, dtype=dtype)
+    store.add_texts(texts, [{"i": i} for i in range(200)], ids=texts)
+
+    vectors = np.asarray(embeddings.embed_documents(texts))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = embeddings.embed_documents(["q1", "q2"])
+    results = store.query(queries, n_results=5)
+    for query, ids in zip(queries, results["ids"]):
+        expected = np.argsort(-(vectors @ np.asarray(query)))[:5]
+        assert len(set(ids) & {texts[i] for i in expected}) >= 4
+
+    filtered = store.query(queries, n_results=5, where={"i": {"$lt": 3}})
+    assert all(set(ids) == {"text 0", "text 1", "text 2"} for ids in filtered["ids"])
+
+
+def test_persist_delete_and_reload(tmp_path):
+    store = NumpyVectorStore(RandomEmbeddings(), path=str(tmp_path), dtype="int8")
+    store.add_texts(["a", "b", "c"], ids=["a", "b", "c"])
+    store.delete(["b"])
+    store.add_texts(["c"], [{"edited": True}], ids=["c"])
+
+    store = NumpyVectorStore(RandomEmbeddings(), path=str(tmp_path))
+    assert store.dtype == "int8"
+    assert store.get() == {
+        "ids": ["a", "c"],
+        "documents": ["a", "c"],
+        "metadatas": [{}, {"edited": True}],
+    }
+    assert store.query(RandomEmbeddings().embed_documents(["a"]), 1)["ids"] == [["a"]]
+
+
+def test_rows_without_record_are_ignored(tmp_path):
+    store = NumpyVectorStore(RandomEmbeddings(), path=str(tmp_path))
+    store.add_texts(["a"], ids=["a"])
+    with open(tmp_path / "vectors.bin", "ab") as f:
+        f.write(b"\0" * 10)  # Crash while writing the next vectors
+
+    store = NumpyVectorStore(RandomEmbeddings(), path=str(tmp_path))
+    store.add_texts(["b"], ids=["b"])
+    store = NumpyVectorStore(RandomEmbeddings(), path=str(tmp_path))
+    assert store.query(RandomEmbeddings().embed_documents(["b"]), 1)["ids"] == [["b"]]
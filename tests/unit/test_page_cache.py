@@ -0,0 +1,66 @@
+import os
+from pathlib import Path
+
+from document_ai_agents.image_utils import JpegEncodingOptions
+from document_ai_agents.page_cache import (
+    PageImageCache,
+    hash_file,
+    iter_pdf_pages_as_jpeg,
+)
+
+
+def test_make_key_depends_on_settings():
+    key = PageImageCache.make_key("abc", 0, 200)
+    assert key == PageImageCache.make_key("abc", 0, 200, JpegEncodingOptions())
+    assert key != PageImageCache.make_key("abc", 1, 200)
+    assert key != PageImageCache.make_key("abc", 0, 100)
+    assert key != PageImageCache.make_key("abd", 0, 200)
+    assert key != PageImageCache.make_key(
+        "abc", 0, 200, JpegEncodingOptions(quality=90)
+    )
+    assert key != PageImageCache.make_key(
+        "abc", 0, 200, JpegEncodingOptions(max_bytes=100_000)
+    )
+
+
+def test_put_and_get(tmp_path):
+    cache = PageImageCache(cache_dir=str(tmp_path))
+    assert cache.get("missing") is None
+
+    cache.put("a" * 64, b"jpeg data")
+    assert cache.get("a" * 64) == b"jpeg data"
+    assert cache.size_bytes == len(b"jpeg data")
+
+    # Sizes are recomputed from disk when the cache is reopened
+    assert PageImageCache(cache_dir=str(tmp_path)).size_bytes == len(b"jpeg data")
+
+
+def test_lru_eviction(tmp_path):
+    cache = PageImageCache(cache_dir=str(tmp_path), max_size_bytes=25)
+    keys = [str(i) * 64 for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.put(key, b"x" * 10)
+        os.utime(cache._path(key), (i, i))
+
+    cache.get(keys[0])  # keys[1] becomes the least recently used entry
+    cache.put(keys[2], b"x" * 10)
+
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+    assert cache.size_bytes <= 25
+
+
+def test_iter_pdf_pages_as_jpeg_uses_cache(tmp_path):
+    pdf_file = str(Path(__file__).parents[2] / "data" / "docs.pdf")
+    cache = PageImageCache(cache_dir=str(tmp_path))
+
+    first_run = list(iter_pdf_pages_as_jpeg(pdf_file, cache=cache))
+    assert cache.size_bytes > 0
+
+    cache_files = {
+        key: cache.get(PageImageCache.make_key(hash_file(pdf_file), key, 200))
+        for key, _ in first_run
+    }
+    assert first_run == list(cache_files.items())
+    assert list(iter_pdf_pages_as_jpeg(pdf_file, cache=cache)) == first_run
@@ -0,0 +1,80 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from document_ai_agents.page_filters import (
+    average_hashes,
+    find_blank_pages,
+    find_duplicate_pages,
+    hamming_distances,
+    jpeg_to_thumbnail,
+)
+
+
+def make_page(seed: int, noise: float = 0.0) -> Image.Image:
+    """Creates a white page with random 'text lines' drawn on it."""
+    rng = np.random.default_rng(seed)
+    page = Image.new("L", (850, 1100), color=245)
+    draw = ImageDraw.Draw(page)
+    for y in range(80, 1000, 30):
+        x_end = int(rng.integers(200, 780))
+        draw.rectangle([70, y, x_end, y + 12], fill=20)
+    if noise:
+        pixels = np.asarray(page, dtype=np.float32)
+        pixels += np.random.default_rng(seed + 1).normal(0, noise, pixels.shape)
+        page = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return page
+
+
+def to_jpeg(image: Image.Image) -> bytes:
+    buffered = io.BytesIO()
+    image.convert("RGB").save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+
+@pytest.fixture
+def thumbnails():
+    pages = [
+        make_page(0),
+        Image.new("L", (850, 1100), color=250),  # Blank
+        make_page(1),
+        make_page(0, noise=3.0),  # Rescan of the first page
+        Image.new("L", (850, 1100), color=200),  # Blank gray paper
+        make_page(2),
+    ]
+    return np.stack([jpeg_to_thumbnail(to_jpeg(page)) for page in pages])
+
+
+def test_jpeg_to_thumbnail(thumbnails):
+    assert thumbnails.shape == (6, 128, 128)
+    assert thumbnails.dtype == np.uint8
+
+
+def test_find_blank_pages(thumbnails):
+    assert find_blank_pages(thumbnails).tolist() == [
+        False,
+        True,
+        False,
+        False,
+        True,
+        False,
+    ]
+
+
+def test_average_hashes(thumbnails):
+    hashes = average_hashes(thumbnails, hash_size=16)
+    assert hashes.shape == (6, 16 * 16 // 8)
+
+    distances = hamming_distances(hashes)
+    assert distances[0, 0] == 0
+    assert distances[0, 3] < distances[0, 2]
+
+
+def test_find_duplicate_pages(thumbnails):
+    non_blank = thumbnails[[0, 2, 3, 5]]
+    assert find_duplicate_pages(non_blank) == {2: 0}
+    # Documents where every page, or all but one, is blank
+    assert find_duplicate_pages(thumbnails[:0]) == {}
+    assert find_duplicate_pages(thumbnails[:1]) == {}
@@ -0,0 +1,63 @@
+from langchain_core.documents import Document
+
+from document_ai_agents.page_manifest import (
+    DocumentManifest,
+    ManifestStore,
+    PageRecord,
+    diff_pages,
+    manifest_deltas,
+)
+
+
+def make_record(page_number: int, fingerprint: str) -> PageRecord:
+    return PageRecord(
+        page_number=page_number,
+        fingerprint=fingerprint,
+        documents=[
+            Document(
+                page_content=f"Content {fingerprint}",
+                metadata={"page_number": page_number},
+            )
+        ],
+    )
+
+
+def test_diff_pages():
+    previous = DocumentManifest(
+        document_path="doc.pdf", pages=[make_record(0, "a"), make_record(1, "b")]
+    )
+    diff = diff_pages({0: "a", 1: "c", 2: "b"}, previous)
+    assert diff.changed_page_numbers == [1]
+    assert {
+        page_number: page.fingerprint for page_number, page in diff.reused_pages.items()
+    } == {0: "a", 2: "b"}
+
+
+def test_diff_pages_without_previous_version():
+    assert diff_pages({0: "a", 1: "b"}, None).changed_page_numbers == [0, 1]
+
+
+def test_manifest_deltas():
+    previous = DocumentManifest(
+        document_path="doc.pdf",
+        pages=[make_record(0, "a"), make_record(1, "b"), make_record(2, "c")],
+    )
+    current = DocumentManifest(
+        document_path="doc.pdf",
+        pages=[make_record(0, "a"), make_record(1, "d"), make_record(2, "b")],
+    )
+    added, removed = manifest_deltas(previous, current)
+    assert [doc.page_content for doc in added] == ["Content d", "Content b"]
+    assert [doc.page_content for doc in removed] == ["Content b", "Content c"]
+
+
+def test_manifest_store(tmp_path):
+    store = ManifestStore(str(tmp_path))
+    assert store.load("doc.pdf") is None
+
+    manifest = DocumentManifest(document_path="doc.pdf", pages=[make_record(0, "a")])
+    store.save(manifest)
+    assert store.load("doc.pdf") == manifest
+
+    store.delete("doc.pdf")
+    assert store.load("doc.pdf") is None
@@ -0,0 +1,88 @@
+import pytest
+
+from document_ai_agents.page_store import (
+    InMemoryPageStore,
+    MmapPageStore,
+    PageStore,
+    get_default_page_store,
+    make_page_key,
+)
+
+
+@pytest.fixture(params=["memory", "mmap"])
+def page_store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryPageStore()
+    return MmapPageStore(str(tmp_path / "pages.bin"))
+
+
+def test_put_and_get(page_store):
+    key = page_store.put(b"page 1")
+    assert key == make_page_key(b"page 1")
+    assert key in page_store
+    assert page_store.get(key) == b"page 1"
+    assert page_store.size(key) == len(b"page 1")
+    assert page_store.as_part(key) == {"mime_type": "image/jpeg", "data": b"page 1"}
+
+
+def test_identical_pages_are_stored_once(page_store):
+    keys = [page_store.put(data) for data in [b"a", b"b", b"a"]]
+    assert keys[0] == keys[2]
+    assert len(page_store) == 2
+    assert [page_store.get(key) for key in keys] == [b"a", b"b", b"a"]
+
+
+def test_missing_key(page_store):
+    assert "missing" not in page_store
+    with pytest.raises(KeyError):
+        page_store.get("missing")
+
+
+def test_mmap_store_reopens(tmp_path):
+    path = str(tmp_path / "pages.bin")
+    store = MmapPageStore(path)
+    keys = [store.put(bytes([i]) * 1000) for i in range(10)]
+    store.close()
+
+    store = MmapPageStore(path)
+    assert len(store) == 10
+    assert [store.get(key) for key in keys] == [bytes([i]) * 1000 for i in range(10)]
+
+    # Pages added after reopening are readable through the remapped file
+    key = store.put(b"new page")
+    assert store.get(key) == b"new page"
+    store.close()
+
+
+def test_default_page_store_is_shared():
+    assert get_default_page_store() is get_default_page_store()
+
+
+def test_incomplete_page_store_cannot_be_created():
+    class WriteOnlyPageStore(PageStore):
+        def put(self, data: bytes) -> str:
+            return make_page_key(data)
+
+    with pytest.raises(TypeError):
+        WriteOnlyPageStore()
+
+
+def test_in_memory_store_evicts_least_recently_used_pages():
+    store = InMemoryPageStore(max_bytes=3_000)
+    keys = [store.put(bytes([i]) * 1_000) for i in range(3)]
+    store.get(keys[0])
+    key = store.put(b"x" * 1_000)
+
+    assert keys[1] not in store
+    assert [k in store for k in [keys[0], keys[2], key]] == [True, True, True]
+    assert store.n_bytes == 3_000
+    assert store.n_evictions == 1
+
+    # A page larger than the budget is still stored, alone
+    large = store.put(b"y" * 10_000)
+    assert large in store and len(store) == 1
+
+
+def test_default_page_store_is_unbounded():
+    # A parse needs every page of its document until it ends
+    assert get_default_page_store().max_bytes is None
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from google.api_core.exceptions import InvalidArgument, ResourceExhausted
+
+from document_ai_agents.rate_limiter import (
+    RequestScheduler,
+    SchedulerOptions,
+    TokenBucket,
+    estimate_request_tokens,
+)
+
+
+def fast_scheduler(**kwargs) -> RequestScheduler:
+    return RequestScheduler(
+        SchedulerOptions(initial_backoff=0.001, max_backoff=0.01, **kwargs)
+    )
+
+
+def test_token_bucket_delays_once_empty():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(1, abs=0.05)
+    assert bucket.reserve() == pytest.approx(2, abs=0.05)
+
+
+def test_estimate_request_tokens():
+    assert estimate_request_tokens(text_chars=400, n_images=2) == 100 + 2 * 258
+
+
+def test_retries_rate_limit_errors():
+    scheduler = fast_scheduler(max_retries=3)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ResourceExhausted("quota")
+        return "ok"
+
+    assert scheduler.run(flaky) == "ok"
+    assert len(calls) == 3
+    assert scheduler.stats == {"requests": 3, "retries": 2, "failures": 0}
+
+
+def test_gives_up_after_max_retries():
+    scheduler = fast_scheduler(max_retries=2)
+
+    def always_limited():
+        raise ResourceExhausted("quota")
+
+    with pytest.raises(ResourceExhausted):
+        scheduler.run(always_limited)
+    assert scheduler.stats == {"requests": 3, "retries": 2, "failures": 1}
+
+
+def test_other_errors_are_not_retried():
+    scheduler = fast_scheduler()
+
+    def invalid():
+        raise InvalidArgument("bad request")
+
+    with pytest.raises(InvalidArgument):
+        scheduler.run(invalid)
+    assert scheduler.stats["requests"] == 1
+
+
+def test_max_in_flight():
+    scheduler = fast_scheduler(max_in_flight=2)
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def request():
+        with lock:
+            in_flight.append(1)
+            peak.append(len(in_flight))
+        time.sleep(0.02)
+        with lock:
+            in_flight.pop()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: scheduler.run(request), range(8)))
+
+    assert max(peak) == 2
+
+
+def test_async_retries_and_max_in_flight():
+    scheduler = fast_scheduler(max_in_flight=2)
+    in_flight = []
+    peak = []
+    failures = {"first": 1}
+
+    async def request(i):
+        in_flight.append(i)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(i)
+        if i == 0 and failures["first"]:
+            failures["first"] -= 1
+            raise ResourceExhausted("quota")
+        return i
+
+    async def run_all():
+        return await asyncio.gather(
+            *[scheduler.arun(lambda i=i: request(i)) for i in range(6)]
+        )
+
+    assert asyncio.run(run_all()) == list(range(6))
+    assert max(peak) == 2
+    assert scheduler.stats == {"requests": 7, "retries": 1, "failures": 0}
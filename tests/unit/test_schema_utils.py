@@ -55,3 +55,9 @@ def test_prepare_schema_for_gemini_basic():
     assert "$defs" not in schema
     assert "title" not in schema
     assert "default" not in schema
+
+
+def test_replace_value_in_dict_chained_references():
+    test_data = {"a": {"$ref": "#/definitions/x"}}
+    original_schema = {"definitions": {"x": {"y": {"$ref": "#/definitions/z"}}, "z": 3}}
+    assert replace_value_in_dict(test_data, original_schema) == {"a": {"y": 3}}